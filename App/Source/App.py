@@ -1,38 +1,216 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import signal
+import sys
 import threading
+import time
+from typing import Optional
 
+from Source.Log import LOGGER, start_logging
+from Source.Modbus.Gateway import Gateway
+from Source.Modbus.Metrics import Metrics
 from Source.Modbus.Modbus import *
-from Source.Storage.Database import Database
+from Source.Storage.Ingest import Ingest
+from Source.Storage.IngestServer import IngestServer
 from Source.Storage.Json import Json
+from Source.Storage.Mapped import Mapped
+from Source.Storage.Measured import Measured
+from Source.Storage.Memory import Memory
+from Source.Storage.Shared import Shared
+from Source.Storage.SnapshotServer import SnapshotServer
+from Source.Storage.Snapshots import Snapshots
+from Source.Storage.Units import Units
+from Source.Storage.Wal import Wal
 
 
-def main():
-    # Create the storage
-    if DB:
-        storage = Database(host=DB_HOST, user=DB_USER, password=DB_PASSWORD)
-    else:
-        storage = Json(JSON_PATH, JSON)
+def unit_path(path: str, unit: Optional[int]) -> str:
+    """
+    Function used to get the file of a unit identifier with its own bank, storage.json -> storage-17.json
+
+    :param path: the file of the default bank
+    :param unit: the unit identifier, None for the default bank
+    :return: the file
+    """
+
+    if unit is None:
+        return path
+
+    base, extension = os.path.splitext(path)
+
+    return f"{base}-{unit}{extension}"
+
+
+def create_storage(backend: str, unit: Optional[int] = None, metrics: Optional[Metrics] = None,
+                   snapshots: Optional[dict] = None):
+    """
+    Function used to create a storage, every unit identifier with its own bank has its own files (or database)
+
+    :param backend: "json", "database", "memory", "mapped", "shared" or "host:port" of a device for a gateway
+    :param unit: the unit identifier, None for the default bank
+    :param metrics: where the calls to the storage are timed, None to not time them
+    :param snapshots: where the snapshots of the bank are added (unit identifier -> Snapshots) if SNAPSHOT_PATH is
+                      set, None to not take them
+    :return: the storage
+    """
+
+    if ":" in backend:
+        host, port = backend.rsplit(":", 1)
+        return Gateway(host, int(port), GATEWAY_TIMEOUT)
+
+    start = time.perf_counter()
+    storage = open_storage(backend, unit)
+    elapsed = time.perf_counter() - start
+
+    LOGGER.info("[OPENED %s STORAGE FOR UNIT %s IN %.3f S]", backend, "*" if unit is None else unit, elapsed)
+
+    if metrics is not None:
+        metrics.operation("open", elapsed)
+        storage = Measured(storage, metrics)
+
+    if SNAPSHOT_PATH and snapshots is not None:
+        snapshots[unit] = Snapshots(storage, unit_path(SNAPSHOT_PATH, unit), SNAPSHOT_FULL_EVERY)
+
+    return storage
+
+
+def open_storage(backend: str, unit: Optional[int]):
+    """
+    Function used to open (or create) the storage of a unit identifier
+
+    :param backend: "json", "database", "memory", "mapped" or "shared"
+    :param unit: the unit identifier, None for the default bank
+    :return: the storage
+    """
+
+    if backend == "database":
+        # mysql is only imported when it is used
+        from Source.Storage.Database import Database
+
+        database = "ModbusTCP" if unit is None else f"ModbusTCP_{unit}"
+        return Database(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=database,
+                        pool_size=DB_POOL_SIZE, pool_timeout=DB_POOL_TIMEOUT)
+
+    path = unit_path(JSON_PATH, unit)
+
+    if backend == "memory":
+        return Memory(path, JSON, MEMORY_FLUSH_INTERVAL, MEMORY_FLUSH_THRESHOLD, MEMORY_PAGE_SIZE)
+
+    if backend == "mapped":
+        return Mapped(unit_path(MAPPED_PATH, unit), MAPPED)
+
+    if backend == "shared":
+        return Shared(unit_path(MAPPED_PATH, unit))
+
+    # The file of a new unit identifier doesn't exist yet
+    create = JSON or not os.path.exists(path)
+
+    if JSON_WAL:
+        wal = Wal(path + ".wal", JSON_WAL_SYNC_INTERVAL, JSON_WAL_SYNC_COUNT)
+        return Json(path, create, wal, JSON_WAL_COMPACT_SIZE)
 
-    modbus_tcp = Modbus(storage)
+    return Json(path, create)
 
-    modbus_tcp.bind(socket.gethostbyname(socket.gethostname()), 501)
-    modbus_tcp.listen(5)
 
-    print("[LISTENING]\n")
+def serve(units: Units, metrics: Metrics, snapshots: dict, worker: int) -> None:
+    """
+    Function used to accept and serve the clients, in the main process or in a worker process
+
+    :param units: the banks of the server
+    :param metrics: the metrics of the process
+    :param snapshots: unit identifier -> the snapshots of the bank, served on the snapshots endpoint
+    :param worker: the index of the worker process, the metrics of every worker are on their own port
+    :return: None
+    """
+
+    # A worker replaces the logging of the parent process, its thread was not forked
+    if SERVER_WORKERS > 1:
+        start_logging(LOG_LEVEL, LOG_QUEUE_SIZE)
+
+    modbus_tcp = Modbus(units, metrics)
+
+    if METRICS_PORT:
+        metrics.serve(METRICS_HOST, METRICS_PORT + worker)
+
+    # The banks of the workers are shared, a single process takes the snapshots and a single ingest writes them
+    if SNAPSHOT_PORT and worker == 0:
+        SnapshotServer(snapshots, SNAPSHOT_HOST, SNAPSHOT_PORT).serve()
+
+    if INGEST_PATH and worker == 0:
+        IngestServer(Ingest(units, metrics), INGEST_PATH).serve()
+
+    modbus_tcp.bind(socket.gethostbyname(socket.gethostname()), 501, reuse_port=SERVER_WORKERS > 1)
+    modbus_tcp.listen(SERVER_BACKLOG)
+
+    LOGGER.info("[LISTENING]")
+
+    if SERVER_MODE == "asyncio":
+        asyncio.run(modbus_tcp.serve())
+        return
 
     while True:
         try:
             connection, address = modbus_tcp.accept()
-            print(f"[CONNECTED TO {address[0]}]\n")
-        except Exception as e:
-            print(e)
-            print("Socket closed!")
+        except Exception:
+            LOGGER.exception("Socket closed!")
             break
 
+        # A refused client is closed here, it never costs a thread
+        key = modbus_tcp.admit(connection, address)
+
+        if key is None:
+            continue
+
         try:
-            threading.Thread(target=modbus_tcp.receive, args=(connection, address)).start()
-        except Exception as e:
-            print(e)
-            print(f"Error to make a connection to {address[0]}")
+            threading.Thread(target=modbus_tcp.receive, args=(connection, address, key)).start()
+        except Exception:
+            LOGGER.exception("Error to make a connection to %s", address[0])
+            modbus_tcp.release(connection, key)
+
+
+def main():
+    start_logging(LOG_LEVEL, LOG_QUEUE_SIZE)
+
+    # SIGTERM exits the same as a normal exit, the storages are saved and the shared memory is released (atexit)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    metrics = Metrics()
+
+    # Create the storage, the unit identifiers in UNITS get their own bank (and snapshots) on the first request
+    snapshots = {}
+    factory = functools.partial(create_storage, metrics=metrics, snapshots=snapshots)
+    units = Units(factory(STORAGE), factory, UNITS)
+
+    if SERVER_WORKERS <= 1:
+        serve(units, metrics, snapshots, 0)
+        return
+
+    # Every worker must see the same tables, the banks are created before the workers are forked
+    for backend in [STORAGE] + list(UNITS.values()):
+        if backend != "shared" and ":" not in backend:
+            raise ValueError(f"The {backend} storage can't be shared by the workers")
+
+    for unit in UNITS:
+        units.get(unit)
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=serve, args=(units, metrics, snapshots, i)) for i in range(SERVER_WORKERS)]
+
+    for worker in workers:
+        worker.start()
+
+    # The shared banks are saved at exit, after every worker stopped (also when the parent gets SIGTERM)
+    try:
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+        for worker in workers:
+            worker.join()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+import random
+import timeit
+
+from Source.Utils import *
+
+
+def legacy_bits_to_bytes(bits_param):
+    """
+    The bits_to_bytes used before the lookup tables, kept to measure against
+
+    :param bits_param: self explanatory
+    :return: self explanatory
+    """
+
+    pairs = []
+    result = []
+    byte = 0
+
+    for _ in range(int(len(bits_param) / 8)):
+        pairs.append(bits_param[byte:byte + 8][::-1])
+        byte = byte + 8
+
+    for i in pairs:
+        map_temp = map(int, i)
+        n = int(''.join(map(str, map_temp)), 2)
+        result.append(int('{:02x}'.format(n), 16))
+
+    return bytes(result)
+
+
+def legacy_bytes_to_bits(register):
+    """
+    The bytes_to_bits used before the lookup tables, kept to measure against
+
+    :param register: self explanatory
+    :return: self explanatory
+    """
+
+    string = list("{0:b}".format(register).zfill(8))
+    list_temp = []
+
+    for i in range(8):
+        list_temp.append(ord(string[i]) - ord('0'))
+
+    return list_temp[::-1]
+
+
+def legacy_registers(values: list) -> bytes:
+    """
+    The way the registers were encoded before, one int_to_bytes for every register
+
+    :param values: the registers
+    :return: the registers as bytes
+    """
+
+    result = b""
+
+    for i in range(len(values)):
+        result = result + int_to_bytes(0, values[i], 2)
+
+    return result
+
+
+def measure(name: str, legacy, current, number: int) -> None:
+    """
+    Function used to time the two versions and print the result
+
+    :param name: what is measured
+    :param legacy: the old version
+    :param current: the new version
+    :param number: how many times each version is called
+    :return: None
+    """
+
+    legacy_time = min(timeit.repeat(legacy, number=number, repeat=5)) / number
+    current_time = min(timeit.repeat(current, number=number, repeat=5)) / number
+
+    print(f"{name:<40} {legacy_time * 1e6:>10.2f} us {current_time * 1e6:>10.2f} us "
+          f"{legacy_time / current_time:>8.1f}x")
+
+
+def main():
+    # The largest quantities a request can have, FC 0x01/0x02 (249 bits), FC 0x0F and FC 0x03/0x04 (125 registers)
+    bits = [random.randint(0, 1) for _ in range(256)]
+    packed = pack_bits(bits)
+    registers = [random.randint(0, 0xFFFF) for _ in range(125)]
+    output = bytearray(260)
+
+    assert legacy_bits_to_bytes(bits) == pack_bits(bits)
+    assert [bit for byte in packed for bit in legacy_bytes_to_bits(byte)] == unpack_bits(packed, len(bits))
+    assert legacy_registers(registers) == output[0:pack_registers_into(registers, output, 0)]
+
+    print(f"{'':<40} {'legacy':>13} {'tables':>13} {'speedup':>9}")
+
+    measure("pack 256 bits (FC 0x01/0x02)",
+            lambda: legacy_bits_to_bytes(bits),
+            lambda: pack_bits(bits), 2000)
+
+    measure("unpack 32 bytes (FC 0x0F)",
+            lambda: [bit for byte in packed for bit in legacy_bytes_to_bits(byte)],
+            lambda: unpack_bits(packed, len(bits)), 2000)
+
+    measure("pack 125 registers (FC 0x03/0x04)",
+            lambda: legacy_registers(registers),
+            lambda: pack_registers_into(registers, output, 0), 2000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,426 @@
+import argparse
+import asyncio
+import functools
+import json
+import math
+import os
+import random
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+from Source.Config import *
+from Source.Modbus.Connections import Connections
+from Source.Modbus.Metrics import Metrics
+from Source.Modbus.Modbus import Modbus
+from Source.Storage.Json import Json
+from Source.Storage.Mapped import Mapped
+from Source.Storage.Memory import Memory
+from Source.Storage.Shared import Shared
+from Source.Storage.Units import Units
+from Source.Storage.Wal import Wal
+
+# MBAP header of a request: transaction identifier, protocol identifier, length, unit identifier, function code
+REQUEST = struct.Struct(">HHHBB")
+# Transaction identifier and length of a response
+RESPONSE = struct.Struct(">H2xH")
+
+# The first and the last address and the largest quantity of every function code
+FUNCTIONS = {
+    0x01: (COILS_ADDRESSES, 0xF9),
+    0x02: (DISCRETE_INPUTS_ADDRESSES, 0xF9),
+    0x03: (HOLDING_REGISTERS_ADDRESSES, 0x7D),
+    0x04: (INPUT_REGISTERS_ADDRESSES, 0x7D),
+    0x05: (COILS_ADDRESSES, 1),
+    0x06: (HOLDING_REGISTERS_ADDRESSES, 1),
+    0x0F: (COILS_ADDRESSES, 0xF9),
+    0x10: (HOLDING_REGISTERS_ADDRESSES, 0x7B),
+    0x16: (HOLDING_REGISTERS_ADDRESSES, 1),
+    0x17: (HOLDING_REGISTERS_ADDRESSES, 0x79),
+}
+
+# sqlite is the Database storage on an in-process SQLite file, database needs a MySQL server
+STORAGES = ("json", "wal", "memory", "mapped", "shared", "sqlite", "database")
+
+
+def parse_mix(mix: str) -> dict:
+    """
+    Function used to read the function codes and their weights, "3:60,6:20,16:20"
+
+    :param mix: function code:weight separated by commas, the function code in decimal or hex (0x10)
+    :return: function code -> weight
+    """
+
+    result = {}
+
+    for item in mix.split(","):
+        code, _, weight = item.partition(":")
+        code = int(code, 0)
+
+        if code not in FUNCTIONS:
+            raise ValueError(f"Function code {code:#04x} is not supported")
+
+        result[code] = float(weight or 1)
+
+    return result
+
+
+def build_pdu(code: int, quantity: int, rng: random.Random) -> bytes:
+    """
+    Function used to make a valid request (PDU without the function code) for a function code
+
+    :param code: the function code
+    :param quantity: the number of values read or written, limited by the function code and the address range
+    :param rng: the random generator of the client
+    :return: the DATA of the request
+    """
+
+    (first, last), maximum = FUNCTIONS[code]
+    quantity = max(1, min(quantity, maximum, last - first + 1))
+    address = rng.randint(first, last - quantity + 1)
+
+    if code in (0x01, 0x02, 0x03, 0x04):
+        return struct.pack(">HH", address, quantity)
+
+    if code == 0x05:
+        return struct.pack(">HH", address, rng.choice((0x0000, 0xFF00)))
+
+    if code == 0x06:
+        return struct.pack(">HH", address, rng.randint(0, 0xFFFF))
+
+    if code == 0x0F:
+        values = bytes(rng.randint(0, 0xFF) for _ in range((quantity + 7) // 8))
+        return struct.pack(">HHB", address, quantity, len(values)) + values
+
+    if code == 0x16:
+        return struct.pack(">HHH", address, rng.randint(0, 0xFFFF), rng.randint(0, 0xFFFF))
+
+    values = [rng.randint(0, 0xFFFF) for _ in range(quantity)]
+
+    # Reads the registers it writes
+    if code == 0x17:
+        return struct.pack(f">HHHHB{quantity}H", address, quantity, address, quantity, quantity * 2, *values)
+
+    return struct.pack(f">HHB{quantity}H", address, quantity, quantity * 2, *values)
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    Function used to get a percentile (nearest rank) of sorted values
+
+    :param values: the values, sorted
+    :param p: the percentile, 0 - 100
+    :return: the value
+    """
+
+    if not values:
+        return 0.0
+
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def create_storage(name: str, directory: str, options: argparse.Namespace):
+    """
+    Function used to create a new storage in a temporary directory (the database in its own schema)
+
+    :param name: one of STORAGES
+    :param directory: where the files are created
+    :param options: the command line options
+    :return: the storage
+    """
+
+    path = os.path.join(directory, f"{name}.json")
+
+    if name == "json":
+        return Json(path, True)
+
+    if name == "wal":
+        wal = Wal(path + ".wal", JSON_WAL_SYNC_INTERVAL, JSON_WAL_SYNC_COUNT)
+        return Json(path, True, wal, JSON_WAL_COMPACT_SIZE)
+
+    if name == "memory":
+        return Memory(path, True, MEMORY_FLUSH_INTERVAL, MEMORY_FLUSH_THRESHOLD, MEMORY_PAGE_SIZE)
+
+    if name == "mapped":
+        return Mapped(os.path.join(directory, "storage.bin"), True)
+
+    if name == "shared":
+        return Shared(os.path.join(directory, "shared.bin"))
+
+    from Source.Storage.Database import Database
+
+    if name == "sqlite":
+        from Source.Benchmark.Sqlite import Sqlite
+
+        return Database(host="", user="", password="", pool_size=max(DB_POOL_SIZE, options.clients),
+                        pool_timeout=DB_POOL_TIMEOUT, connect=functools.partial(Sqlite, path + ".db"))
+
+    # Needs a local MySQL (or MariaDB) server, the same as the one used by the server
+    return Database(host=options.db_host, user=options.db_user, password=options.db_password,
+                    pool_size=max(DB_POOL_SIZE, options.clients), pool_timeout=DB_POOL_TIMEOUT,
+                    database="ModbusTCP_benchmark")
+
+
+def start_server(storage, port: int, mode: str) -> Modbus:
+    """
+    Function used to start the server on localhost in background threads, the same way App.main does
+
+    :param storage: the storage of every unit identifier
+    :param port: the port of the server, 0 for any free port
+    :param mode: "threaded" or "asyncio"
+    :return: the server
+    """
+
+    # Every client is admitted and none is closed, the limits of the server would refuse the clients over them
+    metrics = Metrics()
+    modbus_tcp = Modbus(Units(storage, None, {}), metrics, Connections(0, 0, 0, 0, metrics))
+    modbus_tcp.bind("127.0.0.1", port)
+    modbus_tcp.listen(SERVER_BACKLOG)
+
+    if mode == "asyncio":
+        threading.Thread(target=asyncio.run, args=(modbus_tcp.serve(),), daemon=True).start()
+        return modbus_tcp
+
+    def accept():
+        while True:
+            try:
+                connection, address = modbus_tcp.accept()
+            except OSError:
+                break
+
+            key = modbus_tcp.admit(connection, address)
+
+            if key is not None:
+                threading.Thread(target=modbus_tcp.receive, args=(connection, address, key), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+
+    return modbus_tcp
+
+
+def receive_exactly(connection: socket.socket, size: int) -> bytes:
+    """
+    Function used to receive exactly size bytes
+
+    :param connection: the connection to the server
+    :param size: the number of bytes
+    :return: the bytes
+    """
+
+    message = b""
+
+    while len(message) < size:
+        chunk = connection.recv(size - len(message))
+
+        if not chunk:
+            raise ConnectionError("The server closed the connection")
+
+        message = message + chunk
+
+    return message
+
+
+def client(port: int, options: argparse.Namespace, mix: dict, seed: int, results: list, failed: list) -> None:
+    """
+    Function used by a client thread, sends options.requests requests in batches of options.depth (pipelining)
+    and measures the latency of every response from the moment its batch was sent
+
+    :param port: the port of the server
+    :param options: the command line options
+    :param mix: function code -> weight
+    :param seed: the seed of the random generator of the client
+    :param results: where the (function code, latency in seconds, exception) of every request are added
+    :param failed: where the number of requests without a response is added
+    :return: None
+    """
+
+    rng = random.Random(seed)
+    codes = list(mix)
+    weights = list(mix.values())
+    measured = []
+    sent = 0
+
+    try:
+        connection = socket.create_connection(("127.0.0.1", port))
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        failed.append(options.requests)
+        return
+
+    # The server may close the connection (an error in the storage), the requests left are counted as failed
+    try:
+        while sent < options.requests:
+            batch = min(options.depth, options.requests - sent)
+            pending = {}
+            message = bytearray()
+
+            for i in range(batch):
+                code = rng.choices(codes, weights)[0]
+                pdu = build_pdu(code, options.quantity, rng)
+                transaction = (sent + i) & 0xFFFF
+
+                message += REQUEST.pack(transaction, 0, len(pdu) + 2, options.unit, code) + pdu
+                pending[transaction] = code
+
+            start = time.perf_counter()
+            connection.sendall(message)
+
+            for _ in range(batch):
+                transaction, length = RESPONSE.unpack(receive_exactly(connection, 6))
+                body = receive_exactly(connection, length)
+                code = pending.pop(transaction)
+
+                measured.append((code, time.perf_counter() - start, body[1] & 0x80 != 0))
+
+            sent = sent + batch
+    except OSError:
+        failed.append(options.requests - len(measured))
+    finally:
+        connection.close()
+
+    results.extend(measured)
+
+
+def run(name: str, port: int, options: argparse.Namespace, mix: dict) -> dict:
+    """
+    Function used to benchmark one storage
+
+    :param name: one of STORAGES
+    :param port: the port of the server
+    :param options: the command line options
+    :param mix: function code -> weight
+    :return: the results, ready to be saved as json
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        storage = create_storage(name, directory, options)
+        opened = time.perf_counter() - start
+
+        modbus_tcp = start_server(storage, port, options.mode)
+        port = modbus_tcp.address()[1]
+
+        results = []
+        failed = []
+        threads = [threading.Thread(target=client, args=(port, options, mix, options.seed + i, results, failed))
+                   for i in range(options.clients)]
+
+        start = time.perf_counter()
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - start
+
+        if options.mode != "asyncio":
+            modbus_tcp.close()
+
+        # The tables written by the clients are reset, every table at once
+        start = time.perf_counter()
+
+        for reset in (storage.reset_coils, storage.reset_discrete_inputs, storage.reset_input_registers,
+                      storage.reset_holding_registers):
+            reset()
+
+        resetted = time.perf_counter() - start
+
+        # Saved before the directory is removed, nothing is left for the flush at exit
+        if hasattr(storage, "close"):
+            storage.close()
+        elif hasattr(storage, "flush"):
+            storage.flush()
+
+    functions = {}
+
+    for code in sorted(mix):
+        latencies = sorted(latency for fc, latency, _ in results if fc == code)
+        exceptions = sum(1 for fc, _, exception in results if fc == code and exception)
+
+        functions[f"{code:#04x}"] = {
+            "requests": len(latencies),
+            "exceptions": exceptions,
+            "p50_ms": percentile(latencies, 50) * 1e3,
+            "p95_ms": percentile(latencies, 95) * 1e3,
+            "p99_ms": percentile(latencies, 99) * 1e3,
+        }
+
+    return {
+        "storage": name,
+        "requests": len(results),
+        "failed": sum(failed),
+        "seconds": elapsed,
+        "throughput": len(results) / elapsed if elapsed else 0.0,
+        "open_ms": opened * 1e3,
+        "reset_ms": resetted * 1e3,
+        "functions": functions,
+    }
+
+
+def report(result: dict, out) -> None:
+    """
+    Function used to print the results of a storage
+
+    :param result: the results returned by run
+    :param out: where the results are printed
+    :return: None
+    """
+
+    print(f"{result['storage']}: {result['requests']} requests in {result['seconds']:.2f} s, "
+          f"{result['throughput']:.0f} requests/s, {result['failed']} failed, opened in {result['open_ms']:.1f} ms, "
+          f"reset in {result['reset_ms']:.1f} ms", file=out)
+    print(f"  {'FC':<6} {'requests':>9} {'exceptions':>11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}", file=out)
+
+    for code, values in result["functions"].items():
+        print(f"  {code:<6} {values['requests']:>9} {values['exceptions']:>11} {values['p50_ms']:>9.3f} "
+              f"{values['p95_ms']:>9.3f} {values['p99_ms']:>9.3f}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the Modbus TCP server on localhost")
+    parser.add_argument("--storage", default="json,memory,mapped",
+                        help=f"storages to benchmark separated by commas: {', '.join(STORAGES)} or all")
+    parser.add_argument("--mode", default=SERVER_MODE, choices=("threaded", "asyncio"))
+    parser.add_argument("--clients", type=int, default=8, help="concurrent connections")
+    parser.add_argument("--requests", type=int, default=1000, help="requests sent by every client")
+    parser.add_argument("--depth", type=int, default=1, help="requests sent at once before waiting (pipelining)")
+    parser.add_argument("--mix", default="1:10,2:10,3:30,4:20,5:5,6:10,15:5,16:10",
+                        help="function code:weight separated by commas")
+    parser.add_argument("--quantity", type=int, default=10, help="values read or written by a request")
+    parser.add_argument("--unit", type=int, default=1, help="unit identifier of the requests")
+    parser.add_argument("--port", type=int, default=0, help="first port, every storage uses the next one, 0 for any")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db-host", default=DB_HOST or "127.0.0.1")
+    parser.add_argument("--db-user", default=DB_USER)
+    parser.add_argument("--db-password", default=DB_PASSWORD)
+    parser.add_argument("--output", help="file where the results are saved as json")
+    options = parser.parse_args()
+
+    mix = parse_mix(options.mix)
+    names = STORAGES if options.storage == "all" else options.storage.split(",")
+    results = []
+
+    # The logging is not started, the server writes only its warnings and errors (stderr)
+    for i, name in enumerate(names):
+        try:
+            result = run(name, options.port + i if options.port else 0, options, mix)
+        except Exception as e:
+            # Missing driver, no server or a connection refused, the other storages still run
+            print(f"{name}: skipped, {type(e).__name__}: {e}")
+            continue
+
+        report(result, sys.stdout)
+        results.append(result)
+
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump({"options": vars(options), "results": results}, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
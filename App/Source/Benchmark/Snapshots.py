@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from Source.Config import *
+from Source.Storage.Memory import Memory
+from Source.Storage.Snapshots import Snapshots
+
+# The tables written between two snapshots: the method of the storage, offset, addresses and the biggest value
+TABLES = (
+    ("write_coils", COILS_OFFSET, COILS_ADDRESSES, 1),
+    ("write_discrete_inputs", DISCRETE_INPUTS_OFFSET, DISCRETE_INPUTS_ADDRESSES, 1),
+    ("write_input_registers", INPUT_REGISTERS_OFFSET, INPUT_REGISTERS_ADDRESSES, 0xFFFF),
+    ("write_holding_registers", HOLDING_REGISTERS_OFFSET, HOLDING_REGISTERS_ADDRESSES, 0xFFFF),
+)
+
+
+def write(storage, writes: int, rng: random.Random) -> None:
+    """
+    Function used to write single values at random addresses of every table
+
+    :param storage: the storage
+    :param writes: the number of values written
+    :param rng: the random generator
+    :return: None
+    """
+
+    for _ in range(writes):
+        method, offset, (first, last), maximum = rng.choice(TABLES)
+        getattr(storage, method)([rng.randint(0, maximum)], offset + rng.randint(first, last))
+
+
+def values(image: dict) -> dict:
+    """
+    Function used to drop the values that are 0 from an image, a snapshot may have them or not
+
+    :param image: table name -> {address: value}
+    :return: table name -> {address: value}, without the 0
+    """
+
+    return {name: {address: value for address, value in table.items() if value} for name, table in image.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Round trip and cost of the snapshots on the memory storage")
+    parser.add_argument("--snapshots", type=int, default=20, help="snapshots taken")
+    parser.add_argument("--writes", type=int, default=50, help="values written between two snapshots")
+    parser.add_argument("--full-every", type=int, default=5, help="deltas between two full snapshots")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    rng = random.Random(options.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage = Memory(os.path.join(directory, "memory.json"), True, MEMORY_FLUSH_INTERVAL, MEMORY_FLUSH_THRESHOLD,
+                         MEMORY_PAGE_SIZE)
+        snapshots = Snapshots(storage, os.path.join(directory, "snapshots"), options.full_every)
+
+        # The values of the storage when every snapshot was taken
+        expected = {}
+        full = []
+        deltas = []
+
+        for _ in range(options.snapshots):
+            write(storage, options.writes, rng)
+
+            start = time.perf_counter()
+            identifier = snapshots.take()
+            elapsed = time.perf_counter() - start
+
+            expected[identifier] = values(storage.image()[1])
+            (full if snapshots.snapshots()[-1]["full"] else deltas).append(elapsed)
+
+        for identifier, image in expected.items():
+            assert values(snapshots.image(identifier)) == image, f"snapshot {identifier} is not the one taken"
+
+        # The changes from the first snapshot are the ones written since
+        first = min(expected)
+        now = values(storage.image()[1])
+
+        for name, changes in snapshots.diff(first).items():
+            for address, (old, new) in changes.items():
+                assert expected[first][name].get(address, 0) == old and now[name].get(address, 0) == new
+
+        start = time.perf_counter()
+        written = snapshots.restore(first)
+        restored = time.perf_counter() - start
+
+        assert values(storage.image()[1]) == expected[first], "the restore didn't write back the first snapshot"
+        assert not any(snapshots.diff(first).values())
+
+        # A delta removed leaves a gap in the ids, the snapshots after it are still rebuilt and taken
+        snapshots.take()
+        previous = snapshots.snapshots()[-2]
+
+        if not previous["full"]:
+            os.remove(os.path.join(snapshots.path, f"{previous['id']:06d}.json"))
+
+        snapshots = Snapshots(storage, snapshots.path, options.full_every)
+        write(storage, options.writes, rng)
+        identifier = snapshots.take()
+
+        assert values(snapshots.image(identifier)) == values(storage.image()[1])
+
+        storage.flush()
+
+    print(f"{len(full)} full snapshots: {sum(full) / len(full) * 1e3:.3f} ms, {len(deltas)} deltas: "
+          f"{sum(deltas) / max(1, len(deltas)) * 1e3:.3f} ms, restore of {written} values: {restored * 1e3:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import sqlite3
+
+# The MySQL syntax used by the Database storage and the same in SQLite, the longer ones first
+STATEMENTS = (
+    ("%s", "?"),
+    ("ON DUPLICATE KEY UPDATE VALUE = VALUES(VALUE)", "ON CONFLICT(ID) DO UPDATE SET VALUE = excluded.VALUE"),
+    ("ON DUPLICATE KEY UPDATE", "ON CONFLICT(ID) DO UPDATE SET"),
+)
+
+
+class Sqlite:
+    def __init__(self, path: str, autocommit: bool = False, **config):
+        """
+        A connection to a SQLite file in place of a MySQL server, so the load benchmark runs the Database storage
+        without a server. It is its own cursor and a transaction takes the write lock with its first statement, so
+        the transactions run one at a time (a MySQL server locks only the rows)
+
+        :param path: the file of the database, shared by every connection
+        :param autocommit: True if every statement is committed on its own, outside of start_transaction
+        :param config: the MySQL settings (host, user, password, database), not used
+        """
+
+        self.__autocommit = autocommit
+        self.__connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.__connection.execute("PRAGMA journal_mode = WAL")
+        self.__cursor = self.__connection.cursor()
+
+    @staticmethod
+    def __translate(statement: str) -> str:
+        """
+        Function used to write a MySQL statement of the Database storage in SQLite
+
+        :param statement: the MySQL statement
+        :return: the SQLite statement
+        """
+
+        for mysql, sqlite in STATEMENTS:
+            statement = statement.replace(mysql, sqlite)
+
+        return statement
+
+    def __begin(self) -> None:
+        """
+        Function used to start a transaction before the first statement without autocommit, the same as the MySQL
+        connector
+
+        :return: None
+        """
+
+        if not self.__autocommit and not self.__connection.in_transaction:
+            self.start_transaction()
+
+    def start_transaction(self) -> None:
+        """
+        Function used to start a transaction, the next statements are committed together
+
+        :return: None
+        """
+
+        self.__cursor.execute("BEGIN IMMEDIATE")
+
+    def cursor(self):
+        """
+        Function used to get a cursor, the connection itself
+
+        :return: the connection
+        """
+
+        return self
+
+    def execute(self, statement: str, parameters: tuple = ()) -> None:
+        """
+        Function used to run a statement, there is a single database so CREATE DATABASE does nothing
+
+        :param statement: the MySQL statement
+        :param parameters: the values of the %s
+        :return: None
+        """
+
+        if statement.startswith("CREATE DATABASE"):
+            return
+
+        self.__begin()
+        self.__cursor.execute(self.__translate(statement), parameters)
+
+    def executemany(self, statement: str, rows: list) -> None:
+        """
+        Function used to run a statement for every row
+
+        :param statement: the MySQL statement
+        :param rows: the values of the %s for every row
+        :return: None
+        """
+
+        self.__begin()
+
+        # MySQL sends the rows as one statement, so they are written at once even with autocommit
+        if self.__connection.in_transaction:
+            self.__cursor.executemany(self.__translate(statement), rows)
+            return
+
+        self.start_transaction()
+        self.__cursor.executemany(self.__translate(statement), rows)
+        self.commit()
+
+    def fetchone(self):
+        """
+        Function used to get the next row of the last query
+
+        :return: the row, None if there are no more rows
+        """
+
+        return self.__cursor.fetchone()
+
+    def fetchall(self) -> list:
+        """
+        Function used to get the rows left of the last query
+
+        :return: the rows
+        """
+
+        return self.__cursor.fetchall()
+
+    def ping(self, reconnect: bool = True, attempts: int = 1, delay: int = 0) -> None:
+        """
+        Function used by the pool to check the connection, a file is always connected
+
+        :return: None
+        """
+
+    def commit(self) -> None:
+        """
+        Function used to end the transaction and keep its changes
+
+        :return: None
+        """
+
+        if self.__connection.in_transaction:
+            self.__cursor.execute("COMMIT")
+
+    def rollback(self) -> None:
+        """
+        Function used to end the transaction and drop its changes
+
+        :return: None
+        """
+
+        if self.__connection.in_transaction:
+            self.__cursor.execute("ROLLBACK")
+
+    def close(self) -> None:
+        """
+        Function used to close the connection, a transaction not committed is dropped the same as with MySQL
+
+        :return: None
+        """
+
+        self.rollback()
+        self.__connection.close()
@@ -1,20 +1,129 @@
 ILLEGAL_FUNCTION = 0x01
 ILLEGAL_DATA_ADDRESS = 0x02
 ILLEGAL_DATA_VALUE = 0x03
-SERVER_FAILURE = 0x04a
+SERVER_FAILURE = 0x04
 SERVER_BUSY = 0x06
+GATEWAY_PATH_UNAVAILABLE = 0x0A
+GATEWAY_TARGET_FAILED = 0x0B
 
 COILS_OFFSET = 0
 DISCRETE_INPUTS_OFFSET = 10000
 INPUT_REGISTERS_OFFSET = 30000
 HOLDING_REGISTERS_OFFSET = 40000
 
-# True for database, False for JSON
-DB = False
+# First and last address of every table, at most 0x0000 - 0xFFFF
+COILS_ADDRESSES = (0x0001, 0x00F9)
+DISCRETE_INPUTS_ADDRESSES = (0x0001, 0x00F9)
+INPUT_REGISTERS_ADDRESSES = (0x0001, 0x00F9)
+HOLDING_REGISTERS_ADDRESSES = (0x0001, 0x00F9)
+
+# Server mode: "threaded" (a thread for every client) or "asyncio" (every client on one event loop)
+SERVER_MODE = "threaded"
+
+# Processes accepting the clients on the same port, every process uses its own threads (or event loop). With more
+# than one every bank must be "shared" (or a gateway)
+SERVER_WORKERS = 1
+
+# Threads running the requests (threaded mode, only the blocking storages in asyncio mode), 0 runs them on the
+# thread of the client. A request waits for a thread in a queue of SERVER_QUEUE_SIZE requests for at most
+# SERVER_DEADLINE seconds, if the queue is full or the deadline passed the client gets Server Busy (0x06)
+SERVER_POOL_SIZE = 8
+SERVER_QUEUE_SIZE = 64
+SERVER_DEADLINE = 1
+
+# Clients waiting to be accepted by the system (listen backlog), the most clients connected at once and from the same
+# ip address (0 for no limit), a client over a limit is closed right away
+SERVER_BACKLOG = 128
+SERVER_MAX_CONNECTIONS = 256
+SERVER_MAX_CONNECTIONS_PER_IP = 32
+
+# Seconds a client can be silent between two requests and while sending the rest of a request before it is closed
+# (0 for no limit), and the TCP keepalive (idle seconds, seconds between the probes, probes) or None
+SERVER_IDLE_TIMEOUT = 300
+SERVER_READ_TIMEOUT = 10
+SERVER_KEEPALIVE = (60, 10, 3)
+
+# Bytes received at once from a client, a few ADUs (at most 260 bytes each)
+FRAME_BUFFER_SIZE = 4096
+
+# Lowest level logged: "DEBUG" (every request and response), "INFO" (connections), "WARNING", "ERROR". The logs
+# are written by a background thread, at most LOG_QUEUE_SIZE wait to be written and the next ones are dropped
+LOG_LEVEL = "INFO"
+LOG_QUEUE_SIZE = 10000
+# At DEBUG level only one request out of LOG_TRACE_SAMPLE of every connection is logged, at most LOG_TRACE_RATE every
+# second (0 for no limit)
+LOG_TRACE_SAMPLE = 1
+LOG_TRACE_RATE = 100
+
+# Locks of every table of the memory, json (with JSON_WAL), mapped and shared storages: the table is split in blocks
+# of LOCK_STRIPE_SIZE addresses (the page for the memory storage) and the block n uses the lock n % LOCK_STRIPES, so
+# reads and writes of different blocks don't wait for each other. A size that is not a multiple of 8 is rounded up,
+# the bits of the coils and the discrete inputs are packed 8 in a byte
+LOCK_STRIPES = 16
+LOCK_STRIPE_SIZE = 256
+
+# Local (unix) socket of the ingest, the feeders update the discrete inputs and the input registers through it, ""
+# disables it (only the first worker serves it)
+INGEST_PATH = ""
+# Seconds before the updates that the bank failed to write are written again, they stay queued meanwhile
+INGEST_RETRY_INTERVAL = 1
+
+# Snapshots of every bank in a directory (the one of a unit identifier with its own bank gets -N added), "" disables
+# them. A snapshot of the memory storage saves the values changed since the previous one and every SNAPSHOT_FULL_EVERY
+# snapshots all of them, the snapshots of the other storages save all of them
+SNAPSHOT_PATH = ""
+SNAPSHOT_FULL_EVERY = 10
+# Taken and restored on http://SNAPSHOT_HOST:SNAPSHOT_PORT/snapshots (only the first worker serves them), 0 disables
+# it. There is no authentication, keep it local
+SNAPSHOT_HOST = "127.0.0.1"
+SNAPSHOT_PORT = 0
+
+# Metrics of the server in the Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics, 0 disables it
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9501
+
+# Storage used by the server: "json", "database", "memory", "mapped" or "shared"
+STORAGE = "json"
+
+# Most responses to read requests (FC 0x01 - 0x04) kept in a cache, 0 disables it. Only for the memory storage, a
+# cached response is used until one of the values it has is written
+RESPONSE_CACHE_SIZE = 1024
+
+# Unit identifiers with their own bank, created on the first request: the storage ("json", "database", "memory",
+# "mapped") or "host:port" of a modbus tcp device the requests are forwarded to (gateway), {17: "memory"}.
+# Every other unit identifier uses the storage from STORAGE
+UNITS = {}
+# How long (seconds) the gateway waits for a device
+GATEWAY_TIMEOUT = 1
+
 DB_HOST = ""
 DB_USER = ""
 DB_PASSWORD = ""
+# Number of database connections shared by the clients and how long (seconds) a request waits for a free one
+DB_POOL_SIZE = 8
+DB_POOL_TIMEOUT = 5
+# A connection not used for this many seconds is checked (ping) before a request uses it, the others are used as they
+# are and checked only after an error
+DB_POOL_IDLE = 30
 
 # True will create the json file
 JSON = False
 JSON_PATH = r"../Resources/storage.json"
+
+# True writes every change to a log next to the json file instead of rewriting the file, the log is saved to disk
+# (fsync) every interval (seconds) or after a number of records and merged into the file when it gets too big (bytes)
+JSON_WAL = False
+JSON_WAL_SYNC_INTERVAL = 0.05
+JSON_WAL_SYNC_COUNT = 64
+JSON_WAL_COMPACT_SIZE = 1 << 20
+
+# Memory storage, the tables are saved to JSON_PATH every interval (seconds) or after a number of writes
+MEMORY_FLUSH_INTERVAL = 5
+MEMORY_FLUSH_THRESHOLD = 100
+# Addresses in a page of the memory storage, a page is allocated when one of its addresses is written
+MEMORY_PAGE_SIZE = 256
+
+# Mapped storage, binary file with the full address space of every table accessed with mmap, True will create it.
+# The shared storage keeps the tables in shared memory, loads them from this file at startup and saves them at exit
+MAPPED = False
+MAPPED_PATH = r"../Resources/storage.bin"
@@ -0,0 +1,83 @@
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# Everything logged by the server goes under this logger, the requests and responses under "modbus.trace"
+LOGGER = logging.getLogger("modbus")
+
+
+class LazyQueueHandler(QueueHandler):
+    def __init__(self, records: queue.Queue):
+        """
+        Puts the records in the queue as they are, the message is formatted by the background writer
+
+        :param records: the queue read by the listener
+        """
+
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Function used to prepare a record for the queue, the arguments must already be copies (nothing that changes
+        after the call) so nothing is formatted here
+
+        :param record: the record
+        :return: the record
+        """
+
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Function used to put a record in the queue, it is dropped if the writer can't keep up
+
+        :param record: the record
+        :return: None
+        """
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped = self.dropped + 1
+
+
+def start_logging(level: str, size: int) -> QueueListener:
+    """
+    Function used to send the logs of the server through a queue to a background thread that writes them to stdout
+
+    :param level: the lowest level written, "DEBUG" writes the requests and the responses
+    :param size: the most records waiting in the queue, the next ones are dropped
+    :return: the listener, stopped at exit
+    """
+
+    records = queue.Queue(size)
+
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+
+    # The handler of a parent process (its queue has no thread in a forked worker) is replaced
+    for handler in LOGGER.handlers[:]:
+        LOGGER.removeHandler(handler)
+
+    LOGGER.setLevel(level)
+    LOGGER.addHandler(LazyQueueHandler(records))
+    LOGGER.propagate = False
+
+    listener = QueueListener(records, writer)
+    listener.start()
+    atexit.register(listener.stop)
+
+    return listener
+
+
+def dropped_records() -> int:
+    """
+    Function used to get the number of records dropped because the queue was full, since logging was started
+
+    :return: the number of records
+    """
+
+    return sum(handler.dropped for handler in LOGGER.handlers if isinstance(handler, LazyQueueHandler))
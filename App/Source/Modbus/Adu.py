@@ -1,22 +1,30 @@
-from Source.Utils import bytes_to_word
+import struct
+
+# MBAP header and the function code: TI, PI, L, UI, FC
+MBAP = struct.Struct(">HHHBB")
+
+# The first two words of DATA, the starting address and the quantity (or the value for FC 0x05/0x06)
+WORDS = struct.Struct(">HH")
 
 
 class ADU:
-    def __init__(self, request):
-        self.TI = request[0:2]
-        self.PI = request[2:4]
-        self.L = request[4:6]
-        self.UI = request[6:7]
-        self.FC = request[7:8]
-        self.DATA = request[8:6 + bytes_to_word(self.L)]
-
-    def join(self) -> bytes:
+    __slots__ = ("TI", "PI", "L", "UI", "FC", "DATA", "ADDRESS", "QUANTITY")
+
+    def __init__(self, message: memoryview):
         """
-        Function used to make merge the ADU into a list of bytes
+        The ADU is a view over the message, nothing is copied
 
-        :return: self explanatory
+        :param message: a complete ADU, usually a part of the receive buffer
         """
-        return self.TI + self.PI + self.L + self.UI + self.FC + self.DATA
+
+        self.TI, self.PI, self.L, self.UI, self.FC = MBAP.unpack_from(message)
+        self.DATA = message[8:6 + self.L]
+
+        # Decoded once, every function code starts with them, None if the request is too short
+        if len(self.DATA) >= 4:
+            self.ADDRESS, self.QUANTITY = WORDS.unpack_from(self.DATA)
+        else:
+            self.ADDRESS, self.QUANTITY = None, None
 
     def print(self):
         """
@@ -25,16 +33,4 @@ class ADU:
         :return: self explanatory
         """
 
-        string = format(self.TI[0], '#04X')[2:] + \
-                 format(self.TI[1], '#04X')[2:] + " " + \
-                 format(self.PI[0], '#04X')[2:] + \
-                 format(self.PI[1], '#04X')[2:] + " " + \
-                 format(self.L[0], '#04X')[2:] + \
-                 format(self.L[1], '#04X')[2:] + " " + \
-                 format(self.UI[0], '#04X')[2:] + " " + \
-                 format(self.FC[0], '#04X')[2:] + " "
-
-        for i in range(len(self.DATA)):
-            string = string + format(self.DATA[i], '#04X')[2:]
-
-        return string
+        return f"{self.TI:04X} {self.PI:04X} {self.L:04X} {self.UI:02X} {self.FC:02X} {self.DATA.hex().upper()}"
@@ -0,0 +1,69 @@
+import struct
+import threading
+from collections import OrderedDict
+
+# Transaction identifier, the first field of the MBAP header
+TRANSACTION = struct.Struct(">H")
+
+
+class Cache:
+    def __init__(self, size: int):
+        """
+        The encoded responses of the last read requests, the least recently used one is removed when it is full
+
+        :param size: the most responses kept
+        """
+
+        self.__size = size
+        self.__responses = OrderedDict()
+        self.__lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, version: tuple, transaction: int, output: bytearray, offset: int) -> int:
+        """
+        Function used to write a cached response in the buffer, only if the values didn't change since it was cached
+
+        :param key: (unit identifier, function code, starting address, quantity)
+        :param version: the version of the values read by the request
+        :param transaction: the transaction identifier of the request
+        :param output: the buffer where the response is written
+        :param offset: where the response starts in the buffer
+        :return: the length of the response, 0 if it is not cached
+        """
+
+        with self.__lock:
+            entry = self.__responses.get(key)
+
+            if entry is None or entry[0] != version:
+                self.misses = self.misses + 1
+                return 0
+
+            self.__responses.move_to_end(key)
+            self.hits = self.hits + 1
+
+        response = entry[1]
+        output[offset:offset + len(response)] = response
+
+        # Everything else is the same for the same key
+        TRANSACTION.pack_into(output, offset, transaction)
+
+        return len(response)
+
+    def put(self, key: tuple, version: tuple, response: bytes) -> None:
+        """
+        Function used to cache a response
+
+        :param key: (unit identifier, function code, starting address, quantity)
+        :param version: the version of the values read before the response was made
+        :param response: the response (ADU)
+        :return: None
+        """
+
+        with self.__lock:
+            self.__responses[key] = (version, response)
+            self.__responses.move_to_end(key)
+
+            if len(self.__responses) > self.__size:
+                self.__responses.popitem(last=False)
@@ -0,0 +1,147 @@
+import itertools
+import threading
+import time
+from typing import Callable, Optional
+
+from Source.Log import LOGGER
+from Source.Modbus.Metrics import Metrics
+
+
+class Connections:
+    def __init__(self, limit: int, limit_per_ip: int, idle_timeout: float, read_timeout: float, metrics: Metrics):
+        """
+        The connected clients, a client is admitted only if there is a free slot and it is closed by a background
+        thread when it is silent for too long, so a dead client never keeps its slot
+
+        :param limit: the most clients at once, 0 for no limit
+        :param limit_per_ip: the most clients at once from the same ip address, 0 for no limit
+        :param idle_timeout: the most seconds a client waits between two requests, 0 for no limit
+        :param read_timeout: the most seconds to receive the rest of a request, 0 for no limit
+        :param metrics: where the refused and the closed clients are counted
+        """
+
+        self.__limit = limit
+        self.__limit_per_ip = limit_per_ip
+        self.__idle_timeout = idle_timeout
+        self.__read_timeout = read_timeout
+        self.__metrics = metrics
+
+        # key -> [ip, close, the last time something was received, True if a request is received in part]
+        self.__lock = threading.Lock()
+        self.__slots = {}
+        self.__per_ip = {}
+        self.__keys = itertools.count()
+
+        if idle_timeout > 0 or read_timeout > 0:
+            threading.Thread(target=self.__reap_loop, daemon=True).start()
+
+    def admit(self, ip: str, close: Callable) -> Optional[int]:
+        """
+        Function used to take a slot for a client
+
+        :param ip: the ip address of the client
+        :param close: closes the connection of the client, called by the background thread (thread safe)
+        :return: the key of the slot, None if the client is refused
+        """
+
+        with self.__lock:
+            if 0 < self.__limit <= len(self.__slots):
+                reason = "limit"
+            elif 0 < self.__limit_per_ip <= self.__per_ip.get(ip, 0):
+                reason = "ip"
+            else:
+                key = next(self.__keys)
+                self.__slots[key] = [ip, close, time.monotonic(), False]
+                self.__per_ip[ip] = self.__per_ip.get(ip, 0) + 1
+
+                return key
+
+        self.__metrics.refused(reason)
+        LOGGER.warning("[REFUSED %s, %s]", ip, reason)
+
+        return None
+
+    def received(self, key: int, partial: bool) -> None:
+        """
+        Function used to mark a client as active after something was received
+
+        :param key: the key of the slot
+        :param partial: True if a request was received in part, the rest must come before the read timeout
+        :return: None
+        """
+
+        slot = self.__slots.get(key)
+
+        if slot is not None:
+            slot[2] = time.monotonic()
+            slot[3] = partial
+
+    def release(self, key: int) -> None:
+        """
+        Function used to free the slot of a client after its connection was closed
+
+        :param key: the key of the slot
+        :return: None
+        """
+
+        with self.__lock:
+            slot = self.__slots.pop(key, None)
+
+            if slot is None:
+                return
+
+            count = self.__per_ip[slot[0]] - 1
+
+            if count:
+                self.__per_ip[slot[0]] = count
+            else:
+                del self.__per_ip[slot[0]]
+
+    def reap(self) -> int:
+        """
+        Function used to close the clients that were silent for too long, their slots are freed when their
+        connections end
+
+        :return: the number of clients closed
+        """
+
+        now = time.monotonic()
+        stale = []
+
+        with self.__lock:
+            for key, (ip, close, last, partial) in self.__slots.items():
+                timeout = self.__read_timeout if partial else self.__idle_timeout
+
+                if timeout > 0 and now - last > timeout:
+                    stale.append((ip, close, "read" if partial else "idle"))
+
+                    # Closed only once even if the connection takes a while to end
+                    self.__slots[key][2] = float("inf")
+
+        for ip, close, reason in stale:
+            self.__metrics.reaped(reason)
+            LOGGER.info("[CLOSED %s, %s timeout]", ip, reason)
+
+            try:
+                close()
+            except OSError:
+                pass
+
+        return len(stale)
+
+    def __reap_loop(self) -> None:
+        """
+        Function used by the background thread to close the silent clients, a few times for every timeout
+
+        :return: None
+        """
+
+        interval = min(timeout for timeout in (self.__idle_timeout, self.__read_timeout) if timeout > 0) / 4
+
+        while True:
+            time.sleep(min(interval, 1))
+
+            try:
+                self.reap()
+            except Exception:
+                LOGGER.exception("Error to close the silent clients")
@@ -0,0 +1,111 @@
+import struct
+
+# Protocol identifier and length from the MBAP header
+HEADER = struct.Struct(">2xHH")
+
+
+class Framer:
+    def __init__(self, size: int):
+        self.__buffer = bytearray(size)
+        self.__view = memoryview(self.__buffer)
+
+        # The responses are written here, it grows if the requests in the buffer need more
+        self.output = bytearray(size)
+
+        # Bytes between start and end were received but are not a complete ADU yet
+        self.__start = 0
+        self.__end = 0
+
+        # False after a header that is not modbus, the connection can't be trusted anymore
+        self.valid = True
+
+    def space(self) -> memoryview:
+        """
+        Function used to get the free part of the buffer, where the next bytes must be received (recv_into)
+
+        :return: the free part of the buffer
+        """
+
+        # Move the incomplete ADU to the beginning so there is always room for a full one (260 bytes)
+        if self.__start > 0:
+            remaining = self.__end - self.__start
+            self.__buffer[0:remaining] = self.__buffer[self.__start:self.__end]
+            self.__start = 0
+            self.__end = remaining
+
+        return self.__view[self.__end:]
+
+    def advance(self, count: int) -> None:
+        """
+        Function used to mark bytes written in the free part of the buffer as received
+
+        :param count: the number of bytes received
+        :return: None
+        """
+
+        self.__end = self.__end + count
+
+    def ready(self) -> bool:
+        """
+        Function used to know if frames has something to do, a complete ADU or a header that is not valid
+
+        :return: True if it has
+        """
+
+        if self.__end - self.__start < 8:
+            return False
+
+        protocol, length = HEADER.unpack_from(self.__buffer, self.__start)
+
+        return protocol != 0 or not 2 <= length <= 254 or self.__end - self.__start >= 6 + length
+
+    def partial(self) -> bool:
+        """
+        Function used to know if a part of an ADU is waiting for the rest
+
+        :return: True if it is
+        """
+
+        return self.__end > self.__start
+
+    def frames(self):
+        """
+        Function used to get every complete ADU from the buffer, split using the length from the MBAP header
+
+        :return: generator with the ADUs (memoryview)
+        """
+
+        # MBAP header (7 bytes) and the function code
+        while self.__end - self.__start >= 8:
+            protocol, length = HEADER.unpack_from(self.__buffer, self.__start)
+
+            # The protocol identifier is always 0, the length counts the UI, the FC and at most 252 bytes of data
+            if protocol != 0 or not 2 <= length <= 254:
+                self.valid = False
+                return
+
+            if self.__end - self.__start < 6 + length:
+                break
+
+            # A view, it is valid until the next call of space
+            frame = self.__view[self.__start:self.__start + 6 + length]
+            self.__start = self.__start + 6 + length
+
+            yield frame
+
+        if self.__start == self.__end:
+            self.__start = 0
+            self.__end = 0
+
+    def reserve(self, size: int) -> bytearray:
+        """
+        Function used to make sure the output buffer can hold at least size bytes
+
+        :param size: the number of bytes needed
+        :return: the output buffer
+        """
+
+        if len(self.output) < size:
+            self.output.extend(bytes(max(size, 2 * len(self.output)) - len(self.output)))
+
+        return self.output
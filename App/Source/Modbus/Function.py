@@ -0,0 +1,42 @@
+from typing import Callable, Optional
+
+
+class Function:
+    __slots__ = ("handler", "addresses", "quantity", "width", "counted", "values", "write", "version", "offset",
+                 "size")
+
+    def __init__(self, handler: Callable, addresses: tuple, quantity: Optional[tuple] = None, width: int = 16,
+                 counted: bool = False, values: Optional[frozenset] = None, write: Optional[tuple] = None,
+                 version: Optional[str] = None, offset: int = 0, size: Optional[int] = None):
+        """
+        Everything needed to validate and respond to a function code, built once
+
+        :param handler: the function that writes the response
+        :param addresses: the first and the last valid address
+        :param quantity: the minimum and the maximum quantity, None if the request has a value instead (FC 0x05/0x06)
+        :param width: the size in bits of a value, 1 for coils and discrete inputs, 16 for registers
+        :param counted: True if the request has a byte count followed by the values (FC 0x0F/0x10)
+        :param values: the only values accepted, None if every value is accepted
+        :param write: the minimum and the maximum quantity written if the request also has a write starting
+                      address, a write quantity and a byte count followed by the values (FC 0x17)
+        :param version: the method of the storage with the version of the values read, None if it writes
+        :param offset: the offset of the table, the storage address is the modbus address plus the offset
+        :param size: the bytes of the request before the values, by default the starting address, the quantity (or
+                     value) and the byte count if counted
+        """
+
+        self.handler = handler
+        self.addresses = addresses
+        self.quantity = quantity
+        self.width = width
+        self.counted = counted
+        self.values = values
+        self.write = write
+        self.version = version
+        self.offset = offset
+
+        # The starting address, the quantity (or value) and the byte count
+        if size is None:
+            size = 5 if counted else 4
+
+        self.size = size
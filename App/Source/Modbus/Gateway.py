@@ -0,0 +1,91 @@
+import socket
+import threading
+
+from Source.Config import *
+from Source.Modbus.Adu import ADU, MBAP
+from Source.Modbus.ModbusException import ModbusException
+from Source.Utils import bytes_to_word
+
+
+class Gateway:
+    # Every request waits for the device
+    BLOCKING = True
+
+    def __init__(self, host: str, port: int, timeout: float):
+        """
+        A modbus tcp device, the requests of its unit identifier are forwarded to it
+
+        :param host: the address of the device
+        :param port: the port of the device
+        :param timeout: how long (seconds) to wait for the device
+        """
+
+        self.__address = (host, port)
+        self.__timeout = timeout
+        self.__socket = None
+
+        # One request at a time on the connection, the responses come in the same order
+        self.__lock = threading.Lock()
+
+    def __receive(self, size: int) -> bytes:
+        """
+        Function used to receive exactly size bytes from the device
+
+        :param size: the number of bytes
+        :return: the bytes
+        """
+
+        message = b""
+
+        while len(message) < size:
+            chunk = self.__socket.recv(size - len(message))
+
+            if not chunk:
+                raise ConnectionError("The device closed the connection")
+
+            message = message + chunk
+
+        return message
+
+    def forward(self, request: ADU, output: bytearray, offset: int) -> int:
+        """
+        Function used to send the request to the device and write its response in the buffer, or the exception
+        response of the gateway if the device can't be reached (0x0A) or didn't respond (0x0B)
+
+        :param request: the request made by the client
+        :param output: the buffer where the response is written
+        :param offset: where the response starts in the buffer
+        :return: the length of the response
+        """
+
+        with self.__lock:
+            # The device can't be reached: Gateway Path Unavailable (0x0A)
+            try:
+                if self.__socket is None:
+                    self.__socket = socket.create_connection(self.__address, self.__timeout)
+            except OSError:
+                return ModbusException.respond(request, GATEWAY_PATH_UNAVAILABLE, output, offset)
+
+            # The device didn't respond in time or the response is not valid: Gateway Target Failed (0x0B)
+            try:
+                self.__socket.sendall(MBAP.pack(request.TI, request.PI, request.L, request.UI, request.FC) +
+                                      request.DATA)
+
+                header = self.__receive(6)
+                length = bytes_to_word(header[4:6])
+
+                # A response to another request (one that timed out) or something that is not modbus
+                if bytes_to_word(header[0:2]) != request.TI or not 2 <= length <= 254:
+                    raise ConnectionError("Invalid response from the device")
+
+                response = header + self.__receive(length)
+            except OSError:
+                if self.__socket is not None:
+                    self.__socket.close()
+                    self.__socket = None
+
+                return ModbusException.respond(request, GATEWAY_TARGET_FAILED, output, offset)
+
+        output[offset:offset + len(response)] = response
+
+        return len(response)
@@ -0,0 +1,45 @@
+import bisect
+
+# Upper bounds (seconds) of the buckets, from 50 us to 5 s
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        """
+        Durations counted in fixed buckets, the last one has everything slower than the last bound
+        """
+
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        """
+        Function used to count a duration, must be called with the lock of the metrics held
+
+        :param seconds: the duration
+        :return: None
+        """
+
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum = self.sum + seconds
+        self.count = self.count + 1
+
+    def snapshot(self) -> dict:
+        """
+        Function used to get a copy of the histogram, the buckets are cumulative (Prometheus)
+
+        :return: the buckets (upper bound -> count), the sum and the count
+        """
+
+        buckets = {}
+        total = 0
+
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            total = total + count
+            buckets[bound] = total
+
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
@@ -0,0 +1,327 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Source.Log import dropped_records
+from Source.Modbus.Histogram import Histogram
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Counters and latency histograms of the server, shared by every connection
+        """
+
+        self.__lock = threading.Lock()
+
+        self.__requests = {}
+        self.__exceptions = {}
+        self.__received = 0
+        self.__sent = 0
+        self.__connections = 0
+
+        # Requests waiting for a thread of the pool and the requests answered with Server Busy by reason
+        self.__queue_depth = 0
+        self.__queue_peak = 0
+        self.__rejected = {}
+
+        # Clients refused when they connected and clients closed because they were silent, by reason
+        self.__refused = {}
+        self.__reaped = {}
+
+        # Values received by the ingest and values written to the banks, less when the updates are merged
+        self.__ingest_received = 0
+        self.__ingest_written = 0
+
+        # Latency of the requests by function code, of the steps of a request and of the storage calls
+        self.__functions = {}
+        self.__phases = {}
+        self.__operations = {}
+
+    @staticmethod
+    def __observe(histograms: dict, label, seconds: float) -> None:
+        """
+        Function used to count a duration in the histogram of a label, must be called with the lock held
+
+        :param histograms: label -> histogram
+        :param label: the label, the histogram is created the first time
+        :param seconds: the duration
+        :return: None
+        """
+
+        histogram = histograms.get(label)
+
+        if histogram is None:
+            histogram = histograms[label] = Histogram()
+
+        histogram.observe(seconds)
+
+    def request(self, code: int, seconds: float) -> None:
+        """
+        Function used to count a request and how long it took, from the ADU to the response
+
+        :param code: the function code
+        :param seconds: the duration
+        :return: None
+        """
+
+        with self.__lock:
+            self.__requests[code] = self.__requests.get(code, 0) + 1
+            self.__observe(self.__functions, code, seconds)
+
+    def phase(self, name: str, seconds: float) -> None:
+        """
+        Function used to count how long a step of the requests took: "parse", "validate", "handle", "send"
+
+        :param name: the step
+        :param seconds: the duration
+        :return: None
+        """
+
+        with self.__lock:
+            self.__observe(self.__phases, name, seconds)
+
+    def operation(self, name: str, seconds: float) -> None:
+        """
+        Function used to count how long a call to the storage took
+
+        :param name: the method of the storage
+        :param seconds: the duration
+        :return: None
+        """
+
+        with self.__lock:
+            self.__observe(self.__operations, name, seconds)
+
+    def exception(self, code: int, exception: int) -> None:
+        """
+        Function used to count an exception response
+
+        :param code: the function code of the request
+        :param exception: the exception code
+        :return: None
+        """
+
+        with self.__lock:
+            self.__exceptions[(code, exception)] = self.__exceptions.get((code, exception), 0) + 1
+
+    def transferred(self, received: int, sent: int) -> None:
+        """
+        Function used to count the bytes received from and sent to the clients
+
+        :param received: the bytes received
+        :param sent: the bytes sent
+        :return: None
+        """
+
+        with self.__lock:
+            self.__received = self.__received + received
+            self.__sent = self.__sent + sent
+
+    def connected(self, change: int) -> None:
+        """
+        Function used to count the connections, +1 when a client connects and -1 when it disconnects
+
+        :param change: +1 or -1
+        :return: None
+        """
+
+        with self.__lock:
+            self.__connections = self.__connections + change
+
+    def queued(self, depth: int) -> None:
+        """
+        Function used to set the number of requests waiting for a thread of the pool
+
+        :param depth: the requests in the queue
+        :return: None
+        """
+
+        with self.__lock:
+            self.__queue_depth = depth
+            self.__queue_peak = max(self.__queue_peak, depth)
+
+    def rejected(self, reason: str) -> None:
+        """
+        Function used to count a request answered with Server Busy (0x06) without being run
+
+        :param reason: "queue" (the queue was full) or "deadline" (it waited too long)
+        :return: None
+        """
+
+        with self.__lock:
+            self.__rejected[reason] = self.__rejected.get(reason, 0) + 1
+
+    def refused(self, reason: str) -> None:
+        """
+        Function used to count a client refused when it connected
+
+        :param reason: "limit" (too many clients) or "ip" (too many clients from its ip address)
+        :return: None
+        """
+
+        with self.__lock:
+            self.__refused[reason] = self.__refused.get(reason, 0) + 1
+
+    def reaped(self, reason: str) -> None:
+        """
+        Function used to count a client closed because it was silent for too long
+
+        :param reason: "idle" (no request) or "read" (the rest of a request never came)
+        :return: None
+        """
+
+        with self.__lock:
+            self.__reaped[reason] = self.__reaped.get(reason, 0) + 1
+
+    def ingested(self, received: int, written: int) -> None:
+        """
+        Function used to count the values of the ingest
+
+        :param received: the values queued
+        :param written: the values written to a bank
+        :return: None
+        """
+
+        with self.__lock:
+            self.__ingest_received = self.__ingest_received + received
+            self.__ingest_written = self.__ingest_written + written
+
+    def snapshot(self) -> dict:
+        """
+        Function used to get a copy of every counter and histogram
+
+        :return: the metrics
+        """
+
+        with self.__lock:
+            return {
+                "requests": {f"{code:#04x}": count for code, count in self.__requests.items()},
+                "exceptions": {f"{code:#04x}/{exception:#04x}": count
+                               for (code, exception), count in self.__exceptions.items()},
+                "bytes_received": self.__received,
+                "bytes_sent": self.__sent,
+                "connections": self.__connections,
+                "queue_depth": self.__queue_depth,
+                "queue_peak": self.__queue_peak,
+                "rejected": dict(self.__rejected),
+                "refused": dict(self.__refused),
+                "reaped": dict(self.__reaped),
+                "ingest_received": self.__ingest_received,
+                "ingest_written": self.__ingest_written,
+                "log_dropped": dropped_records(),
+                "functions": {f"{code:#04x}": histogram.snapshot() for code, histogram in self.__functions.items()},
+                "phases": {name: histogram.snapshot() for name, histogram in self.__phases.items()},
+                "operations": {name: histogram.snapshot() for name, histogram in self.__operations.items()},
+            }
+
+    def export(self) -> str:
+        """
+        Function used to get the metrics in the Prometheus text format
+
+        :return: the metrics
+        """
+
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name: str, kind: str, description: str) -> None:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histograms(name: str, label: str, values: dict) -> None:
+            for value, histogram in sorted(values.items()):
+                for bound, count in histogram["buckets"].items():
+                    bound = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {count}')
+
+                lines.append(f'{name}_sum{{{label}="{value}"}} {histogram["sum"]}')
+                lines.append(f'{name}_count{{{label}="{value}"}} {histogram["count"]}')
+
+        metric("modbus_requests_total", "counter", "Requests by function code")
+        for code, count in sorted(snapshot["requests"].items()):
+            lines.append(f'modbus_requests_total{{function="{code}"}} {count}')
+
+        metric("modbus_exceptions_total", "counter", "Exception responses by function code and exception code")
+        for key, count in sorted(snapshot["exceptions"].items()):
+            code, exception = key.split("/")
+            lines.append(f'modbus_exceptions_total{{function="{code}",exception="{exception}"}} {count}')
+
+        metric("modbus_received_bytes_total", "counter", "Bytes received from the clients")
+        lines.append(f"modbus_received_bytes_total {snapshot['bytes_received']}")
+
+        metric("modbus_sent_bytes_total", "counter", "Bytes sent to the clients")
+        lines.append(f"modbus_sent_bytes_total {snapshot['bytes_sent']}")
+
+        metric("modbus_connections", "gauge", "Connected clients")
+        lines.append(f"modbus_connections {snapshot['connections']}")
+
+        metric("modbus_refused_total", "counter", "Clients refused when they connected by reason")
+        for reason, count in sorted(snapshot["refused"].items()):
+            lines.append(f'modbus_refused_total{{reason="{reason}"}} {count}')
+
+        metric("modbus_reaped_total", "counter", "Clients closed because they were silent by reason")
+        for reason, count in sorted(snapshot["reaped"].items()):
+            lines.append(f'modbus_reaped_total{{reason="{reason}"}} {count}')
+
+        metric("modbus_ingest_received_total", "counter", "Values received by the ingest")
+        lines.append(f"modbus_ingest_received_total {snapshot['ingest_received']}")
+
+        metric("modbus_ingest_written_total", "counter", "Values written by the ingest after merging the updates")
+        lines.append(f"modbus_ingest_written_total {snapshot['ingest_written']}")
+
+        metric("modbus_log_dropped_total", "counter", "Log records dropped because the writer couldn't keep up")
+        lines.append(f"modbus_log_dropped_total {snapshot['log_dropped']}")
+
+        metric("modbus_queue_depth", "gauge", "Requests waiting for a thread")
+        lines.append(f"modbus_queue_depth {snapshot['queue_depth']}")
+
+        metric("modbus_queue_peak", "gauge", "Most requests waiting for a thread at once")
+        lines.append(f"modbus_queue_peak {snapshot['queue_peak']}")
+
+        metric("modbus_rejected_total", "counter", "Requests answered with Server Busy by reason")
+        for reason, count in sorted(snapshot["rejected"].items()):
+            lines.append(f'modbus_rejected_total{{reason="{reason}"}} {count}')
+
+        metric("modbus_request_seconds", "histogram", "Latency of the requests by function code")
+        histograms("modbus_request_seconds", "function", snapshot["functions"])
+
+        metric("modbus_phase_seconds", "histogram", "Latency of the steps of a request")
+        histograms("modbus_phase_seconds", "phase", snapshot["phases"])
+
+        metric("modbus_storage_seconds", "histogram", "Latency of the storage calls")
+        histograms("modbus_storage_seconds", "operation", snapshot["operations"])
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host: str, port: int) -> ThreadingHTTPServer:
+        """
+        Function used to serve the metrics over http in a background thread, GET /metrics
+
+        :param host: the address of the endpoint
+        :param port: the port of the endpoint
+        :return: the http server
+        """
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.export().encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        return server
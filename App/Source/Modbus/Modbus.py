@@ -1,25 +1,83 @@
+import asyncio
 import socket
-
+import time
+from typing import Optional
+
+from Source.Modbus.Adu import MBAP, WORDS
+from Source.Modbus.Cache import Cache
+from Source.Modbus.Connections import Connections
+from Source.Modbus.Framer import Framer
+from Source.Modbus.Function import Function
+from Source.Modbus.Gateway import Gateway
+from Source.Modbus.Metrics import Metrics
+from Source.Modbus.Pool import Pool
+from Source.Modbus.Trace import Trace
 from Source.Modbus.ModbusException import *
-from Source.Storage.Database import Database
-from Source.Storage.Json import Json
+from Source.Storage.Units import Units
+from Source.Log import LOGGER
 from Source.Utils import *
 
 
 class Modbus:
-    def __init__(self, storage: (Json, Database)):
+    def __init__(self, units: Units, metrics: Optional[Metrics] = None, connections: Optional[Connections] = None):
         self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.__storage = storage
-
-    def bind(self, host: str, port: int) -> None:
+        self.__units = units
+
+        # Counters and latencies of the requests, metrics.snapshot() or the endpoint started by App
+        self.metrics = metrics if metrics is not None else Metrics()
+
+        # Everything needed to validate and respond to every function code, quantities from the specification
+        self.__functions = {
+            0x01: Function(self.__read_coil_status, COILS_ADDRESSES, quantity=(0x01, 0xF9), width=1,
+                           version="coils_version", offset=COILS_OFFSET),
+            0x02: Function(self.__read_discrete_inputs, DISCRETE_INPUTS_ADDRESSES, quantity=(0x01, 0xF9), width=1,
+                           version="discrete_inputs_version", offset=DISCRETE_INPUTS_OFFSET),
+            0x03: Function(self.__read_holding_registers, HOLDING_REGISTERS_ADDRESSES, quantity=(0x01, 0x7D),
+                           version="holding_registers_version", offset=HOLDING_REGISTERS_OFFSET),
+            0x04: Function(self.__read_input_registers, INPUT_REGISTERS_ADDRESSES, quantity=(0x01, 0x7D),
+                           version="input_registers_version", offset=INPUT_REGISTERS_OFFSET),
+            0x05: Function(self.__force_single_coil, COILS_ADDRESSES, values=frozenset([0x0000, 0xFF00])),
+            0x06: Function(self.__write_single_register, HOLDING_REGISTERS_ADDRESSES),
+            0x0F: Function(self.__force_multiple_coils, COILS_ADDRESSES, quantity=(0x01, 0xF9), width=1,
+                           counted=True),
+            0x10: Function(self.__write_multiple_registers, HOLDING_REGISTERS_ADDRESSES, quantity=(0x01, 0x7B),
+                           counted=True),
+            0x16: Function(self.__mask_write_register, HOLDING_REGISTERS_ADDRESSES, size=6),
+            0x17: Function(self.__read_write_multiple_registers, HOLDING_REGISTERS_ADDRESSES, quantity=(0x01, 0x7D),
+                           write=(0x01, 0x79), size=9),
+        }
+
+        # Responses to the read requests, only for the storages that have versions (memory)
+        self.__cache = Cache(RESPONSE_CACHE_SIZE) if RESPONSE_CACHE_SIZE > 0 else None
+
+        # Storage -> {function code: the version method or None}, looked up once for every bank
+        self.__versions = {}
+
+        # Runs the requests, a burst of clients waits in its queue or gets Server Busy
+        self.__pool = Pool(SERVER_POOL_SIZE, SERVER_QUEUE_SIZE, SERVER_DEADLINE, self.metrics) \
+            if SERVER_POOL_SIZE > 0 else None
+
+        # Slots of the clients, the silent ones are closed in the background
+        if connections is None:
+            connections = Connections(SERVER_MAX_CONNECTIONS, SERVER_MAX_CONNECTIONS_PER_IP, SERVER_IDLE_TIMEOUT,
+                                      SERVER_READ_TIMEOUT, self.metrics)
+
+        self.__connections = connections
+
+    def bind(self, host: str, port: int, reuse_port: bool = False) -> None:
         """
         Function used to call bind function from the socket
 
         :param host: self explanatory
         :param port: self explanatory
+        :param reuse_port: True if other processes accept on the same port (SO_REUSEPORT), the system spreads the
+                           connections between them
         :return: None
         """
 
+        if reuse_port:
+            self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
         self.__socket.bind((host, port))
 
     def listen(self, dimension: int) -> None:
@@ -32,6 +90,35 @@ class Modbus:
 
         self.__socket.listen(dimension)
 
+    def address(self) -> tuple:
+        """
+        Function used to get the address the socket is bound to, the port chosen by the system if it was 0
+
+        :return: the host and the port
+        """
+
+        return self.__socket.getsockname()
+
+    @staticmethod
+    def keepalive(connection) -> None:
+        """
+        Function used to turn on the TCP keepalive of a connection (SERVER_KEEPALIVE), a client that disappeared
+        without closing the connection is found by the system
+
+        :param connection: the socket of the client
+        :return: None
+        """
+
+        if not SERVER_KEEPALIVE:
+            return
+
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        # Not every system has them
+        for option, value in zip(("TCP_KEEPIDLE", "TCP_KEEPINTVL", "TCP_KEEPCNT"), SERVER_KEEPALIVE):
+            if hasattr(socket, option):
+                connection.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
     def accept(self) -> socket:
         """
         Function used to call accept function from the socket
@@ -50,325 +137,600 @@ class Modbus:
 
         self.__socket.close()
 
-    def receive(self, connection: socket, address: any) -> None:
+    def admit(self, connection: socket, address: any) -> Optional[int]:
+        """
+        Function used to take a slot for a client right after it was accepted, before a thread is started for it,
+        a refused client is closed
+
+        :param connection: the connection the "client"
+        :param address: ip address of the client and the port, tuple usually
+        :return: the key of the slot for receive, None if the client was refused
+        """
+
+        # The background thread closes a silent client, recv returns as if the client closed the connection
+        key = self.__connections.admit(address[0], lambda: connection.shutdown(socket.SHUT_RDWR))
+
+        if key is None:
+            connection.close()
+
+        return key
+
+    def release(self, connection: socket, key: int) -> None:
         """
-        Function used to receive a message from another socket using the given connection
+        Function used to close an admitted client that will not be served (its thread couldn't be started) and free
+        its slot
+
+        :param connection: the connection the "client"
+        :param key: the slot of the client, from admit
+        :return: None
+        """
+
+        self.__connections.release(key)
+        connection.close()
+
+    def receive(self, connection: socket, address: any, key: int) -> None:
+        """
+        Function used to receive the messages from another socket using the given connection, a message can hold
+        more than one ADU or only a part of one
 
         :param connection: the connection the "client"
         :param address: ip address of the client and the port, tuple usually
+        :param key: the slot of the client, from admit
         :return: None
         """
+
+        self.keepalive(connection)
+        self.metrics.connected(1)
+        LOGGER.info("[CONNECTED BY %s]", address[0])
+
         with connection:
+            framer = Framer(FRAME_BUFFER_SIZE)
+            trace = Trace(address, LOG_TRACE_SAMPLE, LOG_TRACE_RATE)
+
+            try:
+                while True:
+                    received = connection.recv_into(framer.space())
+
+                    if received == 0:
+                        LOGGER.info("[DISCONNECTED FROM %s]", address[0])
+                        break
+
+                    framer.advance(received)
+
+                    # Send the responses of every complete request at once
+                    if self.__pool is not None and framer.ready():
+                        size = self.__pool.run(self.__handle, framer, trace)
+
+                        if size is None:
+                            size = self.__reject(framer)
+                    else:
+                        size = self.__handle(framer, trace)
+
+                    if size:
+                        start = time.perf_counter()
+
+                        with memoryview(framer.output) as output:
+                            connection.sendall(output[0:size])
+
+                        self.metrics.phase("send", time.perf_counter() - start)
+
+                    self.metrics.transferred(received, size)
+
+                    if not framer.valid:
+                        LOGGER.warning("[INVALID MESSAGE FROM %s]", address[0])
+                        break
+
+                    self.__connections.received(key, framer.partial())
+            except ConnectionError:
+                LOGGER.info("[DISCONNECTED FROM %s]", address[0])
+            finally:
+                self.__connections.release(key)
+                self.metrics.connected(-1)
+
+            # Close the connection after the message has been sent
+            connection.close()
+
+    async def receive_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Function used to receive the messages of a client in asyncio mode, same as receive
+
+        :param reader: the stream used to read from the client
+        :param writer: the stream used to write to the client
+        :return: None
+        """
+
+        address = writer.get_extra_info("peername")
+        loop = asyncio.get_running_loop()
+
+        # No thread is started for a client in asyncio mode, it is admitted here before anything is read
+        # The background thread closes a silent client, read returns as if the client closed the connection
+        key = self.__connections.admit(address[0], lambda: loop.call_soon_threadsafe(writer.transport.abort))
+
+        if key is None:
+            writer.close()
+            return
+
+        self.keepalive(writer.get_extra_info("socket"))
+        framer = Framer(FRAME_BUFFER_SIZE)
+        trace = Trace(address, LOG_TRACE_SAMPLE, LOG_TRACE_RATE)
+        self.metrics.connected(1)
+        LOGGER.info("[CONNECTED BY %s]", address[0])
+
+        try:
             while True:
-                message = connection.recv(1024)
+                space = framer.space()
+                message = await reader.read(len(space))
 
                 if not message:
-                    print(f"[DISCONNECTED FROM {address[0]}]\n")
+                    LOGGER.info("[DISCONNECTED FROM %s]", address[0])
                     break
+
+                space[0:len(message)] = message
+                framer.advance(len(message))
+
+                # A blocking storage would stop the event loop so the requests are handled in the pool (or the
+                # executor)
+                if self.__units.BLOCKING and self.__pool is not None and framer.ready():
+                    size = await self.__pool.run_async(self.__handle, framer, trace)
+
+                    if size is None:
+                        size = self.__reject(framer)
+                elif self.__units.BLOCKING:
+                    size = await loop.run_in_executor(None, self.__handle, framer, trace)
                 else:
-                    print(f"[CONNECTED BY {address[0]}]\n")
+                    size = self.__handle(framer, trace)
 
-                # Create the request message
-                request = ADU(message)
+                # The transport may keep what it can't send yet, so it gets a copy of the output buffer
+                if size:
+                    start = time.perf_counter()
+                    writer.write(framer.output[0:size])
+                    await writer.drain()
+                    self.metrics.phase("send", time.perf_counter() - start)
 
-                # Generate a response
-                print(f"<<< [{address[0]}]  {request.print()}")
-                respond = self.__respond(request)
+                self.metrics.transferred(len(message), size)
 
-                # Send the response
-                print(f">>> [{address[0]}]  {respond.print()}\n")
-                connection.sendall(respond.join())
+                if not framer.valid:
+                    LOGGER.warning("[INVALID MESSAGE FROM %s]", address[0])
+                    break
 
-            # Close the connection after the message has been sent
-            connection.close()
+                self.__connections.received(key, framer.partial())
+        except ConnectionError:
+            LOGGER.info("[DISCONNECTED FROM %s]", address[0])
+        finally:
+            self.__connections.release(key)
+            self.metrics.connected(-1)
+            writer.close()
+
+    def __handle(self, framer: Framer, trace: Trace) -> int:
+        """
+        Function used to respond to every complete request received by the framer, the responses are written one
+        after another in the output buffer of the framer
+
+        :param framer: the framer of the connection
+        :param trace: decides which requests of the connection are logged
+        :return: the number of bytes written in the output buffer
+        """
+
+        offset = 0
+        metrics = self.metrics
+
+        for message in framer.frames():
+            # Create the request message
+            start = time.perf_counter()
+            request = ADU(message)
+            metrics.phase("parse", time.perf_counter() - start)
+
+            # Only a flag check when the requests are not logged
+            traced = trace.enabled and trace.sampled()
+
+            if traced:
+                trace.request(message)
 
-    def __read_coil_status(self, request: ADU) -> ADU:
+            # Generate a response, an ADU is at most 260 bytes
+            output = framer.reserve(offset + 260)
+
+            start = time.perf_counter()
+            size = self.__respond(request, output, offset)
+            metrics.request(request.FC, time.perf_counter() - start)
+
+            if traced:
+                with memoryview(output) as view:
+                    trace.response(view[offset:offset + size])
+
+            offset = offset + size
+
+        return offset
+
+    def __reject(self, framer: Framer) -> int:
+        """
+        Function used to respond with Server Busy (0x06) to every complete request received by the framer, when
+        the pool couldn't run them
+
+        :param framer: the framer of the connection
+        :return: the number of bytes written in the output buffer
+        """
+
+        offset = 0
+
+        for message in framer.frames():
+            request = ADU(message)
+            output = framer.reserve(offset + EXCEPTION.size)
+
+            self.metrics.exception(request.FC, SERVER_BUSY)
+            offset = offset + ModbusException.respond(request, SERVER_BUSY, output, offset)
+
+        return offset
+
+    async def serve(self) -> None:
+        """
+        Function used to serve the clients on a single event loop using the bound and listening socket
+
+        :return: None
+        """
+
+        server = await asyncio.start_server(self.receive_async, sock=self.__socket)
+
+        async with server:
+            await server.serve_forever()
+
+    def __read_coil_status(self, storage, request: ADU, output: bytearray, offset: int) -> int:
         """
         Function used to read multiple coils
 
+        :param storage: the storage of the unit identifier
         :param request: the request to be processed
-        :return: the response made from the request with DATA and L modified
+        :param output: the buffer where the response is written
+        :param offset: where the DATA of the response starts in the buffer
+        :return: the length of the DATA
         """
 
-        response = copy.deepcopy(request)
-
         # Get the starting address (first coil)
-        start_address = bytes_to_word(request.DATA[0:2])
+        start_address = request.ADDRESS
 
         # Get the number of coils to be read
-        number_of_coils = bytes_to_word(request.DATA[2:4])
+        number_of_coils = request.QUANTITY
 
         first_coil = start_address + COILS_OFFSET
-        last_coil = first_coil + number_of_coils
 
-        coils = []
+        coils = storage.read_coils(first_coil, number_of_coils)
 
-        for i in range(first_coil, last_coil):
-            coils.append(self.__storage.read_coil(i))
+        # A coil is sized 1 bit, 8 coils in a byte and the last byte is filled with 0s
+        result = pack_bits(coils)
 
-        # Add 0s so it can be divided by 8 (1 byte)
-        for _ in range(8 - (len(coils) % 8)):
-            coils.append(0)
+        output[offset] = len(result)
+        output[offset + 1:offset + 1 + len(result)] = result
 
-        # Add the length of the response (coils)
-        result = bytes([int(len(coils) / 8)])
+        return 1 + len(result)
 
-        # A coil is sizes 1 bit and will convert then to 1 byte
-        result = result + bits_to_bytes(coils)
-
-        response.L = int_to_bytes(2, len(result), 2)
-        response.DATA = result
-
-        return response
-
-    def __read_discrete_inputs(self, request: ADU) -> ADU:
+    def __read_discrete_inputs(self, storage, request: ADU, output: bytearray, offset: int) -> int:
         """
         Function used to read multiple discrete inputs
 
+        :param storage: the storage of the unit identifier
         :param request: the request to be processed
-        :return: the response made from the request with DATA and L modified
+        :param output: the buffer where the response is written
+        :param offset: where the DATA of the response starts in the buffer
+        :return: the length of the DATA
         """
 
-        response = copy.deepcopy(request)
-
         # Get the starting address (first discrete input)
-        start_address = bytes_to_word(request.DATA[0:2])
+        start_address = request.ADDRESS
 
         # Get the number of discrete inputs to be read
-        number_of_di = bytes_to_word(request.DATA[2:4])
+        number_of_di = request.QUANTITY
 
         first_di = start_address + DISCRETE_INPUTS_OFFSET
-        last_di = first_di + number_of_di
-
-        discrete_inputs = []
 
-        for i in range(first_di, last_di):
-            discrete_inputs.append(self.__storage.read_discrete_input(i))
+        discrete_inputs = storage.read_discrete_inputs(first_di, number_of_di)
 
-        # Add 0s so it can be divided by 8 (1 byte)
-        for _ in range(8 - (len(discrete_inputs) % 8)):
-            discrete_inputs.append(0)
+        # A discrete input is sized 1 bit, 8 discrete inputs in a byte and the last byte is filled with 0s
+        result = pack_bits(discrete_inputs)
 
-        # Add the length of the response (discrete inputs)
-        result = bytes([int(len(discrete_inputs) / 8)])
+        output[offset] = len(result)
+        output[offset + 1:offset + 1 + len(result)] = result
 
-        # A discrete inputs is sizes 1 bit and will convert then to 1 byte
-        result = result + bits_to_bytes(discrete_inputs)
+        return 1 + len(result)
 
-        response.L = int_to_bytes(2, len(result), 2)
-        response.DATA = result
-
-        return response
-
-    def __read_holding_registers(self, request: ADU) -> ADU:
+    def __read_holding_registers(self, storage, request: ADU, output: bytearray, offset: int) -> int:
         """
         Function used to read multiple holding registers
 
+        :param storage: the storage of the unit identifier
         :param request: the request to be processed
-        :return: the response made from the request with DATA and L modified
+        :param output: the buffer where the response is written
+        :param offset: where the DATA of the response starts in the buffer
+        :return: the length of the DATA
         """
 
-        response = copy.deepcopy(request)
-
         # Get the starting address (first holding register)
-        start_address = bytes_to_word(request.DATA[0:2])
+        start_address = request.ADDRESS
 
         # Get the number of holding register to be read
-        number_of_hr = bytes_to_word(request.DATA[2:4])
+        number_of_hr = request.QUANTITY
 
         first_hr = start_address + HOLDING_REGISTERS_OFFSET
-        last_hr = first_hr + number_of_hr
-
-        result = bytes([number_of_hr * 2])
-
-        holding_registers = []
 
-        for i in range(first_hr, last_hr):
-            holding_registers.append(self.__storage.read_holding_register(i))
+        holding_registers = storage.read_holding_registers(first_hr, number_of_hr)
 
-        for i in range(len(holding_registers)):
-            result = result + int_to_bytes(0, holding_registers[i], 2)
+        # The length of the response and every register on 2 bytes, big endian
+        output[offset] = pack_registers_into(holding_registers, output, offset + 1)
 
-        response.L = int_to_bytes(2, len(result), 2)
-        response.DATA = result
+        return 1 + output[offset]
 
-        return response
-
-    def __read_input_registers(self, request: ADU) -> ADU:
+    def __read_input_registers(self, storage, request: ADU, output: bytearray, offset: int) -> int:
         """
-        Function used to write multiple input registers
+        Function used to read multiple input registers
 
+        :param storage: the storage of the unit identifier
         :param request: the request to be processed
-        :return: the response made from the request with DATA and L modified
+        :param output: the buffer where the response is written
+        :param offset: where the DATA of the response starts in the buffer
+        :return: the length of the DATA
         """
 
-        response = copy.deepcopy(request)
+        # Get the starting address (first input register)
+        start_address = request.ADDRESS
 
-        # Get the starting address (first coil)
-        start_address = bytes_to_word(request.DATA[0:2])
-
-        # Get the number of coils to be read
-        number_of_ir = bytes_to_word(request.DATA[2:4])
+        # Get the number of input registers to be read
+        number_of_ir = request.QUANTITY
 
         first_ir = start_address + INPUT_REGISTERS_OFFSET
-        last_ir = first_ir + number_of_ir
-
-        result = bytes([number_of_ir * 2])
 
-        input_registers = []
+        input_registers = storage.read_input_registers(first_ir, number_of_ir)
 
-        for i in range(first_ir, last_ir):
-            input_registers.append(self.__storage.read_input_register(i))
+        # The length of the response and every register on 2 bytes, big endian
+        output[offset] = pack_registers_into(input_registers, output, offset + 1)
 
-        for i in range(len(input_registers)):
-            result = result + int_to_bytes(0, input_registers[i], 2)
+        return 1 + output[offset]
 
-        response.L = int_to_bytes(2, len(result), 2)
-        response.DATA = result
-
-        return response
-
-    def __force_single_coil(self, request: ADU) -> ADU:
+    def __force_single_coil(self, storage, request: ADU, output: bytearray, offset: int) -> int:
         """
         Function used to write one coil
 
+        :param storage: the storage of the unit identifier
         :param request: the request to be processed
-        :return: the response made from the request with DATA and L modified
+        :param output: the buffer where the response is written
+        :param offset: where the DATA of the response starts in the buffer
+        :return: the length of the DATA
         """
 
-        response = copy.deepcopy(request)
-
         # Get the starting address (coil)
-        start_address = bytes_to_word(request.DATA[0:2])
+        start_address = request.ADDRESS
 
         # Get the value to be inserted
-        value = bytes_to_word(request.DATA[2:4])
+        value = request.QUANTITY
 
         address_coil = start_address + COILS_OFFSET
 
         if value == 0xFF00:
-            self.__storage.write_coil(1, address_coil)
+            storage.write_coil(1, address_coil)
         elif value == 0x0000:
-            self.__storage.write_coil(0, address_coil)
+            storage.write_coil(0, address_coil)
 
-        return response
+        # The response is the request
+        output[offset:offset + 4] = request.DATA[0:4]
 
-    def __write_single_register(self, request: ADU) -> ADU:
+        return 4
+
+    def __write_single_register(self, storage, request: ADU, output: bytearray, offset: int) -> int:
         """
         Function used to write one holding register
 
+        :param storage: the storage of the unit identifier
         :param request: the request to be processed
-        :return: the response made from the request with DATA and L modified
+        :param output: the buffer where the response is written
+        :param offset: where the DATA of the response starts in the buffer
+        :return: the length of the DATA
         """
 
-        response = copy.deepcopy(request)
-
         # Get the starting address (holding register)
-        start_address = bytes_to_word(request.DATA[0:2])
+        start_address = request.ADDRESS
 
         # Get the value to be inserted
-        value = bytes_to_word(request.DATA[2:4])
+        value = request.QUANTITY
 
         address_hr = start_address + HOLDING_REGISTERS_OFFSET
 
-        self.__storage.write_holding_register(value, address_hr)
+        storage.write_holding_register(value, address_hr)
 
-        return response
+        # The response is the request
+        output[offset:offset + 4] = request.DATA[0:4]
 
-    def __force_multiple_coils(self, request: ADU) -> ADU:
+        return 4
+
+    def __force_multiple_coils(self, storage, request: ADU, output: bytearray, offset: int) -> int:
         """
         Function used to write multiple coils
 
+        :param storage: the storage of the unit identifier
         :param request: the request to be processed
-        :return: the response made from the request with DATA and L modified
+        :param output: the buffer where the response is written
+        :param offset: where the DATA of the response starts in the buffer
+        :return: the length of the DATA
         """
 
-        response = copy.deepcopy(request)
-
         # Get the starting address (first coil)
-        start_address = bytes_to_word(request.DATA[0:2])
+        start_address = request.ADDRESS
 
         # Get the number of coils to be inserted
-        no_coils = bytes_to_word(request.DATA[2:4])
+        no_coils = request.QUANTITY
 
         # Get the number of bytes to be read from the message
         bytes_after = request.DATA[4]
 
         first_coil = start_address + COILS_OFFSET
 
-        registers = []
-        coils = []
-
-        # Get the bytes from the message
-        for i in range(5, 5 + bytes_after):
-            registers.append(request.DATA[i])
+        # Get the coils from the bytes of the message
+        coils = unpack_bits(request.DATA[5:5 + bytes_after], no_coils)
 
-        for i in range(len(registers)):
-            coils = coils + (bytes_to_bits(registers[i]))
+        storage.write_coils(coils, first_coil)
 
-        for i in range(no_coils):
-            self.__storage.write_coil(coils[i], first_coil + i)
+        # The response is the starting address and the number of coils
+        output[offset:offset + 4] = request.DATA[0:4]
 
-        response.L = int_to_bytes(2, 4, 2)
-        response.DATA = request.DATA[0:4]
+        return 4
 
-        return response
-
-    def __write_multiple_registers(self, request: ADU) -> ADU:
+    def __write_multiple_registers(self, storage, request: ADU, output: bytearray, offset: int) -> int:
         """
         Function used to write multiple holding registers
 
+        :param storage: the storage of the unit identifier
         :param request: the request to be processed
-        :return: the response made from the request with DATA and L modified
+        :param output: the buffer where the response is written
+        :param offset: where the DATA of the response starts in the buffer
+        :return: the length of the DATA
         """
 
-        response = copy.deepcopy(request)
-
         # Get the starting address (first holding register)
-        start_address = bytes_to_word(request.DATA[0:2])
+        start_address = request.ADDRESS
 
         # Get the number of holding register to be inserted
-        no_hr = bytes_to_word(request.DATA[2:4])
-
-        # Get the number of bytes to be read from the message
-        bytes_after = request.DATA[4]
+        no_hr = request.QUANTITY
 
         first_hr = start_address + HOLDING_REGISTERS_OFFSET
-        holding_registers = []
 
-        for i in range(5, 5 + bytes_after):
-            holding_registers.append(request.DATA[i])
+        # Every register is 2 bytes, big endian
+        values = unpack_registers(request.DATA[5:5 + no_hr * 2], no_hr)
+
+        storage.write_holding_registers(values, first_hr)
+
+        # The response is the starting address and the number of holding registers
+        output[offset:offset + 4] = request.DATA[0:4]
 
-        for i in range(no_hr):
-            bytes_hr = bytes_to_word(holding_registers[(i * 2):(i * 2 + 2)])
-            self.__storage.write_holding_register(bytes_hr, first_hr + i)
+        return 4
 
-        response.L = int_to_bytes(2, 4, 2)
-        response.DATA = request.DATA[0:4]
+    def __mask_write_register(self, storage, request: ADU, output: bytearray, offset: int) -> int:
+        """
+        Function used to change some bits of one holding register, (value AND and_mask) OR (or_mask AND NOT and_mask)
+
+        :param storage: the storage of the unit identifier
+        :param request: the request to be processed
+        :param output: the buffer where the response is written
+        :param offset: where the DATA of the response starts in the buffer
+        :return: the length of the DATA
+        """
+
+        address_hr = request.ADDRESS + HOLDING_REGISTERS_OFFSET
+
+        # The masks follow the address
+        and_mask, or_mask = WORDS.unpack_from(request.DATA, 2)
 
-        return response
+        # The storage reads and writes the register at once, no other write in between
+        storage.mask_write_holding_register(and_mask, or_mask, address_hr)
 
-    def __respond(self, request: ADU) -> ADU:
+        # The response is the request
+        output[offset:offset + 6] = request.DATA[0:6]
+
+        return 6
+
+    def __read_write_multiple_registers(self, storage, request: ADU, output: bytearray, offset: int) -> int:
         """
-        Based on the function code (FC) calls that function
+        Function used to write multiple holding registers and then read multiple holding registers in one request
 
+        :param storage: the storage of the unit identifier
         :param request: the request to be processed
-        :return: the response made from the request with DATA and L modified
+        :param output: the buffer where the response is written
+        :param offset: where the DATA of the response starts in the buffer
+        :return: the length of the DATA
         """
 
+        first_read = request.ADDRESS + HOLDING_REGISTERS_OFFSET
+        no_read = request.QUANTITY
+
+        # The write starting address and quantity follow the read ones, then the byte count and the values
+        write_address, no_write = WORDS.unpack_from(request.DATA, 4)
+        first_write = write_address + HOLDING_REGISTERS_OFFSET
+
+        values = unpack_registers(request.DATA[9:9 + no_write * 2], no_write)
+
+        # The write is done before the read, both at once
+        holding_registers = storage.write_read_holding_registers(values, first_write, first_read, no_read)
+
+        # The length of the response and every register on 2 bytes, big endian
+        output[offset] = pack_registers_into(holding_registers, output, offset + 1)
+
+        return 1 + output[offset]
+
+    def __versions_of(self, storage) -> dict:
+        """
+        Function used to get the version methods of a storage, a storage without them is looked up only once
+
+        :param storage: the storage of the unit identifier
+        :return: function code -> the version method, None if the storage has no versions
+        """
+
+        versions = self.__versions.get(storage)
+
+        if versions is None:
+            versions = {code: getattr(storage, function.version, None)
+                        for code, function in self.__functions.items() if function.version is not None}
+            self.__versions[storage] = versions
+
+        return versions
+
+    def __respond(self, request: ADU, output: bytearray, offset: int) -> int:
+        """
+        Based on the unit identifier (UI) picks the storage and based on the function code (FC) calls that function,
+        the response is written in the buffer
+
+        :param request: the request to be processed
+        :param output: the buffer where the response is written
+        :param offset: where the response starts in the buffer
+        :return: the length of the response
+        """
+
+        storage = self.__units.get(request.UI)
+
+        # The unit identifier is another device, it checks the request
+        if isinstance(storage, Gateway):
+            return storage.forward(request, output, offset)
+
+        function = self.__functions.get(request.FC)
+
         # Check for exceptions
-        exception = ModbusException.check(request)
-
-        if exception is None:
-            return {
-                0x01: self.__read_coil_status,
-                0x02: self.__read_discrete_inputs,
-                0x03: self.__read_holding_registers,
-                0x04: self.__read_input_registers,
-                0x05: self.__force_single_coil,
-                0x06: self.__write_single_register,
-                0x0F: self.__force_multiple_coils,
-                0x10: self.__write_multiple_registers,
-            }[request.FC[0]](request)
-        else:
-            return exception
+        start = time.perf_counter()
+        exception = ModbusException.check(request, function)
+        self.metrics.phase("validate", time.perf_counter() - start)
+
+        if exception is not None:
+            self.metrics.exception(request.FC, exception)
+            return ModbusException.respond(request, exception, output, offset)
+
+        version = None
+
+        if function.version is not None and self.__cache is not None:
+            versions = self.__versions_of(storage)[request.FC]
+
+            # Read before the values, a write in between gives a version that is never seen again
+            if versions is not None:
+                key = (request.UI, request.FC, request.ADDRESS, request.QUANTITY)
+                version = versions(request.ADDRESS + function.offset, request.QUANTITY)
+                size = self.__cache.get(key, version, request.TI, output, offset)
+
+                if size:
+                    return size
+
+        start = time.perf_counter()
+
+        # The storage failed, the client gets an exception response and the connection is kept
+        try:
+            size = function.handler(storage, request, output, offset + 8)
+        except TimeoutError:
+            LOGGER.warning("[STORAGE BUSY FOR FC %s]", request.FC)
+            exception = SERVER_BUSY
+        except Exception:
+            LOGGER.exception("Error of the storage for FC %s", request.FC)
+            exception = SERVER_FAILURE
+
+        self.metrics.phase("handle", time.perf_counter() - start)
+
+        if exception is not None:
+            self.metrics.exception(request.FC, exception)
+            return ModbusException.respond(request, exception, output, offset)
+
+        MBAP.pack_into(output, offset, request.TI, request.PI, 2 + size, request.UI, request.FC)
+
+        if version is not None:
+            self.__cache.put(key, version, bytes(output[offset:offset + 8 + size]))
+
+        return 8 + size
@@ -1,179 +1,92 @@
-import copy
+import struct
 from typing import Optional
 
 from Source.Config import *
-from Source.Modbus.Adu import ADU
-from Source.Utils import *
+from Source.Modbus.Adu import ADU, WORDS
+from Source.Modbus.Function import Function
 
+# The exception response: MBAP header, function code + 0x80 and the exception code
+EXCEPTION = struct.Struct(">HHHBBB")
 
-class ModbusException:
-    @staticmethod
-    def __illegal_function(request) -> Optional[ADU]:
-        """
-        Function used to check if the modbus function code is correct
-
-        :param request: the request made by the client
-        :return: exception response or None if everything is ok
-        """
-
-        function = request.FC[0]
-
-        if function in [0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x0F, 0x10]:
-            return None
-        else:
-            response = copy.deepcopy(request)
-
-            response.FC = bytes([response.FC[0] + 0x80])
-            response.DATA = bytes([ILLEGAL_FUNCTION])
-
-            return response
-
-    @staticmethod
-    def __illegal_data_address(request) -> Optional[ADU]:
-        """
-        Function used to check if the address is correct, starting address and finish address
-
-        :param request: the request made by the client
-        :return: exception response or None if everything is ok
-        """
-
-        function = request.FC[0]
-
-        if function in [0x01, 0x02, 0x03, 0x04, 0x0F, 0x10]:
-            start_address = bytes_to_word(request.DATA[0:2])
-            number_of_data = bytes_to_word(request.DATA[2:4])
-
-            if (0x01 <= start_address <= 0xF9) and (0x01 <= (start_address + number_of_data - 1) <= 0xF9):
-                return None
-            else:
-                response = copy.deepcopy(request)
-
-                response.FC = bytes([response.FC[0] + 0x80])
-                response.DATA = bytes([ILLEGAL_DATA_ADDRESS])
-
-                return response
-
-        if function in [0x05, 0x06]:
-            start_address = bytes_to_word(request.DATA[0:2])
-
-            if 0x01 <= start_address <= 0xF9:
-                return None
-            else:
-                response = copy.deepcopy(request)
-                response.FC = bytes([response.FC[0] + 0x80])
-                response.DATA = bytes([ILLEGAL_DATA_ADDRESS])
-                return response
 
+class ModbusException:
     @staticmethod
-    def __illegal_data_value(request) -> Optional[ADU]:
+    def check(request: ADU, function: Optional[Function]) -> Optional[int]:
         """
-        Function used to check if the values given in the request are valid, read more in the documentation
+        Function used to check the request in a single pass: function code, addresses and values
 
         :param request: the request made by the client
-        :return: exception response or None if everything is ok
+        :param function: the description of the function code, None if the function code is not supported
+        :return: exception code or None if everything is ok
         """
 
-        function = request.FC[0]
-
-        if function in [0x01, 0x02]:
-            quantity = bytes_to_word(request.DATA[2:4])
-
-            if 0x01 <= quantity <= 0xF9:
-                return None
-            else:
-                response = copy.deepcopy(request)
-
-                response.FC = bytes([response.FC[0] + 0x80])
-                response.DATA = bytes([ILLEGAL_DATA_VALUE])
-
-                return response
-
-        if function in [0x03, 0x04]:
-            quantity = bytes_to_word(request.DATA[2:4])
+        if function is None:
+            return ILLEGAL_FUNCTION
 
-            if 0x01 <= quantity <= 0x7D:
-                return None
-            else:
-                response = copy.deepcopy(request)
+        # The request is too short to hold the address and the quantity (or value)
+        if request.ADDRESS is None or len(request.DATA) < function.size:
+            return ILLEGAL_DATA_VALUE
 
-                response.FC = bytes([response.FC[0] + 0x80])
-                response.DATA = bytes([ILLEGAL_DATA_VALUE])
+        first, last = function.addresses
+        start_address = request.ADDRESS
 
-                return response
+        if function.quantity is None:
+            if not first <= start_address <= last:
+                return ILLEGAL_DATA_ADDRESS
 
-        if function == 0x05:
-            value = bytes_to_word(request.DATA[2:4])
+            if function.values is not None and request.QUANTITY not in function.values:
+                return ILLEGAL_DATA_VALUE
 
-            if value in [0x0000, 0xFF00]:
-                return None
-            else:
-                response = copy.deepcopy(request)
-
-                response.FC = bytes([response.FC[0] + 0x80])
-                response.DATA = bytes([ILLEGAL_DATA_VALUE])
-
-                return response
+            return None
 
-        if function == 0x06:
-            value = bytes_to_word(request.DATA[2:4])
+        quantity = request.QUANTITY
 
-            if 0x0000 <= value <= 0xFFFF:
-                return None
-            else:
-                response = copy.deepcopy(request)
+        if not (first <= start_address <= last) or not (first <= start_address + quantity - 1 <= last):
+            return ILLEGAL_DATA_ADDRESS
 
-                response.FC = bytes([response.FC[0] + 0x80])
-                response.DATA = bytes([ILLEGAL_DATA_VALUE])
+        minimum, maximum = function.quantity
 
-                return response
+        if not minimum <= quantity <= maximum:
+            return ILLEGAL_DATA_VALUE
 
-        if function == 0x0F:
-            quantity = bytes_to_word(request.DATA[2:4])
+        # The byte count must match the quantity and the values must be in the request
+        if function.counted:
             bytes_after = request.DATA[4]
 
-            if (0x01 <= quantity <= 0xF9) and (bytes_after == (int(quantity / 8) + (quantity % 8 > 0))):
-                return None
-            else:
-                response = copy.deepcopy(request)
+            if bytes_after != (quantity * function.width + 7) // 8 or len(request.DATA) < 5 + bytes_after:
+                return ILLEGAL_DATA_VALUE
 
-                response.FC = bytes([response.FC[0] + 0x80])
-                response.DATA = bytes([ILLEGAL_DATA_VALUE])
+        # The written registers of FC 0x17, after the read ones
+        if function.write is not None:
+            write_address, write_quantity = WORDS.unpack_from(request.DATA, 4)
 
-                return response
+            if not (first <= write_address <= last) or not (first <= write_address + write_quantity - 1 <= last):
+                return ILLEGAL_DATA_ADDRESS
 
-        if function == 0x10:
-            quantity = bytes_to_word(request.DATA[2:4])
-            bytes_after = request.DATA[4]
+            minimum, maximum = function.write
 
-            if (0x01 <= quantity <= 0x7B) and (bytes_after == quantity * 2):
-                return None
-            else:
-                response = copy.deepcopy(request)
+            if not minimum <= write_quantity <= maximum:
+                return ILLEGAL_DATA_VALUE
 
-                response.FC = bytes([response.FC[0] + 0x80])
-                response.DATA = bytes([ILLEGAL_DATA_VALUE])
+            bytes_after = request.DATA[8]
 
-                return response
+            if bytes_after != write_quantity * 2 or len(request.DATA) < 9 + bytes_after:
+                return ILLEGAL_DATA_VALUE
+
+        return None
 
     @staticmethod
-    def check(request) -> Optional[ADU]:
+    def respond(request: ADU, exception: int, output: bytearray, offset: int) -> int:
         """
-        Function used to check if
+        Function used to write the exception response for a request
 
         :param request: the request made by the client
-        :return: exception response or None if everything is ok
+        :param exception: the exception code
+        :param output: the buffer where the response is written
+        :param offset: where the response starts in the buffer
+        :return: the length of the response
         """
 
-        exception = ModbusException.__illegal_function(request)
-        if exception is not None:
-            return exception
-
-        exception = ModbusException.__illegal_data_address(request)
-        if exception is not None:
-            return exception
+        EXCEPTION.pack_into(output, offset, request.TI, request.PI, 3, request.UI, request.FC | 0x80, exception)
 
-        exception = ModbusException.__illegal_data_value(request)
-        if exception is not None:
-            return exception
-
-        return None
+        return EXCEPTION.size
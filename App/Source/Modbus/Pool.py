@@ -0,0 +1,133 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, Future, TimeoutError
+from typing import Callable, Optional
+
+from Source.Modbus.Metrics import Metrics
+
+
+class Pool:
+    def __init__(self, size: int, queue_size: int, deadline: float, metrics: Metrics):
+        """
+        A fixed number of threads running the requests, the requests wait in a bounded queue. A request that can't
+        be queued or that waited longer than the deadline is not run, the client gets Server Busy (0x06)
+
+        :param size: the number of threads
+        :param queue_size: the most requests waiting for a thread
+        :param deadline: the most seconds a request waits for a thread
+        :param metrics: where the depth of the queue and the rejected requests are counted
+        """
+
+        self.__queue = queue.Queue(queue_size)
+        self.__deadline = deadline
+        self.__metrics = metrics
+
+        for _ in range(size):
+            threading.Thread(target=self.__work, daemon=True).start()
+
+    def submit(self, function: Callable, *args) -> Optional[Future]:
+        """
+        Function used to queue a call for the threads
+
+        :param function: the function called by a thread
+        :param args: the arguments of the function
+        :return: the result of the call, None if the queue is full
+        """
+
+        future = Future()
+
+        try:
+            self.__queue.put_nowait((time.monotonic() + self.__deadline, future, function, args))
+        except queue.Full:
+            self.__metrics.rejected("queue")
+            return None
+
+        self.__metrics.queued(self.__queue.qsize())
+
+        return future
+
+    def run(self, function: Callable, *args):
+        """
+        Function used to call a function on a thread of the pool and wait for the result
+
+        :param function: the function called by a thread
+        :param args: the arguments of the function
+        :return: the result of the call, None if it was rejected (queue full or deadline passed)
+        """
+
+        future = self.submit(function, *args)
+
+        if future is None:
+            return None
+
+        try:
+            future.result(self.__deadline)
+        except (CancelledError, TimeoutError):
+            pass
+
+        return self.__finish(future)
+
+    async def run_async(self, function: Callable, *args):
+        """
+        Function used to call a function on a thread of the pool without blocking the event loop, same as run
+
+        :param function: the function called by a thread
+        :param args: the arguments of the function
+        :return: the result of the call, None if it was rejected (queue full or deadline passed)
+        """
+
+        future = self.submit(function, *args)
+
+        if future is None:
+            return None
+
+        wrapped = asyncio.wrap_future(future)
+        await asyncio.wait([wrapped], timeout=self.__deadline)
+
+        if future.cancel():
+            self.__metrics.rejected("deadline")
+            return None
+
+        return await wrapped
+
+    def __finish(self, future: Future):
+        """
+        Function used to get the result of a call after the deadline or after it is done, it is dropped if it didn't
+        start yet
+
+        :param future: the result of the call
+        :return: the result of the call, None if it was dropped
+        """
+
+        # A call already started is never dropped, the client would not know if it was done
+        if future.cancel():
+            self.__metrics.rejected("deadline")
+            return None
+
+        return future.result()
+
+    def __work(self) -> None:
+        """
+        Function used by the threads to run the queued calls, the ones that waited too long are dropped
+
+        :return: None
+        """
+
+        while True:
+            deadline, future, function, args = self.__queue.get()
+            self.__metrics.queued(self.__queue.qsize())
+
+            # The caller counts it and answers Server Busy
+            if time.monotonic() > deadline:
+                future.cancel()
+                continue
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(function(*args))
+            except BaseException as exception:
+                future.set_exception(exception)
@@ -0,0 +1,93 @@
+import logging
+import time
+
+from Source.Modbus.Adu import ADU
+
+# The requests and the responses, written only at DEBUG level
+TRACE = logging.getLogger("modbus.trace")
+
+
+class Dump:
+    __slots__ = ("message",)
+
+    def __init__(self, message: memoryview):
+        """
+        An ADU formatted only when the record is written, the message is copied because the buffer is reused
+
+        :param message: a complete ADU
+        """
+
+        self.message = bytes(message)
+
+    def __str__(self):
+        return ADU(memoryview(self.message)).print()
+
+
+class Trace:
+    def __init__(self, address: any, sample: int, rate: float):
+        """
+        Decides which requests of a connection are written, every sample-th request and at most rate per second
+
+        :param address: ip address of the client and the port, tuple usually
+        :param sample: 1 writes every request, N writes one request out of N
+        :param rate: the most requests written every second, 0 for no limit
+        """
+
+        self.host = address[0]
+
+        # Checked once, nothing else is done for the requests if the level is above DEBUG
+        self.enabled = TRACE.isEnabledFor(logging.DEBUG)
+
+        self.__sample = max(1, sample)
+        self.__rate = rate
+        self.__count = 0
+        self.__burst = max(rate, 1)
+        self.__tokens = self.__burst
+        self.__last = time.monotonic()
+
+    def sampled(self) -> bool:
+        """
+        Function used to decide if the next request (and its response) is written
+
+        :return: True if it is written
+        """
+
+        self.__count = self.__count + 1
+
+        if self.__count % self.__sample != 0:
+            return False
+
+        if not self.__rate:
+            return True
+
+        # Token bucket, refilled with rate tokens every second and holding at most one second of them
+        now = time.monotonic()
+        self.__tokens = min(self.__burst, self.__tokens + (now - self.__last) * self.__rate)
+        self.__last = now
+
+        if self.__tokens < 1:
+            return False
+
+        self.__tokens = self.__tokens - 1
+
+        return True
+
+    def request(self, message: memoryview) -> None:
+        """
+        Function used to write a request
+
+        :param message: the request
+        :return: None
+        """
+
+        TRACE.debug("<<< [%s]  %s", self.host, Dump(message))
+
+    def response(self, message: memoryview) -> None:
+        """
+        Function used to write a response
+
+        :param message: the response
+        :return: None
+        """
+
+        TRACE.debug(">>> [%s]  %s", self.host, Dump(message))
@@ -1,18 +1,41 @@
-import mysql.connector
+from typing import Callable, Optional
 
 from Source.Config import *
+from Source.Log import LOGGER
+from Source.Storage.Pool import Pool
+
+# The offset and the first and last address of every table
+TABLES = {
+    "Coils": (COILS_OFFSET, COILS_ADDRESSES),
+    "DiscreteInputs": (DISCRETE_INPUTS_OFFSET, DISCRETE_INPUTS_ADDRESSES),
+    "InputRegisters": (INPUT_REGISTERS_OFFSET, INPUT_REGISTERS_ADDRESSES),
+    "HoldingRegisters": (HOLDING_REGISTERS_OFFSET, HOLDING_REGISTERS_ADDRESSES),
+}
 
 
 class Database:
-    def __init__(self, host: str, user: str, password: str):
-        self.__connection = mysql.connector.connect(host=host, user=user, password=password)
+    # Every call waits for the database
+    BLOCKING = True
+
+    def __init__(self, host: str, user: str, password: str, pool_size: int, pool_timeout: float,
+                 database: str = "ModbusTCP", connect: Optional[Callable] = None, pool_idle: float = DB_POOL_IDLE):
+        # mysql is imported only when it is used, the load benchmark gives its own connector
+        if connect is None:
+            import mysql.connector
+
+            connect = mysql.connector.connect
+
+        connection = connect(host=host, user=user, password=password)
 
-        cursor = self.__connection.cursor()
-        cursor.execute("CREATE DATABASE IF NOT EXISTS ModbusTCP")
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+        connection.close()
 
-        self.__connection = mysql.connector.connect(host=host, user=user, password=password, database="ModbusTCP")
+        # Every request checks out its own connection, the client threads never share one
+        self.__pool = Pool(pool_size, pool_timeout, pool_idle, connect, host=host, user=user, password=password,
+                           database=database)
+        # Only the addresses written have a row, a missing row is 0
         self.__create_tables()
-        self.__initialize_tables()
 
     def __create_tables(self) -> None:
         """
@@ -21,71 +44,151 @@ class Database:
         :return: None
         """
 
-        cursor = self.__connection.cursor()
-
-        tables = ["CREATE TABLE IF NOT EXISTS Coils(ID SMALLINT PRIMARY KEY, VALUE BOOLEAN)",
+        tables = ["CREATE TABLE IF NOT EXISTS Coils(ID INT PRIMARY KEY, VALUE BOOLEAN)",
                   "CREATE TABLE IF NOT EXISTS DiscreteInputs(ID INT PRIMARY KEY, VALUE BOOLEAN)",
                   "CREATE TABLE IF NOT EXISTS InputRegisters(ID INT PRIMARY KEY, VALUE SMALLINT UNSIGNED)",
                   "CREATE TABLE IF NOT EXISTS HoldingRegisters(ID INT PRIMARY KEY, VALUE SMALLINT UNSIGNED)"]
 
         # Create the database with the tables for all 4 types of data
-        if self.__connection is not None:
+        with self.__pool.connection() as connection:
+            cursor = connection.cursor()
+
             for Table in tables:
                 try:
                     cursor.execute(Table)
                 except Exception as e:
-                    print(e)
+                    LOGGER.warning("%s", e)
+
+    @staticmethod
+    def __addresses(table: str) -> range:
+        """
+        Function used to get the IDs of a table, the addresses with the offset
+
+        :param table: the name of the table
+        :return: the IDs
+        """
+
+        offset, (first, last) = TABLES[table]
+
+        return range(offset + first, offset + last + 1)
+
+    @staticmethod
+    def __select(cursor, table: str, address: int, count: int) -> list:
+        """
+        Function used to read consecutive values from a table with a single query, a missing row is 0
 
-    def __initialize_tables(self) -> None:
+        :param cursor: a cursor of the connection (transaction) used
+        :param table: the name of the table
+        :param address: the address of the first value
+        :param count: the number of values
+        :return: the values ordered by address
         """
-        Function used to initialize the tables, all values are 0
 
+        cursor.execute(f"SELECT ID, VALUE FROM {table} WHERE ID BETWEEN %s AND %s", (address, address + count - 1))
+        values = dict(cursor.fetchall())
+
+        return [values.get(i, 0) for i in range(address, address + count)]
+
+    @staticmethod
+    def __upsert(cursor, table: str, values: list, address: int) -> None:
+        """
+        Function used to write consecutive values in a table with a single multi-row statement, the missing rows are
+        inserted
+
+        :param cursor: a cursor of the connection (transaction) used
+        :param table: the name of the table
+        :param values: the values to be written
+        :param address: the address of the first value
         :return: None
         """
 
-        cursor = self.__connection.cursor()
+        rows = [(address + i, value) for i, value in enumerate(values)]
 
-        for i in range(COILS_OFFSET + 1, 250):
-            cursor.execute(f"INSERT IGNORE INTO Coils(ID, VALUE) VALUES ({i}, 0)")
+        # executemany sends an INSERT as one multi-row statement, existing rows are updated
+        cursor.executemany(f"INSERT INTO {table}(ID, VALUE) VALUES (%s, %s) "
+                           f"ON DUPLICATE KEY UPDATE VALUE = VALUES(VALUE)", rows)
 
-        for i in range(DISCRETE_INPUTS_OFFSET + 1, 10250):
-            cursor.execute(f"INSERT IGNORE INTO DiscreteInputs(ID, VALUE) VALUES ({i}, 0)")
+    def __read_range(self, table: str, address: int, count: int) -> list:
+        """
+        Function used to read consecutive values from a table with a single query, a missing row is 0
 
-        for i in range(INPUT_REGISTERS_OFFSET + 1, 30250):
-            cursor.execute(f"INSERT IGNORE INTO InputRegisters(ID, VALUE) VALUES ({i}, 0)")
+        :param table: the name of the table
+        :param address: the address of the first value
+        :param count: the number of values
+        :return: the values ordered by address
+        """
 
-        for i in range(HOLDING_REGISTERS_OFFSET + 1, 40250):
-            cursor.execute(f"INSERT IGNORE INTO HoldingRegisters(ID, VALUE) VALUES ({i}, 0)")
+        with self.__pool.connection() as connection:
+            return self.__select(connection.cursor(), table, address, count)
 
-        self.__connection.commit()
+    def __write_range(self, table: str, values: list, address: int) -> None:
+        """
+        Function used to write consecutive values in a table with a single multi-row statement (autocommit), the
+        missing rows are inserted
 
-    def reset_coils(self) -> None:
+        :param table: the name of the table
+        :param values: the values to be written
+        :param address: the address of the first value
+        :return: None
         """
-        Function used to reset the coils
 
+        with self.__pool.connection() as connection:
+            self.__upsert(connection.cursor(), table, values, address)
+
+    def __reset(self, table: str) -> None:
+        """
+        Function used to set every value of a table to 0 with a single statement, the rows are removed (a missing
+        row is 0)
+
+        :param table: the name of the table
         :return: None
         """
 
-        cursor = self.__connection.cursor()
+        addresses = self.__addresses(table)
 
-        for i in range(1, 250):
-            cursor.execute("UPDATE Coils SET VALUE = %s WHERE ID = %s", (0, i))
+        with self.__pool.connection() as connection:
+            connection.cursor().execute(f"DELETE FROM {table} WHERE ID BETWEEN %s AND %s",
+                                        (addresses.start, addresses.stop - 1))
 
-        self.__connection.commit()
+    def image(self, marks: Optional[dict] = None) -> tuple:
+        """
+        Function used to get the values of every table at one point in time, every table is read in the same
+        transaction (consistent read)
 
-    def reset_discrete_inputs(self) -> None:
+        :param marks: not used, there are no versions so every value is returned
+        :return: None (the marks) and the values, table name -> {address: value}
         """
-        Function used to reset the discrete inputs
+
+        images = {}
+
+        with self.__pool.connection(transaction=True) as connection:
+            cursor = connection.cursor()
+
+            for table in TABLES:
+                addresses = self.__addresses(table)
+                values = self.__select(cursor, table, addresses.start, len(addresses))
+
+                images[table] = dict(zip(addresses, values))
+
+        return None, images
+
+    def reset_coils(self) -> None:
+        """
+        Function used to reset the coils
 
         :return: None
         """
 
-        cursor = self.__connection.cursor()
+        self.__reset("Coils")
+
+    def reset_discrete_inputs(self) -> None:
+        """
+        Function used to reset the discrete inputs
 
-        for i in range(10001, 10250):
-            cursor.execute("UPDATE DiscreteInputs SET VALUE = %s WHERE ID = %s", (0, i))
+        :return: None
+        """
 
-        self.__connection.commit()
+        self.__reset("DiscreteInputs")
 
     def reset_input_registers(self) -> None:
         """
@@ -94,12 +197,7 @@ class Database:
         :return: None
         """
 
-        cursor = self.__connection.cursor()
-
-        for i in range(30001, 30250):
-            cursor.execute("UPDATE InputRegisters SET VALUE = %s WHERE ID = %s", (0, i))
-
-        self.__connection.commit()
+        self.__reset("InputRegisters")
 
     def reset_holding_registers(self) -> None:
         """
@@ -108,12 +206,7 @@ class Database:
         :return: None
         """
 
-        cursor = self.__connection.cursor()
-
-        for i in range(40001, 40250):
-            cursor.execute("UPDATE HoldingRegisters SET VALUE = %s WHERE ID = %s", (0, i))
-
-        self.__connection.commit()
+        self.__reset("HoldingRegisters")
 
     def read_coil(self, address: int) -> int:
         """
@@ -123,9 +216,7 @@ class Database:
         :return: the value of the coil
         """
 
-        cursor = self.__connection.cursor()
-        cursor.execute(f"SELECT VALUE FROM Coils WHERE ID = {address}")
-        return cursor.fetchall()[0][0]
+        return self.__read_range("Coils", address, 1)[0]
 
     def read_discrete_input(self, address: int) -> int:
         """
@@ -135,9 +226,7 @@ class Database:
         :return: the value of the discrete input
         """
 
-        cursor = self.__connection.cursor()
-        cursor.execute(f"SELECT VALUE FROM DiscreteInputs WHERE ID = {address}")
-        return cursor.fetchall()[0][0]
+        return self.__read_range("DiscreteInputs", address, 1)[0]
 
     def read_holding_register(self, address: int) -> int:
         """
@@ -147,9 +236,7 @@ class Database:
         :return: the value of the holding register
         """
 
-        cursor = self.__connection.cursor()
-        cursor.execute(f"SELECT VALUE FROM HoldingRegisters WHERE ID = {address}")
-        return cursor.fetchall()[0][0]
+        return self.__read_range("HoldingRegisters", address, 1)[0]
 
     def read_input_register(self, address: int) -> int:
         """
@@ -159,9 +246,51 @@ class Database:
         :return: the value of the input register
         """
 
-        cursor = self.__connection.cursor()
-        cursor.execute(f"SELECT VALUE FROM InputRegisters WHERE ID = {address}")
-        return cursor.fetchall()[0][0]
+        return self.__read_range("InputRegisters", address, 1)[0]
+
+    def read_coils(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple coils
+
+        :param address: the address of the first coil
+        :param count: the number of coils
+        :return: the values of the coils
+        """
+
+        return self.__read_range("Coils", address, count)
+
+    def read_discrete_inputs(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple discrete inputs
+
+        :param address: the address of the first discrete input
+        :param count: the number of discrete inputs
+        :return: the values of the discrete inputs
+        """
+
+        return self.__read_range("DiscreteInputs", address, count)
+
+    def read_holding_registers(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple holding registers
+
+        :param address: the address of the first holding register
+        :param count: the number of holding registers
+        :return: the values of the holding registers
+        """
+
+        return self.__read_range("HoldingRegisters", address, count)
+
+    def read_input_registers(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple input registers
+
+        :param address: the address of the first input register
+        :param count: the number of input registers
+        :return: the values of the input registers
+        """
+
+        return self.__read_range("InputRegisters", address, count)
 
     def write_coil(self, value: int, address: int) -> None:
         """
@@ -172,9 +301,7 @@ class Database:
         :return: None
         """
 
-        cursor = self.__connection.cursor()
-        cursor.execute(f"UPDATE Coils SET VALUE = {value} WHERE ID = {address}")
-        self.__connection.commit()
+        self.__write_range("Coils", [value], address)
 
     def write_holding_register(self, value: int, address: int) -> None:
         """
@@ -185,6 +312,86 @@ class Database:
         :return: None
         """
 
-        cursor = self.__connection.cursor()
-        cursor.execute(f"UPDATE HoldingRegisters SET VALUE = {value} WHERE ID = {address}")
-        self.__connection.commit()
+        self.__write_range("HoldingRegisters", [value], address)
+
+    def write_coils(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple coils in one transaction
+
+        :param values: values of the coils
+        :param address: the address of the first coil
+        :return: None
+        """
+
+        self.__write_range("Coils", values, address)
+
+    def write_holding_registers(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple holding registers in one transaction
+
+        :param values: values of the holding registers
+        :param address: the address of the first holding register
+        :return: None
+        """
+
+        self.__write_range("HoldingRegisters", values, address)
+
+    def write_discrete_inputs(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple discrete inputs in one transaction, for the ingest (not a modbus function)
+
+        :param values: values of the discrete inputs
+        :param address: the address of the first discrete input
+        :return: None
+        """
+
+        self.__write_range("DiscreteInputs", values, address)
+
+    def write_input_registers(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple input registers in one transaction, for the ingest (not a modbus function)
+
+        :param values: values of the input registers
+        :param address: the address of the first input register
+        :return: None
+        """
+
+        self.__write_range("InputRegisters", values, address)
+
+    def mask_write_holding_register(self, and_mask: int, or_mask: int, address: int) -> None:
+        """
+        Function used to change some bits of a holding register at once, (value AND and_mask) OR (or_mask AND NOT
+        and_mask)
+
+        :param and_mask: the bits kept
+        :param or_mask: the bits set among the ones not kept
+        :param address: the address of the holding register
+        :return: None
+        """
+
+        or_bits = or_mask & ~and_mask & 0xFFFF
+
+        # One statement, the database locks the row for the read and the write, a missing row was 0
+        with self.__pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("INSERT INTO HoldingRegisters(ID, VALUE) VALUES (%s, %s) "
+                           "ON DUPLICATE KEY UPDATE VALUE = (VALUE & %s) | %s", (address, or_bits, and_mask, or_bits))
+
+    def write_read_holding_registers(self, values: list, write_address: int, read_address: int, count: int) -> list:
+        """
+        Function used to write multiple holding registers and then read multiple holding registers, nothing else is
+        written in between
+
+        :param values: values of the holding registers written
+        :param write_address: the address of the first holding register written
+        :param read_address: the address of the first holding register read
+        :param count: the number of holding registers read
+        :return: the values of the holding registers read
+        """
+
+        # One transaction, the written rows stay locked until the read is done
+        with self.__pool.connection(transaction=True) as connection:
+            cursor = connection.cursor()
+            self.__upsert(cursor, "HoldingRegisters", values, write_address)
+
+            return self.__select(cursor, "HoldingRegisters", read_address, count)
@@ -0,0 +1,155 @@
+import threading
+import time
+from typing import Optional
+
+from Source.Config import *
+from Source.Log import LOGGER
+from Source.Modbus.Gateway import Gateway
+from Source.Modbus.Metrics import Metrics
+from Source.Storage.Units import Units
+from Source.Utils import *
+
+# The tables written by the ingest: offset, addresses, the method of the storage and the biggest value
+TABLES = {
+    "discrete_inputs": (DISCRETE_INPUTS_OFFSET, DISCRETE_INPUTS_ADDRESSES, "write_discrete_inputs", 1),
+    "input_registers": (INPUT_REGISTERS_OFFSET, INPUT_REGISTERS_ADDRESSES, "write_input_registers", 0xFFFF),
+}
+
+
+class Ingest:
+    def __init__(self, units: Units, metrics: Optional[Metrics] = None):
+        """
+        Updates of the discrete inputs and the input registers from the field, they are queued and a background
+        thread writes them to the banks. The updates queued while a batch is written are merged (the last value of
+        an address wins) and written together, every run of consecutive addresses in a single write. The updates the
+        bank failed to write stay queued and are written again every INGEST_RETRY_INTERVAL seconds
+
+        :param units: the banks of the server
+        :param metrics: where the updates received and written are counted, None to not count them
+        """
+
+        self.__units = units
+        self.__metrics = metrics
+
+        # (unit, table) -> {modbus address: value}, the pending updates are bounded by the address space
+        self.__lock = threading.Lock()
+        self.__pending = {}
+        self.__wake = threading.Event()
+
+        # Only one batch is written at once, so the updates of an address are never reordered
+        self.__apply_lock = threading.Lock()
+
+        threading.Thread(target=self.__apply_loop, daemon=True).start()
+
+    def update(self, table: str, address: int, values: list, unit: int = 0) -> None:
+        """
+        Function used to queue the update of consecutive values, readers see every value of the update or none of
+        them
+
+        :param table: "discrete_inputs" or "input_registers"
+        :param address: the modbus address of the first value
+        :param values: the values, 0 or 1 for the discrete inputs
+        :param unit: the unit identifier of the bank, routed the same as the modbus requests
+        :return: None
+        """
+
+        if table not in TABLES:
+            raise ValueError(f"The ingest can't write {table}")
+
+        _, (first, last), _, maximum = TABLES[table]
+
+        if not values or not first <= address or address + len(values) - 1 > last:
+            raise ValueError(f"The addresses {address} - {address + len(values) - 1} are not in {table}")
+
+        if not all(0 <= value <= maximum for value in values):
+            raise ValueError(f"The values of {table} are 0 - {maximum}")
+
+        if isinstance(self.__units.get(unit), Gateway):
+            raise ValueError(f"The unit identifier {unit} is a gateway")
+
+        with self.__lock:
+            pending = self.__pending.get((unit, table))
+
+            if pending is None:
+                pending = self.__pending[(unit, table)] = {}
+
+            for i, value in enumerate(values):
+                pending[address + i] = value
+
+        if self.__metrics is not None:
+            self.__metrics.ingested(len(values), 0)
+
+        self.__wake.set()
+
+    def flush(self) -> dict:
+        """
+        Function used to write the queued updates now, they are in the banks when it returns. The updates of a table
+        that failed to be written stay queued (the ones queued since win) and are written again later
+
+        :return: (unit, table) -> the error of the writes that failed
+        """
+
+        with self.__apply_lock:
+            return self.__flush()
+
+    def __flush(self) -> dict:
+        """
+        Function used to write the queued updates, the caller holds the apply lock
+
+        :return: (unit, table) -> the error of the writes that failed
+        """
+
+        with self.__lock:
+            batch = self.__pending
+            self.__pending = {}
+
+        failed = {}
+
+        for (unit, table), pending in batch.items():
+            try:
+                self.__apply(unit, table, pending)
+            except Exception as error:
+                LOGGER.exception("Error to write the updates of %s to the unit %s", table, unit)
+                failed[(unit, table)] = error
+
+        # Queued again under the updates received meanwhile, an address never goes back to an older value
+        with self.__lock:
+            for key in failed:
+                batch[key].update(self.__pending.get(key, {}))
+                self.__pending[key] = batch[key]
+
+        return failed
+
+    def __apply(self, unit: int, table: str, pending: dict) -> None:
+        """
+        Function used to write the updates of a table, a single write for every run of consecutive addresses
+
+        :param unit: the unit identifier of the bank
+        :param table: the name of the table
+        :param pending: modbus address -> value
+        :return: None
+        """
+
+        offset, _, method, _ = TABLES[table]
+        write = getattr(self.__units.get(unit), method)
+
+        for address, count in runs(sorted(pending)):
+            write([pending[i] for i in range(address, address + count)], offset + address)
+
+        if self.__metrics is not None:
+            self.__metrics.ingested(0, len(pending))
+
+    def __apply_loop(self) -> None:
+        """
+        Function used by the background thread to write the updates as they come
+
+        :return: None
+        """
+
+        while True:
+            self.__wake.wait()
+            self.__wake.clear()
+
+            if self.flush():
+                time.sleep(INGEST_RETRY_INTERVAL)
+                self.__wake.set()
@@ -0,0 +1,132 @@
+import os
+import socketserver
+import struct
+import threading
+
+from Source.Config import *
+from Source.Log import LOGGER
+from Source.Storage.Ingest import Ingest
+from Source.Utils import *
+
+# An update: unit identifier, function code of the table (0x02 discrete inputs, 0x04 input registers), the modbus
+# address of the first value and the number of values. The values follow, packed like the modbus responses (bits 8 in
+# a byte, registers as big endian words)
+UPDATE = struct.Struct(">BBHH")
+
+# The most bytes read from a feeder at once, every complete update in them is written by the same flush
+RECEIVE_SIZE = 65536
+
+# Function code -> the table and the bytes of count values
+TABLES = {
+    0x02: ("discrete_inputs", lambda count: (count + 7) // 8),
+    0x04: ("input_registers", lambda count: count * 2),
+}
+
+
+class IngestServer:
+    def __init__(self, ingest: Ingest, path: str):
+        """
+        The ingest on a local (unix) socket for the feeders in other processes, the updates received at once are
+        queued and written by a single flush. Every update gets a byte back: 0 if it was written to the bank,
+        otherwise the modbus exception code (0x01 unknown table, 0x03 addresses or values not valid, 0x04 the bank
+        failed to write it, it stays queued and is written again later)
+
+        :param ingest: where the updates are written
+        :param path: the path of the socket, replaced if it exists
+        """
+
+        self.path = path
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                buffer = bytearray()
+
+                while True:
+                    data = self.request.recv(RECEIVE_SIZE)
+
+                    if not data:
+                        return
+
+                    buffer += data
+                    answers, used, valid = self.queue(buffer)
+                    del buffer[:used]
+
+                    # A single flush writes every update received, then they are answered in order
+                    failed = ingest.flush() if any(isinstance(answer, tuple) for answer in answers) else {}
+
+                    self.request.sendall(bytes(answer if isinstance(answer, int) else
+                                               SERVER_FAILURE if answer in failed else 0 for answer in answers))
+
+                    if not valid:
+                        return
+
+            @staticmethod
+            def queue(buffer: bytearray) -> tuple:
+                """
+                Function used to queue every complete update in the bytes received
+
+                :param buffer: the bytes received and not used yet
+                :return: the answer of every update ((unit, table) if it was queued, otherwise the exception code),
+                         the bytes used and False if an update had an unknown table (the feeder is closed)
+                """
+
+                answers = []
+                offset = 0
+
+                while len(buffer) - offset >= UPDATE.size:
+                    unit, code, address, count = UPDATE.unpack_from(buffer, offset)
+
+                    if code not in TABLES:
+                        answers.append(ILLEGAL_FUNCTION)
+                        return answers, offset, False
+
+                    table, size = TABLES[code]
+                    end = offset + UPDATE.size + size(count)
+
+                    if len(buffer) < end:
+                        break
+
+                    data = buffer[offset + UPDATE.size:end]
+                    values = unpack_bits(data, count) if code == 0x02 else unpack_registers(data, count)
+                    offset = end
+
+                    try:
+                        ingest.update(table, address, values, unit)
+                    except ValueError as error:
+                        LOGGER.warning("[INGEST REFUSED %s]", error)
+                        answers.append(ILLEGAL_DATA_VALUE)
+                        continue
+                    except Exception:
+                        LOGGER.exception("Error to queue the update of %s to the unit %s", table, unit)
+                        answers.append(SERVER_FAILURE)
+                        continue
+
+                    answers.append((unit, table))
+
+                return answers, offset, True
+
+        if os.path.exists(path):
+            os.remove(path)
+
+        self.__server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        self.__server.daemon_threads = True
+
+    def serve(self) -> None:
+        """
+        Function used to accept the feeders in a background thread
+
+        :return: None
+        """
+
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        """
+        Function used to stop accepting the feeders and remove the socket
+
+        :return: None
+        """
+
+        self.__server.shutdown()
+        self.__server.server_close()
+        os.remove(self.path)
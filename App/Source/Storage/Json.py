@@ -1,104 +1,333 @@
 import json
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Optional
 
 from Source.Config import *
+from Source.Log import LOGGER
+from Source.Storage.Stripes import Stripes
+from Source.Storage.Wal import RESET, Wal
+
+# The tables of the file, the index is the table of a record in the log
+TABLES = ("Coils", "DiscreteInputs", "InputRegisters", "HoldingRegisters")
+
+# The offset and the first and last address of every table
+ADDRESSES = {
+    "Coils": (COILS_OFFSET, COILS_ADDRESSES),
+    "DiscreteInputs": (DISCRETE_INPUTS_OFFSET, DISCRETE_INPUTS_ADDRESSES),
+    "InputRegisters": (INPUT_REGISTERS_OFFSET, INPUT_REGISTERS_ADDRESSES),
+    "HoldingRegisters": (HOLDING_REGISTERS_OFFSET, HOLDING_REGISTERS_ADDRESSES),
+}
 
 
 class Json:
-    def __init__(self, path: str, create: bool):
+    # Every call reads and writes the file
+    BLOCKING = True
+
+    def __init__(self, path: str, create: bool, wal: Optional[Wal] = None, compact_size: int = 0):
         self.path = path
+        self.__wal = wal
+
+        # Held by every write and every range read of the table, a read-modify-write (FC 0x16/0x17) holds it for the
+        # read and the write. Without a log every write rewrites the whole file so the tables share a single lock
+        if wal is None:
+            stripes = Stripes(1, LOCK_STRIPE_SIZE)
+            self.__stripes = {table: stripes for table in TABLES}
+        else:
+            self.__stripes = {table: Stripes(LOCK_STRIPES, LOCK_STRIPE_SIZE) for table in TABLES}
+
+        if wal is not None:
+            # The tables are kept in memory, the writes only go to the log and the file is rewritten in the background
+            self.BLOCKING = False
+            self.__compact_size = compact_size
+            self.__wake = threading.Event()
+
         if create:
             self.generate_json()
 
+        if wal is not None:
+            self.__json = self.__read_file()
+
+            for table, address, value in wal.replay():
+                if table & RESET:
+                    self.__json[TABLES[table & ~RESET]] = {}
+                else:
+                    self.__put(self.__json[TABLES[table]], address, value)
+
+            # The replayed records are saved in a new snapshot before anything is written
+            self.__compact()
+
+            threading.Thread(target=self.__compact_loop, daemon=True).start()
+
     def generate_json(self) -> None:
         """
         Function used to create the json file
 
         :return: None
         """
-        json_temp = {
-            "Coils": {},
-            "DiscreteInputs": {},
-            "InputRegisters": {},
-            "HoldingRegisters": {}
-        }
-        for i in range(COILS_OFFSET + 1, 250):
-            json_temp["Coils"][str(i)] = 0
+        json_temp = {name: {} for name in TABLES}
+
+        with self.__hold_all():
+            self.__save(json.dumps(json_temp))
+
+            # The records of the log were made for the old file
+            if self.__wal is not None:
+                self.__json = json_temp
+                self.__wal.clear()
+
+    @staticmethod
+    def __put(entries: dict, address: int, value: int) -> None:
+        """
+        Function used to set a value of a table, only the values that are not 0 are kept (a missing address is 0) so
+        the file and the memory grow with the addresses written, not with the address range
+
+        :param entries: the table, address (string) -> value
+        :param address: the address
+        :param value: the value
+        :return: None
+        """
 
-        for i in range(DISCRETE_INPUTS_OFFSET + 1, 10250):
-            json_temp["DiscreteInputs"][str(i)] = 0
+        if value:
+            entries[str(address)] = value
+        else:
+            entries.pop(str(address), None)
 
-        for i in range(INPUT_REGISTERS_OFFSET + 1, 30250):
-            json_temp["InputRegisters"][str(i)] = 0
+    @contextmanager
+    def __hold_all(self):
+        """
+        Function used to hold the locks of every table, always in the same order
 
-        for i in range(HOLDING_REGISTERS_OFFSET + 1, 40250):
-            json_temp["HoldingRegisters"][str(i)] = 0
+        :return: None
+        """
 
-        with open(self.path, "w+") as file:
-            file.write(json.dumps(json_temp))
+        with ExitStack() as stack:
+            for stripes in dict.fromkeys(self.__stripes.values()):
+                stack.enter_context(stripes.hold_all())
 
-    def reset_coils(self) -> None:
+            yield
+
+    def __save(self, text: str) -> None:
         """
-        Function used to reset the coils
+        Function used to write the json file next to it and replace it, a reader never sees a half written file
 
+        :param text: the tables
         :return: None
         """
 
+        with open(self.path + ".tmp", "w+") as file:
+            file.write(text)
+
+        os.replace(self.path + ".tmp", self.path)
+
+    def __read_file(self) -> dict:
+        """
+        Function used to read the json file
+
+        :return: the tables
+        """
+
         with open(self.path, "r") as file:
-            json_temp = json.loads(file.read())
+            return json.loads(file.read())
 
-        for i in range(COILS_OFFSET + 1, 250):
-            json_temp["Coils"][str(i)] = 0
+    def __read(self) -> dict:
+        """
+        Function used to get the tables, from memory if there is a log, otherwise from the file, an address missing
+        from a table is 0
 
-        with open(self.path, "w+") as file:
-            file.write(json.dumps(json_temp))
+        :return: the tables
+        """
 
-    def reset_discrete_inputs(self) -> None:
+        if self.__wal is not None:
+            return self.__json
+
+        return self.__read_file()
+
+    def image(self, marks: Optional[dict] = None) -> tuple:
         """
-        Function used to reset the discrete inputs
+        Function used to get the values of every table at one point in time, the writes wait meanwhile
+
+        :param marks: not used, there are no versions so every value is returned
+        :return: None (the marks) and the values, table name -> {address: value}
+        """
+
+        # Without a log the file is replaced at once, a single read sees every table at the same time
+        if self.__wal is None:
+            json_temp = self.__read_file()
+        else:
+            with self.__hold_all():
+                json_temp = {name: dict(self.__json[name]) for name in TABLES}
+
+        images = {}
+
+        for name in TABLES:
+            offset, (first, last) = ADDRESSES[name]
+            entries = json_temp[name]
+
+            images[name] = {i: entries.get(str(i), 0) for i in range(offset + first, offset + last + 1)}
+
+        return None, images
+
+    def __read_range(self, table: str, address: int, count: int) -> list:
+        """
+        Function used to read consecutive values, never half of a write
+
+        :param table: the name of the table
+        :param address: the address of the first value
+        :param count: the number of values
+        :return: the values
+        """
+
+        # Without a log the file is replaced at once, it doesn't need the lock
+        if self.__wal is None:
+            entries = self.__read_file()[table]
+
+            return [entries.get(str(i), 0) for i in range(address, address + count)]
 
+        with self.__stripes[table].hold((address, count)):
+            entries = self.__json[table]
+
+            return [entries.get(str(i), 0) for i in range(address, address + count)]
+
+    def __write(self, table: str, values: list, address: int) -> None:
+        """
+        Function used to write consecutive values at once
+
+        :param table: the name of the table
+        :param values: the values
+        :param address: the address of the first value
         :return: None
         """
 
-        with open(self.path, "r") as file:
-            json_temp = json.loads(file.read())
+        with self.__stripes[table].hold((address, len(values))):
+            self.__store(table, values, address)
+
+    def __store(self, table: str, values: list, address: int) -> None:
+        """
+        Function used to write consecutive values, they are added to the log if there is one, otherwise the file is
+        rewritten, must be called with the locks of the values held
+
+        :param table: the name of the table
+        :param values: the values
+        :param address: the address of the first value
+        :return: None
+        """
 
-        for i in range(DISCRETE_INPUTS_OFFSET + 1, 10250):
-            json_temp["DiscreteInputs"][str(i)] = 0
+        if self.__wal is not None:
+            entries = self.__json[table]
 
-        with open(self.path, "w+") as file:
-            file.write(json.dumps(json_temp))
+            for i, value in enumerate(values):
+                self.__put(entries, address + i, value)
 
-    def reset_input_registers(self) -> None:
+            self.__wal.append([(TABLES.index(table), address + i, value) for i, value in enumerate(values)])
+
+            if self.__wal.size >= self.__compact_size:
+                self.__wake.set()
+
+            return
+
+        json_temp = self.__read_file()
+
+        for i, value in enumerate(values):
+            self.__put(json_temp[table], address + i, value)
+
+        self.__save(json.dumps(json_temp))
+
+    def __compact_loop(self) -> None:
         """
-        Function used to reset the input registers
+        Function used by the background thread to replace the log with a new snapshot when the log is too big
 
         :return: None
         """
 
-        with open(self.path, "r") as file:
-            json_temp = json.loads(file.read())
+        while True:
+            self.__wake.wait()
+            self.__wake.clear()
 
-        for i in range(INPUT_REGISTERS_OFFSET + 1, 30250):
-            json_temp["InputRegisters"][str(i)] = 0
+            try:
+                self.__compact()
+            except Exception:
+                LOGGER.exception("Error to compact the log %s", self.__wal.path)
 
-        with open(self.path, "w+") as file:
-            file.write(json.dumps(json_temp))
+    def __compact(self) -> None:
+        """
+        Function used to save the tables in a new snapshot and drop the log, a crash at any point leaves either the
+        old snapshot with the logs or the new snapshot
 
-    def reset_holding_registers(self) -> None:
+        :return: None
         """
-        Function used to reset the holding registers
 
+        # Only a copy of the tables and a new log under the locks, the fsyncs and the json run after
+        with self.__hold_all():
+            tables = {name: dict(self.__json[name]) for name in TABLES}
+            self.__wal.rotate()
+
+        self.__wal.seal()
+        snapshot = json.dumps(tables)
+
+        with open(self.path + ".tmp", "w+") as file:
+            file.write(snapshot)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(self.path + ".tmp", self.path)
+        self.__wal.retire()
+
+    def __reset(self, table: str) -> None:
+        """
+        Function used to set every value of a table to 0 at once, a single record in the log if there is one,
+        otherwise the file is rewritten once
+
+        :param table: the name of the table
         :return: None
         """
 
-        with open(self.path, "r") as file:
-            json_temp = json.loads(file.read())
+        with self.__stripes[table].hold_all():
+            if self.__wal is not None:
+                self.__json[table] = {}
+                self.__wal.append([(TABLES.index(table) | RESET, 0, 0)])
+                return
+
+            json_temp = self.__read_file()
+            json_temp[table] = {}
+
+            self.__save(json.dumps(json_temp))
+
+    def reset_coils(self) -> None:
+        """
+        Function used to reset the coils
+
+        :return: None
+        """
+
+        self.__reset("Coils")
 
-        for i in range(HOLDING_REGISTERS_OFFSET + 1, 40250):
-            json_temp["HoldingRegisters"][str(i)] = 0
+    def reset_discrete_inputs(self) -> None:
+        """
+        Function used to reset the discrete inputs
+
+        :return: None
+        """
+
+        self.__reset("DiscreteInputs")
+
+    def reset_input_registers(self) -> None:
+        """
+        Function used to reset the input registers
+
+        :return: None
+        """
+
+        self.__reset("InputRegisters")
+
+    def reset_holding_registers(self) -> None:
+        """
+        Function used to reset the holding registers
+
+        :return: None
+        """
 
-        with open(self.path, "w+") as file:
-            file.write(json.dumps(json_temp))
+        self.__reset("HoldingRegisters")
 
     def read_coil(self, address: int) -> int:
         """
@@ -108,10 +337,9 @@ class Json:
         :return: the value of the coil
         """
 
-        with open(self.path, "r") as file:
-            json_temp = json.loads(file.read())
+        json_temp = self.__read()
 
-        return json_temp["Coils"][str(address)]
+        return json_temp["Coils"].get(str(address), 0)
 
     def read_discrete_input(self, address: int) -> int:
         """
@@ -121,10 +349,9 @@ class Json:
         :return: the value of the discrete input
         """
 
-        with open(self.path, "r") as file:
-            json_temp = json.loads(file.read())
+        json_temp = self.__read()
 
-        return json_temp["DiscreteInputs"][str(address)]
+        return json_temp["DiscreteInputs"].get(str(address), 0)
 
     def read_holding_register(self, address: int) -> int:
         """
@@ -134,10 +361,9 @@ class Json:
         :return: the value of the holding register
         """
 
-        with open(self.path, "r") as file:
-            json_temp = json.loads(file.read())
+        json_temp = self.__read()
 
-        return json_temp["HoldingRegisters"][str(address)]
+        return json_temp["HoldingRegisters"].get(str(address), 0)
 
     def read_input_register(self, address: int) -> int:
         """
@@ -147,10 +373,53 @@ class Json:
         :return: the value of the input register
         """
 
-        with open(self.path, "r") as file:
-            json_temp = json.loads(file.read())
+        json_temp = self.__read()
+
+        return json_temp["InputRegisters"].get(str(address), 0)
+
+    def read_coils(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple coils
+
+        :param address: the address of the first coil
+        :param count: the number of coils
+        :return: the values of the coils
+        """
+
+        return self.__read_range("Coils", address, count)
+
+    def read_discrete_inputs(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple discrete inputs
+
+        :param address: the address of the first discrete input
+        :param count: the number of discrete inputs
+        :return: the values of the discrete inputs
+        """
+
+        return self.__read_range("DiscreteInputs", address, count)
+
+    def read_holding_registers(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple holding registers
+
+        :param address: the address of the first holding register
+        :param count: the number of holding registers
+        :return: the values of the holding registers
+        """
+
+        return self.__read_range("HoldingRegisters", address, count)
+
+    def read_input_registers(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple input registers
+
+        :param address: the address of the first input register
+        :param count: the number of input registers
+        :return: the values of the input registers
+        """
 
-        return json_temp["InputRegisters"][str(address)]
+        return self.__read_range("InputRegisters", address, count)
 
     def write_coil(self, value: int, address: int) -> None:
         """
@@ -161,13 +430,7 @@ class Json:
         :return: None
         """
 
-        with open(self.path, "r") as file:
-            json_temp = json.loads(file.read())
-
-        json_temp["Coils"][str(address)] = value
-
-        with open(self.path, "w+") as file:
-            file.write(json.dumps(json_temp))
+        self.__write("Coils", [value], address)
 
     def write_holding_register(self, value: int, address: int) -> None:
         """
@@ -178,10 +441,83 @@ class Json:
         :return: None
         """
 
-        with open(self.path, "r") as file:
-            json_temp = json.loads(file.read())
+        self.__write("HoldingRegisters", [value], address)
+
+    def write_coils(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple coils
+
+        :param values: values of the coils
+        :param address: the address of the first coil
+        :return: None
+        """
+
+        self.__write("Coils", values, address)
+
+    def write_holding_registers(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple holding registers
+
+        :param values: values of the holding registers
+        :param address: the address of the first holding register
+        :return: None
+        """
+
+        self.__write("HoldingRegisters", values, address)
+
+    def write_discrete_inputs(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple discrete inputs, for the ingest (not a modbus function)
+
+        :param values: values of the discrete inputs
+        :param address: the address of the first discrete input
+        :return: None
+        """
+
+        self.__write("DiscreteInputs", values, address)
+
+    def write_input_registers(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple input registers, for the ingest (not a modbus function)
+
+        :param values: values of the input registers
+        :param address: the address of the first input register
+        :return: None
+        """
+
+        self.__write("InputRegisters", values, address)
+
+    def mask_write_holding_register(self, and_mask: int, or_mask: int, address: int) -> None:
+        """
+        Function used to change some bits of a holding register at once, (value AND and_mask) OR (or_mask AND NOT
+        and_mask)
+
+        :param and_mask: the bits kept
+        :param or_mask: the bits set among the ones not kept
+        :param address: the address of the holding register
+        :return: None
+        """
+
+        with self.__stripes["HoldingRegisters"].hold((address, 1)):
+            value = self.__read()["HoldingRegisters"].get(str(address), 0)
+
+            self.__store("HoldingRegisters", [(value & and_mask) | (or_mask & ~and_mask & 0xFFFF)], address)
+
+    def write_read_holding_registers(self, values: list, write_address: int, read_address: int, count: int) -> list:
+        """
+        Function used to write multiple holding registers and then read multiple holding registers, nothing else is
+        written in between
+
+        :param values: values of the holding registers written
+        :param write_address: the address of the first holding register written
+        :param read_address: the address of the first holding register read
+        :param count: the number of holding registers read
+        :return: the values of the holding registers read
+        """
+
+        with self.__stripes["HoldingRegisters"].hold((write_address, len(values)), (read_address, count)):
+            self.__store("HoldingRegisters", values, write_address)
 
-        json_temp["HoldingRegisters"][str(address)] = value
+            holding_registers = self.__read()["HoldingRegisters"]
 
-        with open(self.path, "w+") as file:
-            file.write(json.dumps(json_temp))
+            return [holding_registers.get(str(i), 0) for i in range(read_address, read_address + count)]
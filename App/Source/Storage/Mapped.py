@@ -0,0 +1,49 @@
+import atexit
+import mmap
+import os
+import threading
+
+from Source.Storage.Registers import *
+
+
+class Mapped(Registers):
+    # Reads and writes are memory accesses, the operating system writes the pages to the file
+    BLOCKING = False
+
+    def __init__(self, path: str, create: bool):
+        self.path = path
+
+        if create or not os.path.exists(self.path):
+            self.generate_file()
+
+        # Nothing is read at startup, the pages are loaded when they are used
+        with open(self.path, "r+b") as file:
+            if os.fstat(file.fileno()).st_size != FILE_SIZE or file.read(len(HEADER)) != HEADER:
+                raise ValueError(f"{self.path} is not a register file")
+
+            self.__map = mmap.mmap(file.fileno(), FILE_SIZE)
+
+        super().__init__(self.__map, threading.Lock)
+
+        atexit.register(self.flush)
+
+    def generate_file(self) -> None:
+        """
+        Function used to create the register file, all values are 0
+
+        :return: None
+        """
+
+        # The file is sparse, the size doesn't matter until the values are written
+        with open(self.path, "w+b") as file:
+            file.write(HEADER)
+            file.truncate(FILE_SIZE)
+
+    def flush(self) -> None:
+        """
+        Function used to write the modified pages to the file
+
+        :return: None
+        """
+
+        self.__map.flush()
@@ -0,0 +1,45 @@
+import time
+
+from Source.Modbus.Metrics import Metrics
+
+
+class Measured:
+    def __init__(self, storage, metrics: Metrics):
+        """
+        A storage whose calls are timed, every other attribute is the one of the storage
+
+        :param storage: the storage
+        :param metrics: where the durations are counted, by method name
+        """
+
+        self.__storage = storage
+        self.__metrics = metrics
+        self.BLOCKING = storage.BLOCKING
+
+    def __getattr__(self, name: str):
+        """
+        Function used to get an attribute of the storage, a method is wrapped the first time and kept
+
+        :param name: the name of the attribute
+        :return: the attribute
+        """
+
+        attribute = getattr(self.__storage, name)
+
+        if not callable(attribute):
+            return attribute
+
+        operation = self.__metrics.operation
+
+        def measured(*args):
+            start = time.perf_counter()
+
+            try:
+                return attribute(*args)
+            finally:
+                operation(name, time.perf_counter() - start)
+
+        # The next lookups find it on the instance and don't get here
+        setattr(self, name, measured)
+
+        return measured
@@ -0,0 +1,514 @@
+import atexit
+import json
+import os
+import threading
+from contextlib import ExitStack
+from typing import Optional
+
+from Source.Config import *
+from Source.Log import LOGGER
+from Source.Storage.Stripes import Stripes
+from Source.Storage.Table import Table
+
+
+class Memory:
+    # Reads and writes never wait for the disk
+    BLOCKING = False
+
+    def __init__(self, path: str, create: bool, interval: float, threshold: int, page_size: int):
+        self.path = path
+        self.__interval = interval
+        self.__threshold = threshold
+
+        # Every table is indexed by the modbus address (storage address minus the offset)
+        self.__coils = Table("B", page_size)
+        self.__discrete_inputs = Table("B", page_size)
+        self.__input_registers = Table("H", page_size)
+        self.__holding_registers = Table("H", page_size)
+
+        # A block of the locks is a page, a range is written at once and the writes of different pages don't wait
+        # for each other
+        self.__coils_stripes = Stripes(LOCK_STRIPES, page_size)
+        self.__discrete_inputs_stripes = Stripes(LOCK_STRIPES, page_size)
+        self.__input_registers_stripes = Stripes(LOCK_STRIPES, page_size)
+        self.__holding_registers_stripes = Stripes(LOCK_STRIPES, page_size)
+
+        # Only for the number of values written since the last save, the saves run one at a time
+        self.__lock = threading.Lock()
+        self.__dirty = 0
+        self.__flush_lock = threading.Lock()
+        self.__wake = threading.Event()
+
+        if create or not os.path.exists(self.path):
+            self.__dirty = 1
+            self.flush()
+        else:
+            self.__load()
+
+        threading.Thread(target=self.__persist, daemon=True).start()
+        atexit.register(self.flush)
+
+    def __load(self) -> None:
+        """
+        Function used to load the tables from the json file
+
+        :return: None
+        """
+
+        with open(self.path, "r") as file:
+            json_temp = json.loads(file.read())
+
+        # Only the values that are not 0 allocate pages
+        for table, name, offset, _, _ in self.__tables():
+            for address, value in json_temp[name].items():
+                if value != 0 and 0 <= int(address) - offset <= 0xFFFF:
+                    table.write([value], int(address) - offset)
+
+    def __tables(self) -> tuple:
+        """
+        Function used to get every table with its name from the json file, its offset, its locks and its addresses
+
+        :return: tuples (table, name, offset, stripes, addresses)
+        """
+
+        return ((self.__coils, "Coils", COILS_OFFSET, self.__coils_stripes, COILS_ADDRESSES),
+                (self.__discrete_inputs, "DiscreteInputs", DISCRETE_INPUTS_OFFSET, self.__discrete_inputs_stripes,
+                 DISCRETE_INPUTS_ADDRESSES),
+                (self.__input_registers, "InputRegisters", INPUT_REGISTERS_OFFSET, self.__input_registers_stripes,
+                 INPUT_REGISTERS_ADDRESSES),
+                (self.__holding_registers, "HoldingRegisters", HOLDING_REGISTERS_OFFSET,
+                 self.__holding_registers_stripes, HOLDING_REGISTERS_ADDRESSES))
+
+    def __persist(self) -> None:
+        """
+        Function used by the background thread to save the tables every interval or when there are too many writes
+
+        :return: None
+        """
+
+        while True:
+            self.__wake.wait(self.__interval)
+            self.__wake.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                LOGGER.exception("Error to save the storage to %s", self.path)
+
+    def flush(self) -> None:
+        """
+        Function used to save the tables to the json file if they were modified, same format as the Json storage
+
+        :return: None
+        """
+
+        with self.__flush_lock:
+            with self.__lock:
+                dirty = self.__dirty
+
+            if dirty == 0:
+                return
+
+            # A write after the counter was read is saved now or by the next flush, every table is copied at once
+            snapshot = []
+
+            for table, name, offset, stripes, _ in self.__tables():
+                with stripes.hold_all():
+                    snapshot.append((table.pages(), name, offset))
+
+            # Only the allocated pages are saved, an address missing from the file is 0
+            json_temp = {}
+
+            for pages, name, offset in snapshot:
+                json_temp[name] = {}
+
+                for first, page in pages:
+                    for i, value in enumerate(page):
+                        json_temp[name][str(offset + first + i)] = value
+
+            # Write next to the file and replace it, a crash will never leave a half written file
+            with open(self.path + ".tmp", "w+") as file:
+                file.write(json.dumps(json_temp))
+
+            os.replace(self.path + ".tmp", self.path)
+
+            # Only the writes that were saved are cleared, if the save failed they are saved by the next flush
+            with self.__lock:
+                self.__dirty = self.__dirty - dirty
+
+    def image(self, marks: Optional[dict] = None) -> tuple:
+        """
+        Function used to get the values of every table at one point in time, the writes wait meanwhile
+
+        :param marks: the marks returned with a previous image, only the pages written since then are returned
+        :return: the marks of this image and the values, table name -> {address: value}
+        """
+
+        images = {}
+        new_marks = {}
+
+        with ExitStack() as stack:
+            for _, _, _, stripes, _ in self.__tables():
+                stack.enter_context(stripes.hold_all())
+
+            for table, name, offset, _, (first, last) in self.__tables():
+                size = table.page_size
+                images[name] = {}
+                new_marks[name] = {}
+
+                for index in range(first // size, last // size + 1):
+                    version = new_marks[name][index] = table.version(index * size, size)
+
+                    # The versions change with every write of the page and with a reset
+                    if marks is not None and marks[name].get(index) == version:
+                        continue
+
+                    start = max(first, index * size)
+                    values = table.read(start, min(last + 1, (index + 1) * size) - start)
+                    images[name].update(zip(range(offset + start, offset + start + len(values)), values))
+
+        return new_marks, images
+
+    def __modified(self, count: int) -> None:
+        """
+        Function used to mark the tables as modified
+
+        :param count: the number of values written
+        :return: None
+        """
+
+        with self.__lock:
+            self.__dirty = self.__dirty + count
+
+            if self.__dirty >= self.__threshold:
+                self.__wake.set()
+
+    def reset_coils(self) -> None:
+        """
+        Function used to reset the coils
+
+        :return: None
+        """
+
+        with self.__coils_stripes.hold_all():
+            self.__coils.reset()
+
+        self.__modified(1)
+
+    def reset_discrete_inputs(self) -> None:
+        """
+        Function used to reset the discrete inputs
+
+        :return: None
+        """
+
+        with self.__discrete_inputs_stripes.hold_all():
+            self.__discrete_inputs.reset()
+
+        self.__modified(1)
+
+    def reset_input_registers(self) -> None:
+        """
+        Function used to reset the input registers
+
+        :return: None
+        """
+
+        with self.__input_registers_stripes.hold_all():
+            self.__input_registers.reset()
+
+        self.__modified(1)
+
+    def reset_holding_registers(self) -> None:
+        """
+        Function used to reset the holding registers
+
+        :return: None
+        """
+
+        with self.__holding_registers_stripes.hold_all():
+            self.__holding_registers.reset()
+
+        self.__modified(1)
+
+    def read_coil(self, address: int) -> int:
+        """
+        Function used to read a coil
+
+        :param address: the address of the coil
+        :return: the value of the coil
+        """
+
+        return self.__coils.get(address - COILS_OFFSET)
+
+    def read_discrete_input(self, address: int) -> int:
+        """
+        Function used to read a discrete input
+
+        :param address: the address of the discrete input
+        :return: the value of the discrete input
+        """
+
+        return self.__discrete_inputs.get(address - DISCRETE_INPUTS_OFFSET)
+
+    def read_holding_register(self, address: int) -> int:
+        """
+        Function used to read a holding register
+
+        :param address: the address of the holding register
+        :return: the value of the holding register
+        """
+
+        return self.__holding_registers.get(address - HOLDING_REGISTERS_OFFSET)
+
+    def read_input_register(self, address: int) -> int:
+        """
+        Function used to read an input register
+
+        :param address: the address of the input register
+        :return: the value of the input register
+        """
+
+        return self.__input_registers.get(address - INPUT_REGISTERS_OFFSET)
+
+    def read_coils(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple coils
+
+        :param address: the address of the first coil
+        :param count: the number of coils
+        :return: the values of the coils
+        """
+
+        address = address - COILS_OFFSET
+
+        # Never half of a write
+        with self.__coils_stripes.hold((address, count)):
+            return self.__coils.read(address, count)
+
+    def read_discrete_inputs(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple discrete inputs
+
+        :param address: the address of the first discrete input
+        :param count: the number of discrete inputs
+        :return: the values of the discrete inputs
+        """
+
+        address = address - DISCRETE_INPUTS_OFFSET
+
+        # Never half of a write
+        with self.__discrete_inputs_stripes.hold((address, count)):
+            return self.__discrete_inputs.read(address, count)
+
+    def read_holding_registers(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple holding registers
+
+        :param address: the address of the first holding register
+        :param count: the number of holding registers
+        :return: the values of the holding registers
+        """
+
+        address = address - HOLDING_REGISTERS_OFFSET
+
+        # Never half of a write
+        with self.__holding_registers_stripes.hold((address, count)):
+            return self.__holding_registers.read(address, count)
+
+    def read_input_registers(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple input registers
+
+        :param address: the address of the first input register
+        :param count: the number of input registers
+        :return: the values of the input registers
+        """
+
+        address = address - INPUT_REGISTERS_OFFSET
+
+        # Never half of a write
+        with self.__input_registers_stripes.hold((address, count)):
+            return self.__input_registers.read(address, count)
+
+    def coils_version(self, address: int, count: int) -> tuple:
+        """
+        Function used to get the version of multiple coils, it changes after they are written
+
+        :param address: the address of the first coil
+        :param count: the number of coils
+        :return: the version
+        """
+
+        return self.__coils.version(address - COILS_OFFSET, count)
+
+    def discrete_inputs_version(self, address: int, count: int) -> tuple:
+        """
+        Function used to get the version of multiple discrete inputs, it changes after they are written
+
+        :param address: the address of the first discrete input
+        :param count: the number of discrete inputs
+        :return: the version
+        """
+
+        return self.__discrete_inputs.version(address - DISCRETE_INPUTS_OFFSET, count)
+
+    def holding_registers_version(self, address: int, count: int) -> tuple:
+        """
+        Function used to get the version of multiple holding registers, it changes after they are written
+
+        :param address: the address of the first holding register
+        :param count: the number of holding registers
+        :return: the version
+        """
+
+        return self.__holding_registers.version(address - HOLDING_REGISTERS_OFFSET, count)
+
+    def input_registers_version(self, address: int, count: int) -> tuple:
+        """
+        Function used to get the version of multiple input registers, it changes after they are written
+
+        :param address: the address of the first input register
+        :param count: the number of input registers
+        :return: the version
+        """
+
+        return self.__input_registers.version(address - INPUT_REGISTERS_OFFSET, count)
+
+    def write_coil(self, value: int, address: int) -> None:
+        """
+        Function used to write a coil
+
+        :param value: value of the coil
+        :param address: the address of the coil
+        :return: None
+        """
+
+        address = address - COILS_OFFSET
+
+        with self.__coils_stripes.hold((address, 1)):
+            self.__coils.write([value], address)
+
+        self.__modified(1)
+
+    def write_holding_register(self, value: int, address: int) -> None:
+        """
+        Function used to write a holding register
+
+        :param value: value of the holding register
+        :param address: the address of the holding register
+        :return: None
+        """
+
+        address = address - HOLDING_REGISTERS_OFFSET
+
+        with self.__holding_registers_stripes.hold((address, 1)):
+            self.__holding_registers.write([value], address)
+
+        self.__modified(1)
+
+    def write_coils(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple coils
+
+        :param values: values of the coils
+        :param address: the address of the first coil
+        :return: None
+        """
+
+        address = address - COILS_OFFSET
+
+        with self.__coils_stripes.hold((address, len(values))):
+            self.__coils.write(values, address)
+
+        self.__modified(len(values))
+
+    def write_holding_registers(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple holding registers
+
+        :param values: values of the holding registers
+        :param address: the address of the first holding register
+        :return: None
+        """
+
+        address = address - HOLDING_REGISTERS_OFFSET
+
+        with self.__holding_registers_stripes.hold((address, len(values))):
+            self.__holding_registers.write(values, address)
+
+        self.__modified(len(values))
+
+    def write_discrete_inputs(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple discrete inputs, for the ingest (not a modbus function)
+
+        :param values: values of the discrete inputs
+        :param address: the address of the first discrete input
+        :return: None
+        """
+
+        address = address - DISCRETE_INPUTS_OFFSET
+
+        with self.__discrete_inputs_stripes.hold((address, len(values))):
+            self.__discrete_inputs.write(values, address)
+
+        self.__modified(len(values))
+
+    def write_input_registers(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple input registers, for the ingest (not a modbus function)
+
+        :param values: values of the input registers
+        :param address: the address of the first input register
+        :return: None
+        """
+
+        address = address - INPUT_REGISTERS_OFFSET
+
+        with self.__input_registers_stripes.hold((address, len(values))):
+            self.__input_registers.write(values, address)
+
+        self.__modified(len(values))
+
+    def mask_write_holding_register(self, and_mask: int, or_mask: int, address: int) -> None:
+        """
+        Function used to change some bits of a holding register at once, (value AND and_mask) OR (or_mask AND NOT
+        and_mask)
+
+        :param and_mask: the bits kept
+        :param or_mask: the bits set among the ones not kept
+        :param address: the address of the holding register
+        :return: None
+        """
+
+        address = address - HOLDING_REGISTERS_OFFSET
+
+        with self.__holding_registers_stripes.hold((address, 1)):
+            value = self.__holding_registers.get(address)
+            self.__holding_registers.write([(value & and_mask) | (or_mask & ~and_mask & 0xFFFF)], address)
+
+        self.__modified(1)
+
+    def write_read_holding_registers(self, values: list, write_address: int, read_address: int, count: int) -> list:
+        """
+        Function used to write multiple holding registers and then read multiple holding registers, nothing else is
+        written in between
+
+        :param values: values of the holding registers written
+        :param write_address: the address of the first holding register written
+        :param read_address: the address of the first holding register read
+        :param count: the number of holding registers read
+        :return: the values of the holding registers read
+        """
+
+        write_address = write_address - HOLDING_REGISTERS_OFFSET
+        read_address = read_address - HOLDING_REGISTERS_OFFSET
+
+        with self.__holding_registers_stripes.hold((write_address, len(values)), (read_address, count)):
+            self.__holding_registers.write(values, write_address)
+            read = self.__holding_registers.read(read_address, count)
+
+        self.__modified(len(values))
+
+        return read
@@ -0,0 +1,104 @@
+import queue
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+
+class Pool:
+    def __init__(self, size: int, timeout: float, idle: float, connect: Callable, **config):
+        """
+        The connections to the database shared by the clients, every connection runs every statement on its own
+        (autocommit) unless a transaction is asked for
+
+        :param size: the number of connections
+        :param timeout: the most seconds a request waits for a free connection
+        :param idle: the seconds a connection is not used before it is checked (ping) when it is taken
+        :param connect: opens a connection, connect(**config)
+        :param config: the settings of the connections
+        """
+
+        self.__connect = connect
+        self.__config = dict(config, autocommit=True)
+        self.__timeout = timeout
+        self.__idle_time = idle
+
+        # (connection, the last time it was used), every slot starts empty (None) and the connection is opened the
+        # first time the slot is used
+        self.__idle = queue.LifoQueue(size)
+
+        for _ in range(size):
+            self.__idle.put((None, 0.0))
+
+    def __open(self, connection, used: float):
+        """
+        Function used to make sure a connection taken from the pool is usable, it is checked only if it was not used
+        for a while or its last request failed, reconnects or opens it if needed
+
+        :param connection: the connection from the pool or None
+        :param used: the last time the connection was used, 0 if its last request failed
+        :return: a connected connection
+        """
+
+        if connection is None:
+            return self.__connect(**self.__config)
+
+        if time.monotonic() - used < self.__idle_time:
+            return connection
+
+        try:
+            connection.ping(reconnect=True, attempts=3, delay=0)
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+            return self.__connect(**self.__config)
+
+        return connection
+
+    @contextmanager
+    def connection(self, transaction: bool = False):
+        """
+        Function used to check out a connection for one request, a single statement needs no transaction (one round
+        trip). In a transaction everything done with it is committed when the block ends and rolled back if it raises
+
+        :param transaction: True if the statements must be one transaction (a consistent read of more tables, a
+                            write then a read)
+        :return: the connection
+        """
+
+        try:
+            connection, used = self.__idle.get(timeout=self.__timeout)
+        except queue.Empty:
+            raise TimeoutError("No database connection available")
+
+        try:
+            connection = self.__open(connection, used)
+
+            if transaction:
+                connection.start_transaction()
+        except Exception:
+            self.__idle.put((None, 0.0))
+            raise
+
+        used = time.monotonic()
+
+        try:
+            yield connection
+
+            if transaction:
+                connection.commit()
+        except Exception:
+            # Checked the next time it is taken
+            used = 0.0
+
+            if transaction:
+                try:
+                    connection.rollback()
+                except Exception:
+                    # The connection is broken, the slot will open a new one
+                    connection = None
+            raise
+        finally:
+            self.__idle.put((connection, used))
@@ -0,0 +1,405 @@
+from contextlib import ExitStack
+from typing import Callable, Optional
+
+from Source.Config import *
+from Source.Storage.Stripes import Stripes
+from Source.Utils import *
+
+# Start of the file (or shared memory), the magic and the version of the layout
+HEADER = b"MODBUS\x00\x01"
+
+# Every table has the full address space, coils and discrete inputs are packed bits (8 in a byte, least
+# significant bit first) and the registers are big endian words
+ADDRESS_SPACE = 0x10000
+BITS_SIZE = ADDRESS_SPACE // 8
+REGISTERS_SIZE = ADDRESS_SPACE * 2
+
+COILS_START = len(HEADER)
+DISCRETE_INPUTS_START = COILS_START + BITS_SIZE
+INPUT_REGISTERS_START = DISCRETE_INPUTS_START + BITS_SIZE
+HOLDING_REGISTERS_START = INPUT_REGISTERS_START + REGISTERS_SIZE
+FILE_SIZE = HOLDING_REGISTERS_START + REGISTERS_SIZE
+
+
+class Registers:
+    def __init__(self, buffer, lock: Callable):
+        """
+        The tables laid out in a buffer, every table has the full address space and its own striped locks
+
+        :param buffer: a writable buffer of FILE_SIZE bytes (mmap, shared memory), the values are read and written
+                       in place
+        :param lock: creates a lock, threading.Lock or multiprocessing.Lock if the buffer is shared by processes
+        """
+
+        self.__map = buffer
+
+        # Writing bits changes the whole byte and a range must be written at once, only the blocks of the range are
+        # locked (the addresses are modbus addresses)
+        self.__coils_stripes = Stripes(LOCK_STRIPES, LOCK_STRIPE_SIZE, lock)
+        self.__discrete_inputs_stripes = Stripes(LOCK_STRIPES, LOCK_STRIPE_SIZE, lock)
+        self.__input_registers_stripes = Stripes(LOCK_STRIPES, LOCK_STRIPE_SIZE, lock)
+        self.__holding_registers_stripes = Stripes(LOCK_STRIPES, LOCK_STRIPE_SIZE, lock)
+
+    def __read_bits(self, start: int, stripes: Stripes, address: int, count: int) -> list:
+        """
+        Function used to read consecutive bits
+
+        :param start: where the table starts in the buffer
+        :param stripes: the locks of the table
+        :param address: the modbus address of the first bit
+        :param count: the number of bits
+        :return: the bits
+        """
+
+        first = start + address // 8
+        last = start + (address + count - 1) // 8
+
+        # A copy, a slice of a memoryview would still change after the lock is released
+        with stripes.hold((address, count)):
+            packed = bytes(self.__map[first:last + 1])
+
+        bits = unpack_bits(packed, (last - first + 1) * 8)
+        shift = address % 8
+
+        return bits[shift:shift + count]
+
+    def __write_bits(self, start: int, stripes: Stripes, values: list, address: int) -> None:
+        """
+        Function used to write consecutive bits, the bits around them in the first and last byte are kept
+
+        :param start: where the table starts in the buffer
+        :param stripes: the locks of the table
+        :param values: the bits
+        :param address: the modbus address of the first bit
+        :return: None
+        """
+
+        first = start + address // 8
+        last = start + (address + len(values) - 1) // 8
+        shift = address % 8
+
+        with stripes.hold((address, len(values))):
+            bits = unpack_bits(bytes(self.__map[first:last + 1]), (last - first + 1) * 8)
+            bits[shift:shift + len(values)] = values
+            self.__map[first:last + 1] = pack_bits(bits)
+
+    def __read_registers(self, start: int, stripes: Stripes, address: int, count: int) -> list:
+        """
+        Function used to read consecutive registers, never half of a write
+
+        :param start: where the table starts in the buffer
+        :param stripes: the locks of the table
+        :param address: the modbus address of the first register
+        :param count: the number of registers
+        :return: the registers
+        """
+
+        with stripes.hold((address, count)):
+            packed = bytes(self.__map[start + address * 2:start + (address + count) * 2])
+
+        return unpack_registers(packed, count)
+
+    def __write_registers(self, start: int, stripes: Stripes, values: list, address: int) -> None:
+        """
+        Function used to write consecutive registers
+
+        :param start: where the table starts in the buffer
+        :param stripes: the locks of the table
+        :param values: the registers
+        :param address: the modbus address of the first register
+        :return: None
+        """
+
+        packed = bytearray(len(values) * 2)
+        pack_registers_into(values, packed, 0)
+
+        with stripes.hold((address, len(values))):
+            self.__map[start + address * 2:start + (address + len(values)) * 2] = packed
+
+    def image(self, marks: Optional[dict] = None) -> tuple:
+        """
+        Function used to get the values of every table at one point in time, the writes wait meanwhile
+
+        :param marks: not used, there are no versions so every value is returned
+        :return: None (the marks) and the values, table name -> {address: value}
+        """
+
+        tables = (("Coils", COILS_START, self.__coils_stripes, COILS_OFFSET, COILS_ADDRESSES),
+                  ("DiscreteInputs", DISCRETE_INPUTS_START, self.__discrete_inputs_stripes, DISCRETE_INPUTS_OFFSET,
+                   DISCRETE_INPUTS_ADDRESSES),
+                  ("InputRegisters", INPUT_REGISTERS_START, self.__input_registers_stripes, INPUT_REGISTERS_OFFSET,
+                   INPUT_REGISTERS_ADDRESSES),
+                  ("HoldingRegisters", HOLDING_REGISTERS_START, self.__holding_registers_stripes,
+                   HOLDING_REGISTERS_OFFSET, HOLDING_REGISTERS_ADDRESSES))
+        copies = []
+
+        # Only the copies are made with the locks held, they are decoded after
+        with ExitStack() as stack:
+            for _, _, stripes, _, _ in tables:
+                stack.enter_context(stripes.hold_all())
+
+            for name, start, _, offset, (first, last) in tables:
+                if start < INPUT_REGISTERS_START:
+                    copies.append(bytes(self.__map[start + first // 8:start + last // 8 + 1]))
+                else:
+                    copies.append(bytes(self.__map[start + first * 2:start + (last + 1) * 2]))
+
+        images = {}
+
+        for (name, start, _, offset, (first, last)), packed in zip(tables, copies):
+            if start < INPUT_REGISTERS_START:
+                values = unpack_bits(packed, len(packed) * 8)[first % 8:first % 8 + last - first + 1]
+            else:
+                values = unpack_registers(packed, last - first + 1)
+
+            images[name] = dict(zip(range(offset + first, offset + last + 1), values))
+
+        return None, images
+
+    def reset_coils(self) -> None:
+        """
+        Function used to reset the coils
+
+        :return: None
+        """
+
+        with self.__coils_stripes.hold_all():
+            self.__map[COILS_START:COILS_START + BITS_SIZE] = bytes(BITS_SIZE)
+
+    def reset_discrete_inputs(self) -> None:
+        """
+        Function used to reset the discrete inputs
+
+        :return: None
+        """
+
+        with self.__discrete_inputs_stripes.hold_all():
+            self.__map[DISCRETE_INPUTS_START:DISCRETE_INPUTS_START + BITS_SIZE] = bytes(BITS_SIZE)
+
+    def reset_input_registers(self) -> None:
+        """
+        Function used to reset the input registers
+
+        :return: None
+        """
+
+        with self.__input_registers_stripes.hold_all():
+            self.__map[INPUT_REGISTERS_START:INPUT_REGISTERS_START + REGISTERS_SIZE] = bytes(REGISTERS_SIZE)
+
+    def reset_holding_registers(self) -> None:
+        """
+        Function used to reset the holding registers
+
+        :return: None
+        """
+
+        with self.__holding_registers_stripes.hold_all():
+            self.__map[HOLDING_REGISTERS_START:HOLDING_REGISTERS_START + REGISTERS_SIZE] = bytes(REGISTERS_SIZE)
+
+    def read_coil(self, address: int) -> int:
+        """
+        Function used to read a coil
+
+        :param address: the address of the coil
+        :return: the value of the coil
+        """
+
+        address = address - COILS_OFFSET
+
+        return (self.__map[COILS_START + address // 8] >> (address % 8)) & 1
+
+    def read_discrete_input(self, address: int) -> int:
+        """
+        Function used to read a discrete input
+
+        :param address: the address of the discrete input
+        :return: the value of the discrete input
+        """
+
+        address = address - DISCRETE_INPUTS_OFFSET
+
+        return (self.__map[DISCRETE_INPUTS_START + address // 8] >> (address % 8)) & 1
+
+    def read_holding_register(self, address: int) -> int:
+        """
+        Function used to read a holding register
+
+        :param address: the address of the holding register
+        :return: the value of the holding register
+        """
+
+        return self.__read_registers(HOLDING_REGISTERS_START, self.__holding_registers_stripes,
+                                     address - HOLDING_REGISTERS_OFFSET, 1)[0]
+
+    def read_input_register(self, address: int) -> int:
+        """
+        Function used to read an input register
+
+        :param address: the address of the input register
+        :return: the value of the input register
+        """
+
+        return self.__read_registers(INPUT_REGISTERS_START, self.__input_registers_stripes,
+                                     address - INPUT_REGISTERS_OFFSET, 1)[0]
+
+    def read_coils(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple coils
+
+        :param address: the address of the first coil
+        :param count: the number of coils
+        :return: the values of the coils
+        """
+
+        return self.__read_bits(COILS_START, self.__coils_stripes, address - COILS_OFFSET, count)
+
+    def read_discrete_inputs(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple discrete inputs
+
+        :param address: the address of the first discrete input
+        :param count: the number of discrete inputs
+        :return: the values of the discrete inputs
+        """
+
+        return self.__read_bits(DISCRETE_INPUTS_START, self.__discrete_inputs_stripes,
+                                address - DISCRETE_INPUTS_OFFSET, count)
+
+    def read_holding_registers(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple holding registers
+
+        :param address: the address of the first holding register
+        :param count: the number of holding registers
+        :return: the values of the holding registers
+        """
+
+        return self.__read_registers(HOLDING_REGISTERS_START, self.__holding_registers_stripes,
+                                     address - HOLDING_REGISTERS_OFFSET, count)
+
+    def read_input_registers(self, address: int, count: int) -> list:
+        """
+        Function used to read multiple input registers
+
+        :param address: the address of the first input register
+        :param count: the number of input registers
+        :return: the values of the input registers
+        """
+
+        return self.__read_registers(INPUT_REGISTERS_START, self.__input_registers_stripes,
+                                     address - INPUT_REGISTERS_OFFSET, count)
+
+    def write_coil(self, value: int, address: int) -> None:
+        """
+        Function used to write a coil
+
+        :param value: value of the coil
+        :param address: the address of the coil
+        :return: None
+        """
+
+        self.__write_bits(COILS_START, self.__coils_stripes, [value], address - COILS_OFFSET)
+
+    def write_holding_register(self, value: int, address: int) -> None:
+        """
+        Function used to write a holding register
+
+        :param value: value of the holding register
+        :param address: the address of the holding register
+        :return: None
+        """
+
+        self.__write_registers(HOLDING_REGISTERS_START, self.__holding_registers_stripes,
+                               [value], address - HOLDING_REGISTERS_OFFSET)
+
+    def write_coils(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple coils
+
+        :param values: values of the coils
+        :param address: the address of the first coil
+        :return: None
+        """
+
+        self.__write_bits(COILS_START, self.__coils_stripes, values, address - COILS_OFFSET)
+
+    def write_holding_registers(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple holding registers
+
+        :param values: values of the holding registers
+        :param address: the address of the first holding register
+        :return: None
+        """
+
+        self.__write_registers(HOLDING_REGISTERS_START, self.__holding_registers_stripes,
+                               values, address - HOLDING_REGISTERS_OFFSET)
+
+    def write_discrete_inputs(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple discrete inputs, for the ingest (not a modbus function)
+
+        :param values: values of the discrete inputs
+        :param address: the address of the first discrete input
+        :return: None
+        """
+
+        self.__write_bits(DISCRETE_INPUTS_START, self.__discrete_inputs_stripes, values,
+                          address - DISCRETE_INPUTS_OFFSET)
+
+    def write_input_registers(self, values: list, address: int) -> None:
+        """
+        Function used to write multiple input registers, for the ingest (not a modbus function)
+
+        :param values: values of the input registers
+        :param address: the address of the first input register
+        :return: None
+        """
+
+        self.__write_registers(INPUT_REGISTERS_START, self.__input_registers_stripes,
+                               values, address - INPUT_REGISTERS_OFFSET)
+
+    def mask_write_holding_register(self, and_mask: int, or_mask: int, address: int) -> None:
+        """
+        Function used to change some bits of a holding register at once, (value AND and_mask) OR (or_mask AND NOT
+        and_mask)
+
+        :param and_mask: the bits kept
+        :param or_mask: the bits set among the ones not kept
+        :param address: the address of the holding register
+        :return: None
+        """
+
+        address = address - HOLDING_REGISTERS_OFFSET
+        position = HOLDING_REGISTERS_START + address * 2
+
+        with self.__holding_registers_stripes.hold((address, 1)):
+            value = (self.__map[position] << 8) | self.__map[position + 1]
+            value = (value & and_mask) | (or_mask & ~and_mask & 0xFFFF)
+            self.__map[position:position + 2] = value.to_bytes(2, "big")
+
+    def write_read_holding_registers(self, values: list, write_address: int, read_address: int, count: int) -> list:
+        """
+        Function used to write multiple holding registers and then read multiple holding registers, nothing else is
+        written in between
+
+        :param values: values of the holding registers written
+        :param write_address: the address of the first holding register written
+        :param read_address: the address of the first holding register read
+        :param count: the number of holding registers read
+        :return: the values of the holding registers read
+        """
+
+        write_address = write_address - HOLDING_REGISTERS_OFFSET
+        read_address = read_address - HOLDING_REGISTERS_OFFSET
+        write_position = HOLDING_REGISTERS_START + write_address * 2
+        read_position = HOLDING_REGISTERS_START + read_address * 2
+
+        packed = bytearray(len(values) * 2)
+        pack_registers_into(values, packed, 0)
+
+        with self.__holding_registers_stripes.hold((write_address, len(values)), (read_address, count)):
+            self.__map[write_position:write_position + len(packed)] = packed
+            packed = bytes(self.__map[read_position:read_position + count * 2])
+
+        return unpack_registers(packed, count)
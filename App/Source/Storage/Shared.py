@@ -0,0 +1,70 @@
+import atexit
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+from Source.Storage.Registers import *
+
+
+class Shared(Registers):
+    # Reads and writes are memory accesses
+    BLOCKING = False
+
+    def __init__(self, path: str):
+        """
+        The tables in shared memory, the worker processes forked after it is created use the same tables. The
+        locks are process locks so a range is always written at once for every worker
+
+        :param path: the register file (same format as the mapped storage) loaded at startup and saved at exit,
+                     created if it doesn't exist
+        """
+
+        self.path = path
+        self.__memory = shared_memory.SharedMemory(create=True, size=FILE_SIZE)
+        self.__buffer = self.__memory.buf[:FILE_SIZE]
+
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as file:
+                data = file.read()
+
+            if len(data) != FILE_SIZE or data[0:len(HEADER)] != HEADER:
+                raise ValueError(f"{self.path} is not a register file")
+
+            self.__buffer[:] = data
+        else:
+            self.__buffer[0:len(HEADER)] = HEADER
+
+        super().__init__(self.__buffer, multiprocessing.Lock)
+
+        # Only the process that created the memory saves and removes it, the workers exit without touching it
+        self.__owner = os.getpid()
+        atexit.register(self.close)
+
+    def flush(self) -> None:
+        """
+        Function used to save the tables to the register file
+
+        :return: None
+        """
+
+        with open(self.path + ".tmp", "wb") as file:
+            file.write(self.__buffer)
+
+        os.replace(self.path + ".tmp", self.path)
+
+    def close(self) -> None:
+        """
+        Function used to save the tables and release the shared memory, only in the process that created it and
+        only once
+
+        :return: None
+        """
+
+        if os.getpid() != self.__owner:
+            return
+
+        self.__owner = None
+        self.flush()
+        self.__buffer.release()
+        self.__memory.close()
+        self.__memory.unlink()
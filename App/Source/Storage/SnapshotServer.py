@@ -0,0 +1,86 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class SnapshotServer:
+    def __init__(self, snapshots: dict, host: str, port: int):
+        """
+        The snapshots of the banks over http (json), on their own endpoint apart from the metrics because taking and
+        restoring one changes the server. The bank is picked with ?unit=N (none for the default one): GET /snapshots
+        lists them, POST /snapshots?label=x takes one, GET /snapshots/ID/diff?to=ID compares one with another or with
+        the values now and POST /snapshots/ID/restore writes one back
+
+        :param snapshots: unit identifier (None for the default bank) -> the snapshots of the bank
+        :param host: the address of the endpoint, there is no authentication so it should stay local
+        :param port: the port of the endpoint
+        """
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.snapshot("GET")
+
+            def do_POST(self):
+                self.snapshot("POST")
+
+            def snapshot(self, method: str):
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+                parts = url.path.strip("/").split("/")
+
+                try:
+                    unit = int(query["unit"][0]) if "unit" in query else None
+                    bank = snapshots.get(unit) if parts[0] == "snapshots" else None
+
+                    if bank is None:
+                        result = None
+                    elif method == "GET" and len(parts) == 1:
+                        result = bank.snapshots()
+                    elif method == "POST" and len(parts) == 1:
+                        result = {"id": bank.take(query.get("label", [""])[0])}
+                    elif method == "GET" and len(parts) == 3 and parts[2] == "diff":
+                        result = bank.diff(int(parts[1]), int(query["to"][0]) if "to" in query else None)
+                    elif method == "POST" and len(parts) == 3 and parts[2] == "restore":
+                        result = {"written": bank.restore(int(parts[1]))}
+                    else:
+                        result = None
+                except ValueError as error:
+                    self.send_error(400, str(error))
+                    return
+
+                if result is None:
+                    self.send_error(404)
+                    return
+
+                body = json.dumps(result).encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+
+    def serve(self) -> None:
+        """
+        Function used to serve the snapshots in a background thread
+
+        :return: None
+        """
+
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        """
+        Function used to stop serving the snapshots
+
+        :return: None
+        """
+
+        self.__server.shutdown()
+        self.__server.server_close()
@@ -0,0 +1,238 @@
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from Source.Log import LOGGER
+from Source.Utils import *
+
+# The method of the storage that writes every table, used by restore
+WRITERS = {
+    "Coils": "write_coils",
+    "DiscreteInputs": "write_discrete_inputs",
+    "InputRegisters": "write_input_registers",
+    "HoldingRegisters": "write_holding_registers",
+}
+
+
+class Snapshots:
+    def __init__(self, storage, path: str, full_every: int):
+        """
+        Images of every table of a bank taken while the server is running, saved in a directory. A snapshot saves
+        only the values changed since the previous one (a delta) and every full_every snapshots all of them, so a
+        snapshot is rebuilt from the last full one and at most full_every deltas. Deltas are only taken of a storage
+        with marks (the memory one), only the pages written since the previous snapshot are read. The other storages
+        read every value for a snapshot, so every snapshot of them is a full one
+
+        :param storage: the storage of the bank
+        :param path: the directory of the snapshots, created if it doesn't exist
+        :param full_every: the number of deltas between two full snapshots
+        """
+
+        self.path = path
+        self.__storage = storage
+        self.__full_every = max(1, full_every)
+        self.__lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+
+        # id -> the snapshot without its values (id, time, label, full, changes)
+        self.__index = {}
+
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".json"):
+                continue
+
+            try:
+                snapshot = self.__read(int(name[:-len(".json")]))
+            except (ValueError, KeyError, OSError) as error:
+                LOGGER.warning("[SNAPSHOT %s SKIPPED, %s]", name, error)
+                continue
+
+            del snapshot["tables"]
+            self.__index[snapshot["id"]] = snapshot
+
+        # The values of the last snapshot (the deltas are made against it) and the marks of the storage, the next
+        # snapshot is a full one if they can't be rebuilt
+        self.__current = None
+        self.__marks = None
+
+        if self.__index:
+            try:
+                self.__current = self.image(max(self.__index))
+            except (ValueError, OSError) as error:
+                LOGGER.warning("[SNAPSHOT %s SKIPPED, %s]", max(self.__index), error)
+
+    def __file(self, identifier: int) -> str:
+        """
+        Function used to get the file of a snapshot
+
+        :param identifier: the id of the snapshot
+        :return: the path of the file
+        """
+
+        return os.path.join(self.path, f"{identifier:06d}.json")
+
+    def __read(self, identifier: int) -> dict:
+        """
+        Function used to read a snapshot, the addresses of the tables are converted back to int
+
+        :param identifier: the id of the snapshot
+        :return: the snapshot
+        """
+
+        with open(self.__file(identifier), "r") as file:
+            snapshot = json.loads(file.read())
+
+        snapshot["tables"] = {name: {int(address): value for address, value in values.items()}
+                              for name, values in snapshot["tables"].items()}
+
+        return snapshot
+
+    def take(self, label: str = "") -> int:
+        """
+        Function used to take a snapshot of every table at one point in time, the server keeps serving meanwhile
+
+        :param label: a description of the snapshot
+        :return: the id of the snapshot
+        """
+
+        with self.__lock:
+            marks, image = self.__storage.image(self.__marks)
+            identifier = max(self.__index) + 1 if self.__index else 0
+
+            # The deltas since the last full snapshot, an id may be missing (a file removed)
+            deltas = 0
+
+            for previous in sorted(self.__index, reverse=True):
+                if self.__index[previous]["full"]:
+                    break
+
+                deltas = deltas + 1
+
+            # A storage without marks returns None, it has no delta
+            full = marks is None or self.__current is None or deltas >= self.__full_every
+
+            if self.__current is None:
+                self.__current = {name: {} for name in image}
+
+            tables = {}
+
+            for name, values in image.items():
+                current = self.__current.setdefault(name, {})
+                tables[name] = {address: value for address, value in values.items() if current.get(address) != value}
+                current.update(tables[name])
+
+            if full:
+                tables = self.__current
+
+            snapshot = {
+                "id": identifier,
+                "time": time.time(),
+                "label": label,
+                "full": full,
+                "changes": sum(len(values) for values in tables.values()),
+                "tables": tables,
+            }
+
+            # Written next to the file and replaced, a crash never leaves half of a snapshot
+            with open(self.__file(identifier) + ".tmp", "w+") as file:
+                file.write(json.dumps(snapshot))
+
+            os.replace(self.__file(identifier) + ".tmp", self.__file(identifier))
+
+            del snapshot["tables"]
+            self.__index[identifier] = snapshot
+            self.__marks = marks
+
+        LOGGER.info("[SNAPSHOT %s TAKEN, %s VALUES]", identifier, snapshot["changes"])
+
+        return identifier
+
+    def snapshots(self) -> list:
+        """
+        Function used to get the snapshots, without their values
+
+        :return: dictionaries (id, time, label, full, changes) ordered by id
+        """
+
+        return [dict(self.__index[identifier]) for identifier in sorted(self.__index)]
+
+    def image(self, identifier: int) -> dict:
+        """
+        Function used to get the values of every table in a snapshot, from the last full snapshot and the deltas
+        after it. The values of a delta that is missing (a file removed) are missing as well
+
+        :param identifier: the id of the snapshot
+        :return: table name -> {address: value}
+        """
+
+        if identifier not in self.__index:
+            raise ValueError(f"There is no snapshot {identifier}")
+
+        # The snapshots from the last full one, newest first
+        chain = []
+
+        for previous in sorted((i for i in self.__index if i <= identifier), reverse=True):
+            chain.append(previous)
+
+            if self.__index[previous]["full"]:
+                break
+        else:
+            raise ValueError(f"There is no full snapshot before the snapshot {identifier}")
+
+        tables = {}
+
+        for i in reversed(chain):
+            for name, values in self.__read(i)["tables"].items():
+                tables.setdefault(name, {}).update(values)
+
+        return tables
+
+    def diff(self, first: int, second: Optional[int] = None) -> dict:
+        """
+        Function used to get the values that are different in two snapshots
+
+        :param first: the id of the first snapshot
+        :param second: the id of the second snapshot, None for the values in the storage now
+        :return: table name -> {address: (value in the first, value in the second)}
+        """
+
+        old = self.image(first)
+        new = self.image(second) if second is not None else self.__storage.image()[1]
+        changes = {}
+
+        for name in old.keys() | new.keys():
+            values = old.get(name, {})
+            others = new.get(name, {})
+
+            changes[name] = {address: (values.get(address, 0), others.get(address, 0))
+                             for address in values.keys() | others.keys()
+                             if values.get(address, 0) != others.get(address, 0)}
+
+        return changes
+
+    def restore(self, identifier: int) -> int:
+        """
+        Function used to write back the values of a snapshot, only the values that are different now are written,
+        every run of consecutive addresses at once. A value written by a client while it runs may be kept
+
+        :param identifier: the id of the snapshot
+        :return: the number of values written
+        """
+
+        changes = self.diff(identifier)
+        written = 0
+
+        for name, values in changes.items():
+            write = getattr(self.__storage, WRITERS[name])
+
+            for address, count in runs(sorted(values)):
+                write([values[i][0] for i in range(address, address + count)], address)
+
+            written = written + len(values)
+
+        LOGGER.info("[SNAPSHOT %s RESTORED, %s VALUES]", identifier, written)
+
+        return written
@@ -0,0 +1,79 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+
+class Stripes:
+    def __init__(self, count: int, size: int, lock: Callable = threading.Lock):
+        """
+        The locks of a table, every block of size addresses is guarded by the lock (block % count), reads and writes
+        of different blocks don't wait for each other
+
+        :param count: the number of locks
+        :param size: the number of addresses in a block, rounded up to a multiple of 8 so two blocks never share
+                     a byte of bits
+        :param lock: creates a lock, threading.Lock or multiprocessing.Lock if the table is shared by processes
+        """
+
+        self.__locks = [lock() for _ in range(max(1, count))]
+        self.__size = (max(1, size) + 7) // 8 * 8
+
+    def __indexes(self, ranges: tuple) -> list:
+        """
+        Function used to get the locks of some ranges of addresses, sorted so they are always taken in the same order
+
+        :param ranges: tuples (the first address, the number of addresses)
+        :return: the indexes of the locks
+        """
+
+        count = len(self.__locks)
+        indexes = set()
+
+        for address, length in ranges:
+            first = address // self.__size
+            last = (address + max(length, 1) - 1) // self.__size
+
+            if last - first + 1 >= count:
+                return list(range(count))
+
+            indexes.update(block % count for block in range(first, last + 1))
+
+        return sorted(indexes)
+
+    @contextmanager
+    def hold(self, *ranges):
+        """
+        Function used to hold the locks of some ranges of addresses, a write of the ranges is seen whole by the
+        readers of the ranges
+
+        :param ranges: tuples (the first address, the number of addresses)
+        :return: None
+        """
+
+        locks = [self.__locks[i] for i in self.__indexes(ranges)]
+
+        for lock in locks:
+            lock.acquire()
+
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    @contextmanager
+    def hold_all(self):
+        """
+        Function used to hold every lock, for what changes the whole table (reset, snapshot)
+
+        :return: None
+        """
+
+        for lock in self.__locks:
+            lock.acquire()
+
+        try:
+            yield
+        finally:
+            for lock in reversed(self.__locks):
+                lock.release()
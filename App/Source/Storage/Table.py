@@ -0,0 +1,117 @@
+import array
+
+
+class Table:
+    def __init__(self, typecode: str, page_size: int):
+        """
+        Sparse table for the whole address space (0x0000 - 0xFFFF), the values are kept in fixed-size pages
+        allocated on the first write, an address that was never written is 0
+
+        :param typecode: the type of the values, "B" for bits, "H" for registers
+        :param page_size: the number of addresses in a page
+        """
+
+        self.__typecode = typecode
+        self.page_size = page_size
+        self.__pages = {}
+
+        # Bumped by every write to a page and by a reset, a read that saw the same versions saw the same values
+        self.__versions = {}
+        self.__generation = 0
+
+        # Every page that was never written reads from here
+        self.__zero = array.array(typecode, bytes(array.array(typecode).itemsize * page_size))
+
+    def get(self, address: int) -> int:
+        """
+        Function used to read a value
+
+        :param address: the modbus address
+        :return: the value
+        """
+
+        return self.__pages.get(address // self.page_size, self.__zero)[address % self.page_size]
+
+    def read(self, address: int, count: int) -> list:
+        """
+        Function used to read consecutive values, they can be in more than one page
+
+        :param address: the modbus address of the first value
+        :param count: the number of values
+        :return: the values
+        """
+
+        values = []
+
+        while count > 0:
+            index, start = divmod(address, self.page_size)
+            size = min(count, self.page_size - start)
+
+            values.extend(self.__pages.get(index, self.__zero)[start:start + size])
+
+            address = address + size
+            count = count - size
+
+        return values
+
+    def write(self, values: list, address: int) -> None:
+        """
+        Function used to write consecutive values, the pages are allocated if needed
+
+        :param values: the values
+        :param address: the modbus address of the first value
+        :return: None
+        """
+
+        position = 0
+
+        while position < len(values):
+            index, start = divmod(address + position, self.page_size)
+            size = min(len(values) - position, self.page_size - start)
+
+            page = self.__pages.get(index)
+
+            if page is None:
+                page = self.__pages[index] = array.array(self.__typecode, self.__zero)
+
+            page[start:start + size] = array.array(self.__typecode, values[position:position + size])
+            position = position + size
+
+            # After the values, a reader that got the old version may have the new values but never the opposite
+            self.__versions[index] = self.__versions.get(index, 0) + 1
+
+    def reset(self) -> None:
+        """
+        Function used to set every value to 0, the pages are released
+
+        :return: None
+        """
+
+        self.__pages = {}
+        self.__generation = self.__generation + 1
+
+    def version(self, address: int, count: int) -> tuple:
+        """
+        Function used to get the version of consecutive values, it changes when one of them can be different
+
+        :param address: the modbus address of the first value
+        :param count: the number of values
+        :return: the version
+        """
+
+        first = address // self.page_size
+        last = (address + count - 1) // self.page_size
+
+        if first == last:
+            return self.__generation, first, self.__versions.get(first, 0)
+
+        return (self.__generation, first) + tuple(self.__versions.get(i, 0) for i in range(first, last + 1))
+
+    def pages(self) -> list:
+        """
+        Function used to get a copy of the allocated pages
+
+        :return: tuples (the modbus address of the first value, the values)
+        """
+
+        return [(index * self.page_size, page[:]) for index, page in sorted(self.__pages.items())]
@@ -0,0 +1,54 @@
+import threading
+from typing import Callable
+
+
+class Units:
+    def __init__(self, default, factory: Callable, units: dict):
+        """
+        The register banks of the server, one for every unit identifier in units and a shared one for the others
+
+        :param default: the storage used by every unit identifier not in units
+        :param factory: creates the bank of a unit identifier, factory(backend, unit)
+        :param units: unit identifier -> backend, the banks are created on the first request
+        """
+
+        self.__default = default
+        self.__factory = factory
+        self.__units = units
+        self.__banks = {}
+        self.__lock = threading.Lock()
+
+        # Known before the banks exist, the asyncio mode needs it to know if the requests must run in the executor
+        self.BLOCKING = default.BLOCKING or len(units) > 0
+
+    def get(self, unit: int):
+        """
+        Function used to get the bank of a unit identifier, it is created the first time
+
+        :param unit: the unit identifier
+        :return: the storage (or gateway) of the unit identifier
+        """
+
+        bank = self.__banks.get(unit)
+
+        if bank is not None:
+            return bank
+
+        if unit not in self.__units:
+            return self.__default
+
+        with self.__lock:
+            # Another thread could have created it while waiting for the lock
+            if unit not in self.__banks:
+                self.__banks[unit] = self.__factory(self.__units[unit], unit)
+
+            return self.__banks[unit]
+
+    def banks(self) -> dict:
+        """
+        Function used to get the banks created so far, without the default one
+
+        :return: unit identifier -> storage
+        """
+
+        return dict(self.__banks)
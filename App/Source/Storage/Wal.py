@@ -0,0 +1,189 @@
+import os
+import struct
+import threading
+
+from Source.Log import LOGGER
+
+# A record of the log: table, address and value
+RECORD = struct.Struct(">BIH")
+
+# Added to the table of a record that sets every address of the table to 0, its address and value are not used
+RESET = 0x80
+
+
+class Wal:
+    def __init__(self, path: str, interval: float, count: int):
+        self.path = path
+        self.__interval = interval
+        self.__count = count
+
+        # The lock protects the file and the counters, the sync lock makes sure a file is not closed during fsync
+        self.__lock = threading.Lock()
+        self.__sync_lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__unsynced = 0
+
+        # The files of the logs rotated and not sealed yet
+        self.__rotated = []
+
+        self.size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.__file = open(self.path, "ab", buffering=0)
+
+        threading.Thread(target=self.__sync_loop, daemon=True).start()
+
+    def replay(self):
+        """
+        Function used to read the records written before the start, the rotated log first, an incomplete record at
+        the end (crash during a write) is ignored
+
+        :return: generator with tuples (table, address, value)
+        """
+
+        for path in (self.path + ".old", self.path):
+            if not os.path.exists(path):
+                continue
+
+            with open(path, "rb") as file:
+                data = file.read()
+
+            yield from RECORD.iter_unpack(data[0:len(data) - len(data) % RECORD.size])
+
+    def append(self, records: list) -> None:
+        """
+        Function used to add records at the end of the log, they reach the disk with the next fsync
+
+        :param records: tuples (table, address, value)
+        :return: None
+        """
+
+        data = b"".join([RECORD.pack(*record) for record in records])
+
+        with self.__lock:
+            self.__file.write(data)
+            self.size = self.size + len(data)
+            self.__unsynced = self.__unsynced + len(records)
+
+            if self.__unsynced >= self.__count:
+                self.__wake.set()
+
+    def __sync_loop(self) -> None:
+        """
+        Function used by the background thread to fsync the log every interval or when there are too many records
+
+        :return: None
+        """
+
+        while True:
+            self.__wake.wait(self.__interval)
+            self.__wake.clear()
+
+            try:
+                self.sync()
+            except Exception:
+                LOGGER.exception("Error to sync the log %s", self.path)
+
+    def sync(self) -> None:
+        """
+        Function used to make sure every record written reached the disk
+
+        :return: None
+        """
+
+        with self.__lock:
+            if self.__unsynced == 0:
+                return
+
+            self.__unsynced = 0
+            file = self.__file
+
+        with self.__sync_lock:
+            if not file.closed:
+                os.fsync(file.fileno())
+
+    def rotate(self) -> None:
+        """
+        Function used before a snapshot, the log is moved to .old (added to it if the last snapshot failed) and the
+        next records go to an empty log, the caller must make sure nothing is appended until the snapshot was taken.
+        Nothing waits for the disk, seal makes the rotated log durable
+
+        :return: None
+        """
+
+        with self.__lock:
+            self.__rotated.append(self.__file)
+
+            if os.path.exists(self.path + ".old"):
+                self.__append_old()
+            else:
+                os.replace(self.path, self.path + ".old")
+
+            self.__file = open(self.path, "ab", buffering=0)
+            self.size = 0
+
+    def seal(self) -> None:
+        """
+        Function used after rotate, without holding anything the writes wait for, the rotated log reaches the disk
+        and its file is closed
+
+        :return: None
+        """
+
+        with self.__lock:
+            rotated = self.__rotated
+            self.__rotated = []
+
+        with self.__sync_lock:
+            if os.path.exists(self.path + ".old"):
+                with open(self.path + ".old", "rb") as file:
+                    os.fsync(file.fileno())
+
+            for file in rotated:
+                file.close()
+
+    def __append_old(self) -> None:
+        """
+        Function used when the last snapshot failed after the rotation, the log is added at the end of the rotated
+        log so its records are kept. The records set values, so a crash meanwhile only replays some of them twice
+
+        :return: None
+        """
+
+        with open(self.path, "rb") as file:
+            data = file.read()
+
+        with open(self.path + ".old", "r+b") as file:
+            # An incomplete record at the end would shift every record after it
+            size = file.seek(0, os.SEEK_END)
+            file.truncate(size - size % RECORD.size)
+            file.seek(0, os.SEEK_END)
+            file.write(data[0:len(data) - len(data) % RECORD.size])
+
+            # Only after a failed snapshot, the log is removed once its records are on the disk
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.remove(self.path)
+
+    def retire(self) -> None:
+        """
+        Function used after the snapshot is on the disk, the rotated log is not needed anymore
+
+        :return: None
+        """
+
+        if os.path.exists(self.path + ".old"):
+            os.remove(self.path + ".old")
+
+    def clear(self) -> None:
+        """
+        Function used when the snapshot is created from scratch, every record is dropped
+
+        :return: None
+        """
+
+        with self.__lock:
+            self.__file.truncate(0)
+            self.size = 0
+            self.__unsynced = 0
+
+        self.retire()
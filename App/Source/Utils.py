@@ -1,3 +1,6 @@
+import struct
+
+
 def bytes_to_word(bytes_param: list) -> int:
     """
     Function used to merge to bytes into one, NOT ADDITION, [0x10, 0xA2] -> 0x10A2
@@ -22,26 +25,13 @@ def int_to_bytes(offset: int, number: int, dimension: int) -> bytes:
 
 def bits_to_bytes(bits_param):
     """
-    Function used to merge bits (0, 1) into bytes
+    Function used to merge bits (0, 1) into bytes, the length must be divisible by 8 (the extra bits are dropped)
 
     :param bits_param: self explanatory
     :return: self explanatory
     """
 
-    pairs = []
-    result = []
-    byte = 0
-
-    for _ in range(int(len(bits_param) / 8)):
-        pairs.append(bits_param[byte:byte + 8][::-1])
-        byte = byte + 8
-
-    for i in pairs:
-        map_temp = map(int, i)
-        n = int(''.join(map(str, map_temp)), 2)
-        result.append(int('{:02x}'.format(n), 16))
-
-    return bytes(result)
+    return pack_bits(bits_param[0:len(bits_param) - len(bits_param) % 8])
 
 
 def bytes_to_bits(register):
@@ -52,10 +42,88 @@ def bytes_to_bits(register):
     :return: self explanatory
     """
 
-    string = list("{0:b}".format(register).zfill(8))
-    list_temp = []
+    return list(BYTE_TO_BITS[register])
+
+
+# The 8 bits of every byte value, least significant bit first (modbus order), 0x05 -> 01 00 01 00 00 00 00 00
+BYTE_TO_BITS = tuple(bytes((byte >> i) & 1 for i in range(8)) for byte in range(256))
+
+# The byte value of every 8 bits, the reverse of BYTE_TO_BITS
+BITS_TO_BYTE = {bits: byte for byte, bits in enumerate(BYTE_TO_BITS)}
+
+# Big endian registers, compiled once for every quantity a request can have
+REGISTERS = tuple(struct.Struct(f">{count}H") for count in range(126))
+
+
+def pack_bits(bits_param) -> bytes:
+    """
+    Function used to pack bits (0, 1) into bytes in one pass, the last byte is filled with 0s
+
+    :param bits_param: the bits, first bit is the least significant bit of the first byte
+    :return: (len + 7) // 8 bytes
+    """
+
+    bits = bytes(bits_param) + bytes(-len(bits_param) % 8)
+
+    return bytes(map(BITS_TO_BYTE.__getitem__, [bits[i:i + 8] for i in range(0, len(bits), 8)]))
+
+
+def unpack_bits(bytes_param, count: int) -> list:
+    """
+    Function used to unpack bytes into bits (0, 1) in one pass
+
+    :param bytes_param: the bytes, first bit is the least significant bit of the first byte
+    :param count: the number of bits needed
+    :return: the bits
+    """
+
+    return list(b"".join(map(BYTE_TO_BITS.__getitem__, bytes_param))[0:count])
+
+
+def pack_registers_into(values: list, buffer, offset: int) -> int:
+    """
+    Function used to write registers as big endian words in a buffer
+
+    :param values: the registers
+    :param buffer: a writable buffer (bytearray)
+    :param offset: where the first register is written
+    :return: the number of bytes written
+    """
+
+    registers = REGISTERS[len(values)] if len(values) < len(REGISTERS) else struct.Struct(f">{len(values)}H")
+    registers.pack_into(buffer, offset, *values)
+
+    return registers.size
+
+
+def unpack_registers(bytes_param, count: int) -> list:
+    """
+    Function used to read big endian words from bytes
+
+    :param bytes_param: the bytes (bytes, bytearray, memoryview)
+    :param count: the number of registers
+    :return: the registers
+    """
+
+    registers = REGISTERS[count] if count < len(REGISTERS) else struct.Struct(f">{count}H")
+
+    return list(registers.unpack_from(bytes_param))
+
+
+def runs(addresses: list) -> list:
+    """
+    Function used to split sorted addresses into runs of consecutive addresses, [1, 2, 3, 7, 8] -> [(1, 3), (7, 2)]
+
+    :param addresses: the addresses, sorted and without duplicates
+    :return: tuples (the first address of the run, the number of addresses)
+    """
+
+    result = []
+    start = 0
 
-    for i in range(8):
-        list_temp.append(ord(string[i]) - ord('0'))
+    for i in range(1, len(addresses) + 1):
+        if i == len(addresses) or addresses[i] != addresses[i - 1] + 1:
+            result.append((addresses[start], i - start))
+            start = i
 
-    return list_temp[::-1]
+    return result